@@ -0,0 +1,92 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Content-addressed artifacts keyed by the SHA-256 of the uploaded file.
+
+Ingestion records each file's hash in ``processed/<file_id>/source.json``.
+Every pipeline stage then publishes its output files to
+``artifacts/by-hash/<sha256>/<stage>/`` and, before doing any work, checks
+whether the same content already went through that stage. A hit is a
+server-side S3 copy back into ``processed/<file_id>/`` plus the stage's
+stored summary (whatever its task would otherwise have returned). Stage
+names carry whatever their output depends on besides the file (pipeline
+output version, library version, jurisdiction), so a stale artifact is
+simply never looked up.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+import structlog
+from botocore.exceptions import ClientError
+from prometheus_client import Counter
+
+logger = structlog.get_logger()
+
+ARTIFACT_DEDUP = Counter(
+    'artifact_dedup_total',
+    'Content-addressed artifact lookups by pipeline stage and result',
+    ['stage', 'result']
+)
+
+BY_HASH_PREFIX = 'artifacts/by-hash'
+SOURCE_FILE = 'source.json'
+SUMMARY_FILE = 'summary.json'
+
+
+class ContentAddressedArtifacts:
+    """Reuse and publish per-file pipeline artifacts by content hash."""
+
+    def __init__(self, s3_client: Any, bucket_name: str):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+
+    @staticmethod
+    def stage_prefix(sha256: str, stage: str) -> str:
+        return f"{BY_HASH_PREFIX}/{sha256}/{stage}"
+
+    def record_source(self, file_id: str, sha256: str) -> None:
+        self._put_json(f"processed/{file_id}/{SOURCE_FILE}", {'sha256': sha256})
+
+    def source_hash(self, file_id: str) -> Optional[str]:
+        """SHA-256 recorded at ingestion, or None for files ingested before dedup existed."""
+        source = self._get_json(f"processed/{file_id}/{SOURCE_FILE}")
+        return source['sha256'] if source else None
+
+    def reuse(self, sha256: Optional[str], stage: str, file_id: str, files: List[str]) -> Optional[Dict[str, Any]]:
+        """Copy a stage's published ``files`` into ``processed/<file_id>/`` and return its summary; None on a miss."""
+        label = stage.split('@')[0]
+        # The summary is written last, so its presence means every file was published
+        summary = self._get_json(f"{self.stage_prefix(sha256, stage)}/{SUMMARY_FILE}") if sha256 else None
+        if summary is None:
+            ARTIFACT_DEDUP.labels(stage=label, result='miss').inc()
+            return None
+
+        for name in files:
+            self._copy(f"{self.stage_prefix(sha256, stage)}/{name}", f"processed/{file_id}/{name}")
+        ARTIFACT_DEDUP.labels(stage=label, result='hit').inc()
+        logger.info("Reused content-addressed artifacts", file_id=file_id, sha256=sha256, stage=stage)
+        return summary
+
+    def publish(self, sha256: Optional[str], stage: str, file_id: str, files: List[str],
+                summary: Dict[str, Any]) -> None:
+        """Make a stage's output available to later uploads of the same content."""
+        if sha256 is None:
+            return
+        for name in files:
+            self._copy(f"processed/{file_id}/{name}", f"{self.stage_prefix(sha256, stage)}/{name}")
+        self._put_json(f"{self.stage_prefix(sha256, stage)}/{SUMMARY_FILE}", summary)
+
+    def _copy(self, source_key: str, target_key: str) -> None:
+        self.s3_client.copy_object(
+            Bucket=self.bucket_name, Key=target_key, CopySource={'Bucket': self.bucket_name, 'Key': source_key}
+        )
+
+    def _get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError:
+            return None
+        return json.loads(response['Body'].read())
+
+    def _put_json(self, key: str, data: Dict[str, Any]) -> None:
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=json.dumps(data).encode('utf-8'))
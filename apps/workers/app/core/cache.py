@@ -0,0 +1,276 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Key-value caches shared by the workers.
+
+``DiskCacheBackend`` keeps entries in a local SQLite file with TTL expiry and
+LRU eviction by entry count and total size, so every worker process on a node
+shares it. The write count that schedules eviction lives in the same file, so
+it keeps counting across the short-lived backend objects workers create per
+task and across processes. ``RedisCacheBackend`` shares entries across nodes and relies on
+Redis TTLs and its ``maxmemory-policy`` for eviction. ``KeyValueCache`` fronts
+either backend with hit/miss accounting and a bypass switch. ``ProcessLRU``
+bounds the objects a worker process keeps loaded in memory between tasks.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+from prometheus_client import Counter
+
+logger = structlog.get_logger()
+
+CACHE_LOOKUPS = Counter(
+    'worker_cache_lookups_total',
+    'Worker cache lookups by cache name and result',
+    ['cache', 'result']
+)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'contract-intelligence', 'cache')
+
+
+class DiskCacheBackend:
+    """SQLite-backed cache with TTL expiry and least-recently-used eviction."""
+
+    # Eviction scans run once per this many writes to the file, by any backend object or process
+    evict_every = 64
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('writes', 0)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._connect()
+        row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+
+        with conn:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            # The write lock is held from the insert on, so every write sees its own count
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'writes'")
+            writes = conn.execute("SELECT value FROM counters WHERE name = 'writes'").fetchone()[0]
+
+        if writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones until under the caps."""
+        conn = self._connect()
+        removed = 0
+        with conn:
+            if self.ttl_seconds is not None:
+                removed += conn.execute(
+                    "DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+
+            if self.max_entries is not None:
+                removed += conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+
+            if self.max_bytes is not None:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    # Walk from the least recently used entry until enough bytes are freed
+                    excess, victims = total - self.max_bytes, []
+                    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+                        victims.append((key,))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+                    removed += len(victims)
+        return removed
+
+
+class RedisCacheBackend:
+    """Redis-backed cache shared across worker nodes."""
+
+    def __init__(self, url: str, namespace: str, ttl_seconds: Optional[float] = None):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f"cache:{namespace}:"
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(self.prefix + key, value, ex=int(self.ttl_seconds) if self.ttl_seconds else None)
+
+
+class ProcessLRU:
+    """In-memory map holding at most ``max_entries`` objects, dropping the least recently used."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class KeyValueCache:
+    """Cache front-end with hit/miss accounting and a bypass switch."""
+
+    def __init__(self, name: str, backend: Optional[Any], bypass: bool = False):
+        self.name = name
+        self.backend = backend
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None and not self.bypass
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            self.bypassed += 1
+            CACHE_LOOKUPS.labels(cache=self.name, result='bypass').inc()
+            return None
+
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Cache lookup failed", cache=self.name, error=str(e))
+            value = None
+
+        if value is None:
+            self.misses += 1
+            CACHE_LOOKUPS.labels(cache=self.name, result='miss').inc()
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.labels(cache=self.name, result='hit').inc()
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning("Cache write failed", cache=self.name, error=str(e))
+
+    def get_json(self, key: str) -> Optional[Any]:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any) -> None:
+        self.set(key, json.dumps(value).encode('utf-8'))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+def _env_number(name: str, cast=int) -> Optional[Any]:
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+def cache_from_env(name: str, prefix: str, default_backend: str = 'disk') -> KeyValueCache:
+    """Build a cache configured by ``{prefix}_CACHE_*`` environment variables.
+
+    ``{prefix}_CACHE_BACKEND`` is ``disk``, ``redis`` or ``none``; the disk
+    backend honours ``_DIR``, ``_MAX_ENTRIES`` and ``_MAX_BYTES``, both honour
+    ``_TTL_SECONDS``, and ``_BYPASS=true`` skips the cache entirely.
+    """
+    backend_kind = os.getenv(f'{prefix}_CACHE_BACKEND', default_backend).lower()
+    ttl_seconds = _env_number(f'{prefix}_CACHE_TTL_SECONDS', float)
+    bypass = os.getenv(f'{prefix}_CACHE_BYPASS', 'false').lower() in ('1', 'true', 'yes')
+
+    backend = None
+    if backend_kind == 'disk':
+        directory = os.getenv(f'{prefix}_CACHE_DIR', DEFAULT_CACHE_DIR)
+        backend = DiskCacheBackend(
+            os.path.join(directory, f'{name}.sqlite3'),
+            max_entries=_env_number(f'{prefix}_CACHE_MAX_ENTRIES'),
+            max_bytes=_env_number(f'{prefix}_CACHE_MAX_BYTES'),
+            ttl_seconds=ttl_seconds
+        )
+    elif backend_kind == 'redis':
+        redis_url = os.getenv(f'{prefix}_CACHE_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        backend = RedisCacheBackend(redis_url, name, ttl_seconds=ttl_seconds)
+    elif backend_kind != 'none':
+        raise ValueError(f"Unknown cache backend for {prefix}: {backend_kind}")
+
+    return KeyValueCache(name, backend, bypass=bypass)
+
+
+def llm_cache_key(provider: str, model: str, temperature: float, prompt: str) -> str:
+    """Content address of one LLM completion request."""
+    payload = json.dumps([provider, model, temperature, prompt], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
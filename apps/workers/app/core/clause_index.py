@@ -0,0 +1,288 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Candidate retrieval indexes over the library-clause embedding matrix.
+
+Every index returns the top-k clause rows per query vector, optionally
+restricted by clause ``category`` and ``jurisdiction``, and can be saved to
+and loaded from a local directory. ``ExactClauseIndex`` scans the whole
+matrix; ``IVFFlatClauseIndex`` clusters the clauses with spherical k-means
+and only scans the ``n_probe`` closest inverted lists. ``n_probe`` only
+affects search, so a loaded index takes the caller's value over the saved one.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.npy"
+
+# Below this many clauses an exhaustive scan is as fast as probing an IVF index
+IVF_MIN_CLAUSES = 5000
+
+
+class ClauseIndex(ABC):
+    """Top-k cosine retrieval over L2-normalized clause embeddings."""
+
+    kind = "base"
+
+    def __init__(self):
+        self.clause_ids: List[str] = []
+        self.categories = np.array([], dtype=object)
+        self.jurisdictions = np.array([], dtype=object)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.clause_ids)
+
+    def build(self, matrix: np.ndarray, clauses: List[Dict[str, Any]]) -> "ClauseIndex":
+        """Index ``matrix`` whose rows correspond to ``clauses``."""
+        self.clause_ids = [clause["id"] for clause in clauses]
+        self.categories = np.array([clause.get("category") for clause in clauses], dtype=object)
+        self.jurisdictions = np.array([clause.get("jurisdiction") for clause in clauses], dtype=object)
+        self.vectors = matrix
+        return self
+
+    @abstractmethod
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        category: Optional[str] = None,
+        jurisdictions: Optional[Sequence[str]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(rows, scores)`` of shape ``(len(queries), k)``, best first.
+
+        Rows are positions in the clause list the index was built from; slots
+        with no eligible clause are ``-1`` with a score of ``-inf``.
+        """
+
+    def _filter_mask(self, category: Optional[str], jurisdictions: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        mask = None
+        if category is not None:
+            mask = self.categories == category
+        if jurisdictions is not None:
+            jurisdiction_mask = np.isin(self.jurisdictions, list(jurisdictions))
+            mask = jurisdiction_mask if mask is None else mask & jurisdiction_mask
+        return mask
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k of a 1-D score vector, padded to length k."""
+        out_rows = np.full(k, -1, dtype=np.int64)
+        out_scores = np.full(k, -np.inf, dtype=np.float32)
+        if scores.size == 0:
+            return out_rows, out_scores
+
+        take = min(k, scores.size)
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+        out_rows[:take] = rows[top]
+        out_scores[:take] = scores[top]
+        return out_rows, out_scores
+
+    def save(self, path: str) -> None:
+        """Persist the index to a local directory."""
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / VECTORS_FILE, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        self._save_arrays(directory)
+
+        meta = {
+            "kind": self.kind,
+            "params": self._params(),
+            "clause_ids": self.clause_ids,
+            "categories": self.categories.tolist(),
+            "jurisdictions": self.jurisdictions.tolist(),
+        }
+        tmp_path = directory / f"{META_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, directory / META_FILE)
+
+    @classmethod
+    def load(cls, path: str, n_probe: Optional[int] = None) -> "ClauseIndex":
+        """Load an index saved with :meth:`save`, memory-mapping its arrays.
+
+        ``n_probe``, if given, replaces the saved value for indexes that probe.
+        """
+        directory = Path(path)
+        with open(directory / META_FILE, "r") as f:
+            meta = json.load(f)
+
+        params = meta["params"]
+        if n_probe is not None and "n_probe" in params:
+            params["n_probe"] = n_probe
+        index = INDEX_KINDS[meta["kind"]](**params)
+        index.clause_ids = meta["clause_ids"]
+        index.categories = np.array(meta["categories"], dtype=object)
+        index.jurisdictions = np.array(meta["jurisdictions"], dtype=object)
+        index.vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+        index._load_arrays(directory)
+        return index
+
+    def _params(self) -> Dict[str, Any]:
+        return {}
+
+    def _save_arrays(self, directory: Path) -> None:
+        pass
+
+    def _load_arrays(self, directory: Path) -> None:
+        pass
+
+
+class ExactClauseIndex(ClauseIndex):
+    """Exhaustive scan; the reference for recall measurements."""
+
+    kind = "exact"
+
+    # Queries scored per matrix multiply, bounding the temporary score matrix
+    query_chunk = 64
+
+    def search(self, queries, k, category=None, jurisdictions=None):
+        mask = self._filter_mask(category, jurisdictions)
+        eligible = np.arange(len(self), dtype=np.int64) if mask is None else np.flatnonzero(mask)
+        vectors = self.vectors if mask is None else self.vectors[eligible]
+
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for start in range(0, len(queries), self.query_chunk):
+            chunk_scores = queries[start:start + self.query_chunk] @ vectors.T
+            for offset, query_scores in enumerate(chunk_scores):
+                rows[start + offset], scores[start + offset] = self._top_k(query_scores, eligible, k)
+        return rows, scores
+
+
+class IVFFlatClauseIndex(ClauseIndex):
+    """Inverted-file index with uncompressed vectors, built in-process."""
+
+    kind = "ivf_flat"
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8, kmeans_iters: int = 10, seed: int = 0):
+        super().__init__()
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        # Clause row of each vector, with vectors stored contiguously per inverted list
+        self.list_rows = np.zeros(0, dtype=np.int64)
+
+    def build(self, matrix, clauses):
+        super().build(matrix, clauses)
+        n = len(clauses)
+        if not self.n_lists:
+            self.n_lists = int(np.clip(4 * np.sqrt(n), 1, max(n, 1)))
+        self.n_lists = min(self.n_lists, max(n, 1))
+
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.centroids = self._train_centroids(matrix)
+        assignments = self._assign(matrix)
+
+        self.list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.vectors = matrix[self.list_rows]
+
+        logger.info("Built IVF clause index", clauses=n, n_lists=self.n_lists, largest_list=int(counts.max(initial=0)))
+        return self
+
+    def _train_centroids(self, matrix: np.ndarray) -> np.ndarray:
+        """Spherical k-means: centroids are re-normalized means of their members."""
+        rng = np.random.default_rng(self.seed)
+        centroids = matrix[rng.choice(len(matrix), self.n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            assignments = self._assign(matrix, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, matrix)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+
+            # Re-seed empty lists from random vectors so no list stays dead
+            empty = norms[:, 0] == 0
+            if empty.any():
+                sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()))]
+                norms[empty] = np.linalg.norm(sums[empty], axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        return centroids.astype(np.float32)
+
+    def _assign(self, matrix: np.ndarray, centroids: Optional[np.ndarray] = None, chunk: int = 8192) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            assignments[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+        return assignments
+
+    def search(self, queries, k, category=None, jurisdictions=None):
+        mask = self._filter_mask(category, jurisdictions)
+        # Filter in list order so it lines up with the contiguous vector layout
+        list_mask = None if mask is None else mask[self.list_rows]
+        probe_order = np.argsort(-(queries @ self.centroids.T), axis=1)
+
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            n_probe = self.n_probe
+            while True:
+                positions = self._probe_positions(probe_order[i, :n_probe])
+                if list_mask is not None:
+                    positions = positions[list_mask[positions]]
+
+                # A restrictive filter can empty the probed lists; widen the probe until k are eligible
+                if len(positions) >= k or n_probe >= self.n_lists:
+                    break
+                n_probe = min(n_probe * 2, self.n_lists)
+
+            rows[i], scores[i] = self._top_k(self.vectors[positions] @ query, self.list_rows[positions], k)
+        return rows, scores
+
+    def _probe_positions(self, lists: np.ndarray) -> np.ndarray:
+        starts, ends = self.list_offsets[lists], self.list_offsets[lists + 1]
+        return np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(lists) else np.zeros(0, dtype=np.int64)
+
+    def _params(self):
+        return {"n_lists": self.n_lists, "n_probe": self.n_probe, "kmeans_iters": self.kmeans_iters, "seed": self.seed}
+
+    def _save_arrays(self, directory):
+        np.save(directory / "centroids.npy", self.centroids)
+        np.save(directory / "list_offsets.npy", self.list_offsets)
+        np.save(directory / "list_rows.npy", self.list_rows)
+
+    def _load_arrays(self, directory):
+        self.centroids = np.load(directory / "centroids.npy")
+        self.list_offsets = np.load(directory / "list_offsets.npy")
+        self.list_rows = np.load(directory / "list_rows.npy")
+
+
+INDEX_KINDS: Dict[str, Type[ClauseIndex]] = {
+    ExactClauseIndex.kind: ExactClauseIndex,
+    IVFFlatClauseIndex.kind: IVFFlatClauseIndex,
+}
+
+
+def build_clause_index(
+    kind: str,
+    matrix: np.ndarray,
+    clauses: List[Dict[str, Any]],
+    n_lists: Optional[int] = None,
+    n_probe: int = 8,
+) -> ClauseIndex:
+    """Build an index of ``kind``; ``auto`` picks IVF only for large libraries."""
+    if kind == "auto":
+        kind = IVFFlatClauseIndex.kind if len(clauses) >= IVF_MIN_CLAUSES else ExactClauseIndex.kind
+
+    if kind == ExactClauseIndex.kind:
+        return ExactClauseIndex().build(matrix, clauses)
+    if kind == IVFFlatClauseIndex.kind:
+        return IVFFlatClauseIndex(n_lists=n_lists, n_probe=n_probe).build(matrix, clauses)
+    raise ValueError(f"Unknown clause index kind: {kind}")
@@ -0,0 +1,145 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Precomputed rule-matching profiles for library clauses.
+
+``ClauseMatcherWorker.rule_based_matching`` scores one (section, clause)
+pair from scratch. ``ClauseTermProfiles`` computes each clause's key terms,
+mean sentence length and paragraph count once per library version, so the
+rule tier tokenizes a section once and scores it against all of its
+candidate clauses with array operations. Scores are identical to the
+per-pair implementation.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+LEGAL_PHRASES = [
+    'limitation of liability', 'damages', 'indemnification',
+    'termination', 'notice', 'breach', 'default',
+    'confidentiality', 'non-disclosure', 'intellectual property',
+    'governing law', 'jurisdiction', 'dispute resolution',
+    'force majeure', 'assignment', 'amendment'
+]
+
+KEY_TERM_STOPWORDS = {
+    'this', 'that', 'with', 'from', 'into', 'during', 'including', 'until',
+    'against', 'among', 'throughout', 'despite', 'towards', 'upon'
+}
+
+MAX_KEY_TERMS = 10
+
+TERM_WEIGHT = 0.4
+PHRASE_WEIGHT = 0.3
+STRUCTURAL_WEIGHT = 0.3
+
+_WORD_RE = re.compile(r'\b[A-Za-z]{4,}\b')
+_SENTENCE_RE = re.compile(r'[.!?]+')
+
+
+def extract_key_terms(text: str) -> List[str]:
+    """Up to ten most frequent lowercase words of four or more letters."""
+    word_freq: Dict[str, int] = {}
+    for word in _WORD_RE.findall(text):
+        word_lower = word.lower()
+        if word_lower not in KEY_TERM_STOPWORDS:
+            word_freq[word_lower] = word_freq.get(word_lower, 0) + 1
+
+    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    return [word for word, freq in sorted_words[:MAX_KEY_TERMS]]
+
+
+def mean_sentence_words(text: str) -> float:
+    """Mean words per sentence, NaN when the text has no sentences."""
+    lengths = [len(s.split()) for s in _SENTENCE_RE.split(text) if s.strip()]
+    return float(np.mean(lengths)) if lengths else float('nan')
+
+
+def paragraph_count(text: str) -> int:
+    return len(text.split('\n\n'))
+
+
+def structural_similarity(section_avg_len, section_paragraphs, clause_avg_len, clause_paragraphs):
+    """Sentence-length and paragraph-count similarity; works on scalars or aligned arrays."""
+    clause_avg_len = np.asarray(clause_avg_len, dtype=np.float64)
+    clause_paragraphs = np.asarray(clause_paragraphs, dtype=np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        length_similarity = 1 - np.abs(section_avg_len - clause_avg_len) / np.maximum(section_avg_len, clause_avg_len)
+    length_valid = (section_avg_len > 0) & (clause_avg_len > 0)
+    score = np.where(length_valid, length_similarity * 0.2, 0.0)
+
+    para_similarity = 1 - np.abs(section_paragraphs - clause_paragraphs) / np.maximum(section_paragraphs, clause_paragraphs)
+    return score + para_similarity * 0.1
+
+
+class SectionRuleFeatures:
+    """Everything the rule tier needs from one section, computed once."""
+
+    __slots__ = ('text_lower', 'phrases', 'avg_sentence_len', 'paragraphs')
+
+    def __init__(self, section_text: str):
+        self.text_lower = section_text.lower()
+        self.phrases = [phrase for phrase in LEGAL_PHRASES if phrase in self.text_lower]
+        self.avg_sentence_len = mean_sentence_words(section_text)
+        self.paragraphs = paragraph_count(section_text)
+
+    @property
+    def phrase_score(self) -> float:
+        return len(self.phrases) / len(LEGAL_PHRASES)
+
+
+class ClauseTermProfiles:
+    """Key-term, sentence-length and paragraph profiles for a clause library."""
+
+    def __init__(self, library_clauses: List[Dict[str, Any]]):
+        vocabulary: Dict[str, int] = {}
+        self.terms = np.full((len(library_clauses), MAX_KEY_TERMS), -1, dtype=np.int64)
+        self.term_counts = np.zeros(len(library_clauses), dtype=np.int64)
+        self.avg_sentence_len = np.zeros(len(library_clauses), dtype=np.float64)
+        self.paragraphs = np.zeros(len(library_clauses), dtype=np.int64)
+
+        for row, clause in enumerate(library_clauses):
+            key_terms = extract_key_terms(clause['text'])
+            self.terms[row, :len(key_terms)] = [vocabulary.setdefault(term, len(vocabulary)) for term in key_terms]
+            self.term_counts[row] = len(key_terms)
+            self.avg_sentence_len[row] = mean_sentence_words(clause['text'])
+            self.paragraphs[row] = paragraph_count(clause['text'])
+
+        self.vocabulary = list(vocabulary)
+
+    def score(self, section: SectionRuleFeatures, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Rule scores of one section against clause ``rows``.
+
+        Returns ``(total, term_score, structural_score)`` arrays aligned with ``rows``.
+        """
+        terms = self.terms[rows]
+        counts = self.term_counts[rows]
+
+        # Substring checks only for the distinct terms of these candidates
+        term_ids = np.unique(terms[terms >= 0])
+        present = np.zeros(len(self.vocabulary) + 1, dtype=bool)
+        present[term_ids] = [self.vocabulary[term_id] in section.text_lower for term_id in term_ids]
+        hits = np.where(terms >= 0, present[terms], False).sum(axis=1)
+
+        term_score = np.divide(hits, counts, out=np.zeros(len(rows), dtype=np.float64), where=counts > 0)
+        structural_score = structural_similarity(
+            section.avg_sentence_len, section.paragraphs, self.avg_sentence_len[rows], self.paragraphs[rows]
+        )
+
+        total = term_score * TERM_WEIGHT + section.phrase_score * PHRASE_WEIGHT + structural_score * STRUCTURAL_WEIGHT
+        return np.minimum(total, 1.0), term_score, structural_score
+
+    def reasoning(self, section: SectionRuleFeatures, row: int, term_score: float, structural_score: float) -> str:
+        """The per-pair scorer's reasoning string for one candidate."""
+        reasoning = []
+        key_terms = [self.vocabulary[term_id] for term_id in self.terms[row, :self.term_counts[row]]]
+        reasoning.extend(f"Key term '{term}' found" for term in key_terms if term in section.text_lower)
+        if key_terms:
+            reasoning.append(f"Term match score: {term_score:.2f}")
+
+        reasoning.extend(f"Legal phrase '{phrase}' found" for phrase in section.phrases)
+        reasoning.append(f"Legal phrase score: {section.phrase_score:.2f}")
+        reasoning.append(f"Structural pattern score: {structural_score:.2f}")
+        return '; '.join(reasoning)
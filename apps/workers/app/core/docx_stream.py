@@ -0,0 +1,166 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Streaming DOCX reader.
+
+Reads ``word/document.xml`` straight out of the zip with incremental XML
+parsing instead of building the python-docx object model, so an 800-page
+master agreement never exists in memory as a tree. Body-level paragraphs and
+table rows are yielded in document order and discarded as soon as they have
+been emitted.
+
+Style ids are resolved to names through ``word/styles.xml``, as python-docx
+does, so heading detection on the names behaves the same either way.
+Paragraph text follows python-docx's ``Paragraph.text``: runs, hyperlinks and
+inserted text, with tabs as ``\\t`` and line breaks as ``\\n``; page and
+column breaks add no text, and deleted text is left out. A cell's text is its
+paragraphs joined by newlines.
+
+Paragraphs where a page starts also carry ``page_breaks``, the offsets in
+their text at which a new page begins. Word records where each page began
+when it last laid the document out (``w:lastRenderedPageBreak``), and hard
+page breaks start a page wherever they are. Word also marks the top of the
+page that follows a hard break as rendered, so a rendered mark with no text
+since the last hard break is the same page turn and is not counted twice.
+Table rows carry ``page_turns``, the most pages any one of their cells
+moves on, since the cells of a row that splits across pages each continue
+on the next page.
+"""
+
+import zipfile
+from typing import Any, Dict, Iterator, List, Tuple
+from xml.etree.ElementTree import iterparse
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+BODY = f'{W_NS}body'
+PARAGRAPH = f'{W_NS}p'
+TABLE = f'{W_NS}tbl'
+ROW = f'{W_NS}tr'
+CELL = f'{W_NS}tc'
+TEXT = f'{W_NS}t'
+DELETED = f'{W_NS}del'
+BREAK = f'{W_NS}br'
+BREAKS = {BREAK: '\n', f'{W_NS}cr': '\n', f'{W_NS}tab': '\t'}
+BREAK_TYPE = f'{W_NS}type'
+RENDERED_PAGE_BREAK = f'{W_NS}lastRenderedPageBreak'
+PARAGRAPH_STYLE = f'{W_NS}pStyle'
+VAL = f'{W_NS}val'
+
+DEFAULT_STYLE_NAME = 'Normal'
+
+
+def read_style_names(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """Map paragraph style ids to style names; the default paragraph style is also stored under ``None``."""
+    names: Dict[Any, str] = {None: DEFAULT_STYLE_NAME}
+    if 'word/styles.xml' not in archive.namelist():
+        return names
+
+    with archive.open('word/styles.xml') as styles:
+        for _, elem in iterparse(styles):
+            if elem.tag != f'{W_NS}style' or elem.get(f'{W_NS}type') != 'paragraph':
+                continue
+            name = elem.find(f'{W_NS}name')
+            style_id = elem.get(f'{W_NS}styleId')
+            if name is not None and style_id:
+                names[style_id] = name.get(VAL)
+                if elem.get(f'{W_NS}default') in ('1', 'true'):
+                    names[None] = name.get(VAL)
+            elem.clear()
+    return names
+
+
+class PageBreakReader:
+    """Reads paragraph text and page starts in document order; keeps the hard break state between paragraphs."""
+
+    def __init__(self):
+        self._after_hard_break = False
+
+    def read(self, paragraph: Any) -> Tuple[str, List[int]]:
+        """Text of ``paragraph`` and the offsets in it where a new page starts."""
+        parts: List[str] = []
+        length = 0
+        page_breaks: List[int] = []
+        for elem in paragraph.iter():
+            if elem.tag == TEXT and elem.text:
+                parts.append(elem.text)
+                length += len(elem.text)
+                self._after_hard_break = False
+            elif elem.tag == BREAK and elem.get(BREAK_TYPE) in ('page', 'column'):
+                # Like python-docx, page and column breaks add no text
+                if elem.get(BREAK_TYPE) == 'page':
+                    page_breaks.append(length)
+                    self._after_hard_break = True
+            elif elem.tag in BREAKS:
+                parts.append(BREAKS[elem.tag])
+                length += 1
+            elif elem.tag == RENDERED_PAGE_BREAK:
+                if self._after_hard_break:
+                    self._after_hard_break = False
+                else:
+                    page_breaks.append(length)
+        return ''.join(parts), page_breaks
+
+
+def _strip_deleted(elem: Any) -> None:
+    for child in list(elem):
+        if child.tag == DELETED:
+            elem.remove(child)
+        else:
+            _strip_deleted(child)
+
+
+def iter_docx(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield ``{'kind': 'paragraph', 'text', 'style'}`` and ``{'kind': 'table_row', 'table', 'cells'}`` in order."""
+    with zipfile.ZipFile(file_path) as archive:
+        style_names = read_style_names(archive)
+
+        with archive.open('word/document.xml') as document:
+            body = None
+            depth = body_depth = 0
+            table_idx = -1
+            table_depth = 0
+            table = None
+            pages = PageBreakReader()
+
+            for event, elem in iterparse(document, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if elem.tag == BODY:
+                        body, body_depth = elem, depth
+                    elif elem.tag == TABLE:
+                        table_depth += 1
+                        if table_depth == 1:
+                            table, table_idx = elem, table_idx + 1
+                    continue
+
+                depth -= 1
+                if body is None:
+                    continue
+
+                if elem.tag == PARAGRAPH and depth == body_depth:
+                    _strip_deleted(elem)
+                    style = elem.find(f'{W_NS}pPr/{PARAGRAPH_STYLE}')
+                    style_id = style.get(VAL) if style is not None else None
+                    text, page_breaks = pages.read(elem)
+                    paragraph = {'kind': 'paragraph', 'text': text, 'style': style_names.get(style_id, style_names[None])}
+                    if page_breaks:
+                        paragraph['page_breaks'] = page_breaks
+                    yield paragraph
+                elif elem.tag == ROW and table_depth == 1:
+                    _strip_deleted(elem)
+                    cells: List[str] = []
+                    page_turns = 0
+                    for cell in elem.findall(CELL):
+                        read = [pages.read(p) for p in cell.iter(PARAGRAPH)]
+                        cells.append('\n'.join(text for text, _ in read))
+                        page_turns = max(page_turns, sum(len(page_breaks) for _, page_breaks in read))
+                    row = {'kind': 'table_row', 'table': table_idx, 'cells': cells}
+                    if page_turns:
+                        row['page_turns'] = page_turns
+                    yield row
+                    table.remove(elem)
+                elif elem.tag == TABLE:
+                    table_depth -= 1
+
+                # Body children are finished once their end tag is seen; drop them to keep memory flat
+                if depth == body_depth and elem.tag != BODY:
+                    body.clear()
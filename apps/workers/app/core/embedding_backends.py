@@ -0,0 +1,361 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Sentence embedding backends for clause matching.
+
+``torch`` runs the SentenceTransformer model as-is. ``onnx`` runs the same
+encoder through ONNX Runtime on CPU, exported once from the
+SentenceTransformer checkpoint and dynamically quantized to int8, with
+mean pooling done in NumPy. ``hash`` needs no model at all: it feature-hashes
+word unigrams and bigrams, which is only good enough for benchmarks and
+offline tests. All return float32 ``(n, dim)`` arrays; callers normalize.
+Select with ``EMBEDDING_BACKEND``.
+
+``encode_bucketed`` sits in front of either backend: it windows sections
+longer than the model's sequence length instead of letting them truncate,
+sorts inputs by token length and sizes each batch by a token budget, so
+one-line headings are not padded out to the length of an indemnity clause.
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from prometheus_client import Histogram
+
+from app.core.model_registry import registry
+
+logger = structlog.get_logger()
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # torch, onnx or hash
+EMBEDDING_ONNX_DIR = os.getenv(
+    'EMBEDDING_ONNX_DIR',
+    os.path.join(tempfile.gettempdir(), 'contract-intelligence', 'onnx')
+)
+EMBEDDING_ONNX_QUANTIZE = os.getenv('EMBEDDING_ONNX_QUANTIZE', 'true').lower() in ('1', 'true', 'yes')
+EMBEDDING_ONNX_THREADS = int(os.getenv('EMBEDDING_ONNX_THREADS', '0'))  # 0 lets ONNX Runtime decide
+# Upper bound on batch_size x longest sequence in the batch, i.e. padded tokens per forward pass
+EMBEDDING_TOKEN_BUDGET = int(os.getenv('EMBEDDING_TOKEN_BUDGET', '8192'))
+# Tokens shared by consecutive windows of a section longer than the model's sequence length
+EMBEDDING_WINDOW_STRIDE = int(os.getenv('EMBEDDING_WINDOW_STRIDE', '32'))
+
+PADDING_EFFICIENCY = Histogram(
+    'embedding_padding_efficiency',
+    'Share of encoded tokens that were real rather than padding, per encode call',
+    ['backend'],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+)
+
+FP32_MODEL_FILE = 'model.onnx'
+INT8_MODEL_FILE = 'model.int8.onnx'
+EXPORT_LOCK_FILE = 'export.lock'
+
+
+class SentenceTransformerBackend:
+    """PyTorch inference through sentence-transformers."""
+
+    name = 'torch'
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = registry.get(f'sentence-transformer:{model_name}')
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def key(self) -> str:
+        """Identity of the vectors this backend produces, for embedding stores and indexes."""
+        return self.model_name
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False),
+            dtype=np.float32
+        )
+
+
+class OnnxEmbeddingBackend:
+    """ONNX Runtime CPU inference, optionally int8-quantized, with mean pooling."""
+
+    name = 'onnx'
+
+    def __init__(self, model_name: str, model_dir: str, quantize: bool = True, intra_op_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        model_dir = Path(model_dir)
+        model_path = ensure_onnx_model(model_name, model_dir, quantize)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_seq_length = int((model_dir / 'max_seq_length').read_text())
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    @property
+    def key(self) -> str:
+        return f"{self.model_name}@onnx-{'int8' if self.quantize else 'fp32'}"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, matching the SentenceTransformer Pooling module
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+
+        return np.concatenate(batches)
+
+
+class _WhitespaceTokenizer:
+    """The slice of the Hugging Face tokenizer interface ``encode_bucketed`` uses, over whitespace tokens."""
+
+    def __call__(self, texts: List[str], add_special_tokens: bool = False,
+                 return_offsets_mapping: bool = True) -> Dict[str, Any]:
+        return {'offset_mapping': [[m.span() for m in re.finditer(r'\S+', text)] for text in texts]}
+
+    def num_special_tokens_to_add(self) -> int:
+        return 0
+
+
+class HashEmbeddingBackend:
+    """Feature-hashed bag of word unigrams and bigrams; deterministic and model-free."""
+
+    name = 'hash'
+
+    def __init__(self, dim: int = 384, max_seq_length: int = 256):
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        self.tokenizer = _WhitespaceTokenizer()
+
+    @property
+    def key(self) -> str:
+        return f"hash-{self.dim}"
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r'\w+', text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                col, sign = self._bucket(feature)
+                matrix[row, col] += sign
+        return matrix
+
+
+@dataclass
+class BatchingStats:
+    """Batch shape of one bucketed encode call."""
+    texts: int = 0
+    windows: int = 0
+    windowed_texts: int = 0
+    batches: int = 0
+    real_tokens: int = 0
+    padded_tokens: int = 0
+
+    @property
+    def padding_efficiency(self) -> float:
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    def add(self, other: 'BatchingStats') -> None:
+        for field, value in asdict(other).items():
+            setattr(self, field, getattr(self, field) + value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'padding_efficiency': self.padding_efficiency}
+
+
+def _windows(text: str, offsets: List[Tuple[int, int]], body_tokens: int, stride: int) -> List[Tuple[str, int]]:
+    """Split ``text`` into overlapping windows of at most ``body_tokens`` tokens."""
+    if len(offsets) <= body_tokens:
+        return [(text, len(offsets))]
+
+    windows = []
+    step = max(body_tokens - stride, 1)
+    for start in range(0, len(offsets), step):
+        window = offsets[start:start + body_tokens]
+        windows.append((text[window[0][0]:window[-1][1]], len(window)))
+        if start + body_tokens >= len(offsets):
+            break
+    return windows
+
+
+def encode_bucketed(backend: Any, texts: List[str], token_budget: int = EMBEDDING_TOKEN_BUDGET,
+                    window_stride: int = EMBEDDING_WINDOW_STRIDE) -> Tuple[np.ndarray, BatchingStats]:
+    """Encode ``texts`` in length-sorted, token-budgeted batches and return rows in input order.
+
+    Texts longer than the model's sequence length are split into overlapping
+    windows whose unit embeddings are averaged, weighted by token count.
+    """
+    stats = BatchingStats(texts=len(texts))
+    if not texts:
+        return np.zeros((0, backend.dim), dtype=np.float32), stats
+
+    special_tokens = backend.tokenizer.num_special_tokens_to_add()
+    body_tokens = backend.max_seq_length - special_tokens
+    offsets = backend.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+
+    owners, window_texts, lengths = [], [], []
+    for text_idx, (text, text_offsets) in enumerate(zip(texts, offsets)):
+        windows = _windows(text, text_offsets, body_tokens, window_stride)
+        if len(windows) > 1:
+            stats.windowed_texts += 1
+        for window_text, n_tokens in windows:
+            owners.append(text_idx)
+            window_texts.append(window_text)
+            lengths.append(n_tokens + special_tokens)
+    stats.windows = len(window_texts)
+
+    window_embeddings = np.zeros((len(window_texts), backend.dim), dtype=np.float32)
+    order = sorted(range(len(window_texts)), key=lambda i: lengths[i])
+
+    # Inputs arrive shortest first, so the newest item always sets the batch's padded length
+    batch: List[int] = []
+    for position, window_idx in enumerate(order):
+        batch.append(window_idx)
+        next_idx = order[position + 1] if position + 1 < len(order) else None
+        if next_idx is not None and (len(batch) + 1) * lengths[next_idx] <= token_budget:
+            continue
+
+        embeddings = backend.encode([window_texts[i] for i in batch], batch_size=len(batch))
+        window_embeddings[batch] = embeddings
+        stats.batches += 1
+        stats.real_tokens += sum(lengths[i] for i in batch)
+        stats.padded_tokens += len(batch) * lengths[batch[-1]]
+        batch = []
+
+    norms = np.linalg.norm(window_embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    weighted = window_embeddings / norms * np.asarray(lengths, dtype=np.float32)[:, None]
+    combined = np.zeros((len(texts), backend.dim), dtype=np.float32)
+    np.add.at(combined, np.asarray(owners), weighted)
+
+    PADDING_EFFICIENCY.labels(backend=backend.name).observe(stats.padding_efficiency)
+    return combined, stats
+
+
+def ensure_onnx_model(model_name: str, model_dir: Path, quantize: bool) -> Path:
+    """Export ``model_name`` to ONNX (and quantize it) unless a previous run already did."""
+    fp32_path = model_dir / FP32_MODEL_FILE
+    int8_path = model_dir / INT8_MODEL_FILE
+    model_path = int8_path if quantize else fp32_path
+    if model_path.exists():
+        return model_path
+
+    with _export_locked(model_dir):
+        # Another worker process may have finished the export while we waited for the lock
+        if not fp32_path.exists():
+            export_onnx_model(model_name, model_dir)
+
+        if quantize and not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            tmp_path = model_dir / f'{INT8_MODEL_FILE}.tmp'
+            quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+            logger.info("Quantized ONNX embedding model", model=model_name, path=str(int8_path))
+
+    return model_path
+
+
+@contextmanager
+def _export_locked(model_dir: Path) -> Iterator[None]:
+    """Hold the export lock of ``model_dir``, so one process writes its ``.tmp`` files at a time."""
+    model_dir.mkdir(parents=True, exist_ok=True)
+    with open(model_dir / EXPORT_LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def export_onnx_model(model_name: str, model_dir: Path) -> None:
+    """Export the transformer of a SentenceTransformer checkpoint plus its tokenizer to ``model_dir``.
+
+    Callers hold ``_export_locked(model_dir)``; ``ensure_onnx_model`` does.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    dummy = tokenizer(['export sample'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    tmp_path = model_dir / f'{FP32_MODEL_FILE}.tmp'
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            str(tmp_path),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    tokenizer.save_pretrained(str(model_dir))
+    (model_dir / 'max_seq_length').write_text(str(st_model.max_seq_length))
+    os.replace(tmp_path, model_dir / FP32_MODEL_FILE)
+    logger.info("Exported ONNX embedding model", model=model_name, path=str(model_dir))
+
+
+def load_onnx_backend(model_name: str) -> OnnxEmbeddingBackend:
+    """Registry loader for ``embedding-onnx:<model>`` using the EMBEDDING_ONNX_* settings."""
+    return OnnxEmbeddingBackend(
+        model_name,
+        os.path.join(EMBEDDING_ONNX_DIR, model_name.replace('/', '_')),
+        quantize=EMBEDDING_ONNX_QUANTIZE,
+        intra_op_threads=EMBEDDING_ONNX_THREADS
+    )
+
+
+def get_embedding_backend(model_name: str, backend: Optional[str] = None) -> Any:
+    """Embedding backend selected by ``backend`` or ``EMBEDDING_BACKEND``, shared per process."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == 'onnx':
+        return registry.get(f'embedding-onnx:{model_name}')
+    if backend == 'torch':
+        return SentenceTransformerBackend(model_name)
+    if backend == 'hash':
+        return HashEmbeddingBackend()
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,219 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Persistent library-clause embedding store.
+
+Embeddings live in a float32 ``.npy`` matrix that every worker process maps
+read-only, next to a JSON sidecar index mapping clause id to its row and the
+content hash it was computed from. Updates encode only new or edited clauses,
+write a new matrix generation and atomically swap the index, so readers never
+observe a half-written matrix. A sync of the whole library also drops clauses
+that were removed from it, so the matrix does not only ever grow.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+
+
+def content_hash(text: str) -> str:
+    """Hash of the clause text an embedding was computed from."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def library_version(model_name: str, clauses: List[Dict[str, Any]]) -> str:
+    """Digest identifying a clause library's contents as embedded by ``model_name``."""
+    return _version_digest(model_name, {clause["id"]: content_hash(clause["text"]) for clause in clauses})
+
+
+def _version_digest(model_name: str, hashes: Dict[str, Optional[str]]) -> str:
+    version = hashlib.sha256(model_name.encode("utf-8"))
+    for clause_id in sorted(hashes):
+        version.update(f"{clause_id}:{hashes[clause_id]}".encode("utf-8"))
+    return version.hexdigest()
+
+
+class ClauseEmbeddingStore:
+    """Memory-mapped, incrementally updated clause embeddings for one model."""
+
+    def __init__(self, root_dir: str, model_name: str):
+        self.model_name = model_name
+        self.root = Path(root_dir) / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._index: Dict[str, Any] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._generation = -1
+        self._index_stat: Optional[Tuple[int, int, int]] = None
+        # Content hash per clause id, reused while the clause text is unchanged
+        self._hashes: Dict[str, Tuple[str, str]] = {}
+        self.refresh()
+
+    @property
+    def library_version(self) -> Optional[str]:
+        """Digest of every (clause id, content hash) pair in the store."""
+        return self._index.get("library_version")
+
+    @property
+    def matrix(self) -> Optional[np.ndarray]:
+        """Read-only view of the full embedding matrix."""
+        return self._matrix
+
+    def refresh(self) -> None:
+        """Re-map the matrix if another process published a newer generation."""
+        index_path = self.root / INDEX_FILE
+        try:
+            stat = index_path.stat()
+        except FileNotFoundError:
+            return
+
+        # Every publish swaps in a new index file, so an unchanged inode, mtime and size need no parse
+        index_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if index_stat == self._index_stat:
+            return
+
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        self._index_stat = index_stat
+
+        if index["generation"] == self._generation:
+            return
+
+        self._index = index
+        self._generation = index["generation"]
+        self._matrix = np.load(self.root / index["matrix_file"], mmap_mode="r")
+
+    def stale_clauses(self, clauses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Clauses that are missing from the store or whose text changed."""
+        entries = self._index.get("clauses", {})
+        return [
+            clause for clause in clauses
+            if entries.get(clause["id"], [None, None])[1] != self._content_hash(clause)
+        ]
+
+    def removed_clauses(self, clauses: List[Dict[str, Any]]) -> Set[str]:
+        """Ids in the store that are not among ``clauses``."""
+        return set(self._index.get("clauses", {})) - {clause["id"] for clause in clauses}
+
+    def _content_hash(self, clause: Dict[str, Any]) -> str:
+        cached = self._hashes.get(clause["id"])
+        if cached is not None and cached[0] == clause["text"]:
+            return cached[1]
+        digest = content_hash(clause["text"])
+        self._hashes[clause["id"]] = (clause["text"], digest)
+        return digest
+
+    def rows_for(self, clause_ids: List[str]) -> np.ndarray:
+        """Embeddings for the given clause ids, in order."""
+        entries = self._index["clauses"]
+        rows = [entries[clause_id][0] for clause_id in clause_ids]
+
+        # Hand back the mapped matrix itself when the caller wants the whole library in row order
+        if rows == list(range(self._matrix.shape[0])):
+            return self._matrix
+        return self._matrix[rows]
+
+    def sync(self, clauses: List[Dict[str, Any]], encode: Callable[[List[str]], np.ndarray],
+             prune: bool = False) -> np.ndarray:
+        """Bring the store up to date for ``clauses`` and return their embeddings in order.
+
+        ``encode`` is only called for clauses that are new or whose text changed.
+        With ``prune``, ``clauses`` is the whole library and any other clause
+        in the store is dropped.
+        """
+        self.refresh()
+        if self.stale_clauses(clauses) or (prune and self.removed_clauses(clauses)):
+            with self._locked():
+                # Another worker may have published the same update while we waited for the lock
+                self.refresh()
+                stale = self.stale_clauses(clauses)
+                removed = self.removed_clauses(clauses) if prune else set()
+                if stale or removed:
+                    self._publish(stale, encode([clause["text"] for clause in stale]), removed)
+
+        return self.rows_for([clause["id"] for clause in clauses])
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.root / LOCK_FILE, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _publish(self, stale: List[Dict[str, Any]], embeddings: np.ndarray, removed: Set[str]) -> None:
+        """Write a new matrix generation containing ``stale`` but not ``removed`` and swap the index to it."""
+        entries = {clause_id: entry for clause_id, entry in self._index.get("clauses", {}).items()
+                   if clause_id not in removed}
+        # Surviving rows keep their order and close up the gaps left by removed clauses
+        kept_rows = sorted(entry[0] for entry in entries.values())
+        new_rows = {row: new_row for new_row, row in enumerate(kept_rows)}
+        entries = {clause_id: [new_rows[entry[0]], entry[1]] for clause_id, entry in entries.items()}
+        old_rows = len(kept_rows)
+        new_ids = [clause["id"] for clause in stale if clause["id"] not in entries]
+        dim = embeddings.shape[1] if len(stale) else self._matrix.shape[1]
+
+        if self._matrix is not None and self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension changed from {self._matrix.shape[1]} to {dim} for {self.model_name}")
+
+        generation = self._generation + 1
+        matrix_file = f"embeddings-{generation}.npy"
+        matrix = np.lib.format.open_memmap(
+            self.root / matrix_file, mode="w+", dtype=np.float32, shape=(old_rows + len(new_ids), dim)
+        )
+        if old_rows:
+            matrix[:old_rows] = self._matrix if old_rows == self._matrix.shape[0] else self._matrix[kept_rows]
+
+        for clause_id in new_ids:
+            entries[clause_id] = [old_rows, None]
+            old_rows += 1
+
+        for clause, embedding in zip(stale, embeddings):
+            row = entries[clause["id"]][0]
+            matrix[row] = embedding
+            entries[clause["id"]] = [row, content_hash(clause["text"])]
+
+        matrix.flush()
+        del matrix
+
+        for clause_id in removed:
+            self._hashes.pop(clause_id, None)
+
+        index = {
+            "model_name": self.model_name,
+            "dim": dim,
+            "generation": generation,
+            "matrix_file": matrix_file,
+            "library_version": _version_digest(self.model_name, {clause_id: entry[1] for clause_id, entry in entries.items()}),
+            "clauses": entries,
+        }
+        tmp_path = self.root / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.root / INDEX_FILE)
+
+        # Keep the previous generation for readers that mapped it before the swap
+        stale_generation = self.root / f"embeddings-{generation - 2}.npy"
+        if stale_generation.exists():
+            stale_generation.unlink()
+
+        logger.info("Published clause embedding generation",
+                    model_name=self.model_name,
+                    generation=generation,
+                    encoded=len(stale),
+                    removed=len(removed),
+                    total=len(entries))
+
+        self.refresh()
@@ -0,0 +1,289 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Asynchronous LLM executor.
+
+Workers hand the executor a batch of prompts instead of calling a provider
+SDK once per prompt. Requests run concurrently on one asyncio event loop over
+a shared ``httpx.AsyncClient``, bounded by a concurrency limit and by each
+provider's requests-per-minute and tokens-per-minute budgets. The budgets
+belong to the worker process, not to one batch, so back-to-back batches and
+tasks draw on the same allowance. Retryable
+failures (timeouts, 429 and 5xx) back off exponentially with full jitter,
+honouring ``Retry-After``; a provider that keeps failing falls back to the
+next one in order, e.g. OpenAI → Anthropic.
+
+    executor = executor_from_env(openai_model='gpt-4', anthropic_model='claude-3-sonnet-20240229')
+    results = executor.run_all(prompts)  # LLMResult or the exception, in prompt order
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+import structlog
+from prometheus_client import Counter
+
+logger = structlog.get_logger()
+
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '16'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_BACKOFF_BASE_SECONDS', '0.5'))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '30'))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+
+LLM_REQUESTS = Counter(
+    'llm_requests_total',
+    'LLM HTTP requests by provider and outcome',
+    ['provider', 'outcome']
+)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class LLMProviderError(Exception):
+    """A provider request failed; ``retryable`` says whether trying again may help."""
+
+    def __init__(self, provider: str, message: str, retryable: bool, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+@dataclass
+class LLMResult:
+    text: str
+    provider: str
+    model: str
+    attempts: int
+    latency_seconds: float
+
+
+class RateBudget:
+    """Token bucket refilled continuously to ``per_minute`` units per minute; ``None`` is unlimited.
+
+    Callers reserve units up front, letting the bucket go into debt, and then
+    sleep off their share of it. Only the reservation takes a lock, a thread
+    lock rather than an asyncio one, so a budget is not tied to any event loop.
+    """
+
+    def __init__(self, per_minute: Optional[float]):
+        self.per_minute = per_minute
+        self.available = float(per_minute or 0)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` units; returns how many seconds to wait before using them."""
+        if not self.per_minute:
+            return 0.0
+        # A single request larger than the whole budget waits for a full bucket rather than forever
+        amount = min(amount, self.per_minute)
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            self.available -= amount
+            return max(0.0, -self.available * 60 / self.per_minute)
+
+    async def acquire(self, amount: float) -> None:
+        delay = self.reserve(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# Rate budgets shared by every executor, batch and event loop in this worker process
+_budgets: Dict[Tuple[str, str, str], Tuple[RateBudget, RateBudget]] = {}
+_budgets_lock = threading.Lock()
+
+
+class LLMProvider(ABC):
+    """One chat-completion HTTP API with its model and rate budgets."""
+
+    name = ''
+
+    def __init__(self, api_key: str, model: str, base_url: str, temperature: float = 0.1,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip('/')
+        self.temperature = temperature
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    @abstractmethod
+    def request(self, prompt: str, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """URL, headers and JSON body for one completion."""
+
+    @abstractmethod
+    def parse(self, body: Dict[str, Any]) -> str:
+        """Completion text from a response body."""
+
+    def budgets(self) -> Tuple[RateBudget, RateBudget]:
+        """This process's request and token budgets for the provider's endpoint and API key."""
+        key = (self.name, self.base_url, self.api_key)
+        with _budgets_lock:
+            budgets = _budgets.get(key)
+            if budgets is None or (budgets[0].per_minute, budgets[1].per_minute) != (
+                    self.requests_per_minute, self.tokens_per_minute):
+                budgets = _budgets[key] = (RateBudget(self.requests_per_minute), RateBudget(self.tokens_per_minute))
+            return budgets
+
+
+class OpenAIProvider(LLMProvider):
+    name = 'openai'
+
+    def request(self, prompt: str, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        return (
+            f"{self.base_url}/chat/completions",
+            {'Authorization': f"Bearer {self.api_key}"},
+            {
+                'model': self.model,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'temperature': self.temperature,
+                'max_tokens': max_tokens
+            }
+        )
+
+    def parse(self, body: Dict[str, Any]) -> str:
+        return body['choices'][0]['message']['content']
+
+
+class AnthropicProvider(LLMProvider):
+    name = 'anthropic'
+
+    def request(self, prompt: str, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        return (
+            f"{self.base_url}/v1/messages",
+            {'x-api-key': self.api_key, 'anthropic-version': '2023-06-01'},
+            {
+                'model': self.model,
+                'max_tokens': max_tokens,
+                'temperature': self.temperature,
+                'messages': [{'role': 'user', 'content': prompt}]
+            }
+        )
+
+    def parse(self, body: Dict[str, Any]) -> str:
+        return body['content'][0]['text']
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Budget charge for one request: roughly four characters per prompt token, plus the completion cap."""
+    return len(prompt) // 4 + max_tokens
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers['retry-after'])
+    except (KeyError, ValueError):
+        return None
+
+
+class LLMExecutor:
+    """Runs many prompts concurrently across providers tried in order."""
+
+    def __init__(self, providers: List[LLMProvider], concurrency: int = LLM_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = LLM_BACKOFF_MAX_SECONDS, timeout: float = LLM_TIMEOUT_SECONDS):
+        self.providers = providers
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+    def run_all(self, prompts: List[str], max_tokens: int = 500) -> List[Union[LLMResult, Exception]]:
+        """Complete ``prompts`` from synchronous code; failures are returned in place, not raised."""
+        return asyncio.run(self.complete_all(prompts, max_tokens))
+
+    async def complete_all(self, prompts: List[str], max_tokens: int = 500) -> List[Union[LLMResult, Exception]]:
+        # The semaphore belongs to this event loop, so it is built per batch; rate budgets are per process
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async def bounded(prompt: str) -> LLMResult:
+                async with semaphore:
+                    return await self.complete(client, prompt, max_tokens)
+
+            return await asyncio.gather(*(bounded(prompt) for prompt in prompts), return_exceptions=True)
+
+    async def complete(self, client: httpx.AsyncClient, prompt: str, max_tokens: int) -> LLMResult:
+        """Try each provider in turn, retrying retryable failures before falling back."""
+        if not self.providers:
+            raise LLMProviderError('none', 'no LLM provider configured', retryable=False)
+
+        error: Optional[LLMProviderError] = None
+        for provider in self.providers:
+            request_budget, token_budget = provider.budgets()
+            for attempt in range(self.max_retries + 1):
+                await request_budget.acquire(1)
+                await token_budget.acquire(estimate_tokens(prompt, max_tokens))
+                start = time.perf_counter()
+                try:
+                    text = await self._send(client, provider, prompt, max_tokens)
+                except LLMProviderError as e:
+                    error = e
+                    LLM_REQUESTS.labels(provider=provider.name, outcome='retryable' if e.retryable else 'failed').inc()
+                    if not e.retryable or attempt == self.max_retries:
+                        break
+                    await asyncio.sleep(self._backoff(attempt, e.retry_after))
+                    continue
+
+                LLM_REQUESTS.labels(provider=provider.name, outcome='ok').inc()
+                return LLMResult(text, provider.name, provider.model, attempt + 1, time.perf_counter() - start)
+
+            logger.warning("LLM provider failed, falling back", provider=provider.name, error=str(error))
+
+        raise error
+
+    async def _send(self, client: httpx.AsyncClient, provider: LLMProvider, prompt: str, max_tokens: int) -> str:
+        url, headers, body = provider.request(prompt, max_tokens)
+        try:
+            response = await client.post(url, headers=headers, json=body)
+        except httpx.TransportError as e:
+            # Timeouts and dropped connections
+            raise LLMProviderError(provider.name, repr(e), retryable=True)
+
+        if response.status_code >= 400:
+            raise LLMProviderError(
+                provider.name, f"HTTP {response.status_code}: {response.text[:200]}",
+                retryable=response.status_code in RETRYABLE_STATUS, retry_after=_retry_after(response)
+            )
+        try:
+            return provider.parse(response.json())
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMProviderError(provider.name, f"unexpected response: {e!r}", retryable=False)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than the provider's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+
+def _env_rate(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def executor_from_env(openai_model: str, anthropic_model: str, temperature: float = 0.1) -> LLMExecutor:
+    """Executor over the providers whose API keys are set, OpenAI first, with LLM_* and *_RPM/*_TPM settings."""
+    providers: List[LLMProvider] = []
+    if os.getenv('OPENAI_API_KEY'):
+        providers.append(OpenAIProvider(
+            os.getenv('OPENAI_API_KEY'), openai_model,
+            os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1'), temperature,
+            _env_rate('OPENAI_RPM'), _env_rate('OPENAI_TPM')
+        ))
+    if os.getenv('ANTHROPIC_API_KEY'):
+        providers.append(AnthropicProvider(
+            os.getenv('ANTHROPIC_API_KEY'), anthropic_model,
+            os.getenv('ANTHROPIC_BASE_URL', 'https://api.anthropic.com'), temperature,
+            _env_rate('ANTHROPIC_RPM'), _env_rate('ANTHROPIC_TPM')
+        ))
+    return LLMExecutor(providers)
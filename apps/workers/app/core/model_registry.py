@@ -0,0 +1,123 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Process-wide registry of ML models.
+
+Models are addressed as ``<kind>:<name>`` (for example
+``sentence-transformer:all-MiniLM-L6-v2`` or ``spacy:en_core_web_sm``) and
+loaded lazily, at most once per worker process. Heavy libraries are only
+imported by the loader, so importing a worker module no longer pays for
+models its tasks never use. ``preload`` lets the Celery
+``worker_process_init`` hook warm the models a queue needs before its first
+task.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List
+
+import psutil
+import structlog
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class ModelLoadStats:
+    """Cost of loading one model into this process."""
+    name: str
+    load_seconds: float
+    rss_delta_bytes: int
+    rss_after_bytes: int
+    pid: int
+
+
+def _load_sentence_transformer(model_name: str) -> Any:
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def _load_spacy(model_name: str) -> Any:
+    import spacy
+
+    try:
+        return spacy.load(model_name)
+    except OSError:
+        logger.warning("spaCy model not found, using basic regex extraction", model=model_name)
+        return None
+
+
+def _load_onnx_embedding(model_name: str) -> Any:
+    from app.core.embedding_backends import load_onnx_backend
+
+    return load_onnx_backend(model_name)
+
+
+class ModelRegistry:
+    """Lazily loaded, per-process model singletons."""
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[str], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, ModelLoadStats] = {}
+        self._lock = threading.Lock()
+
+    def register_kind(self, kind: str, loader: Callable[[str], Any]) -> None:
+        """Register the loader for every ``<kind>:<name>`` model."""
+        self._loaders[kind] = loader
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._models
+
+    def get(self, key: str) -> Any:
+        """Return the model for ``key``, loading it on first use in this process."""
+        if key in self._models:
+            return self._models[key]
+
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self._load(key)
+        return self._models[key]
+
+    def _load(self, key: str) -> Any:
+        kind, _, name = key.partition(':')
+        if kind not in self._loaders or not name:
+            raise KeyError(f"Unknown model: {key}")
+
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+        model = self._loaders[kind](name)
+        load_seconds = time.perf_counter() - start
+        rss_after = process.memory_info().rss
+
+        stats = ModelLoadStats(
+            name=key,
+            load_seconds=load_seconds,
+            rss_delta_bytes=rss_after - rss_before,
+            rss_after_bytes=rss_after,
+            pid=os.getpid()
+        )
+        self._stats[key] = stats
+        logger.info("Loaded model", **asdict(stats))
+        return model
+
+    def preload(self, keys: List[str]) -> None:
+        """Load ``keys`` now; failures are logged so a bad entry cannot stop the worker booting."""
+        for key in keys:
+            try:
+                self.get(key)
+            except Exception as e:
+                logger.error("Failed to preload model", model=key, error=str(e))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Load time and resident-memory cost of every model loaded in this process."""
+        return {key: asdict(stats) for key, stats in self._stats.items()}
+
+
+registry = ModelRegistry()
+registry.register_kind('sentence-transformer', _load_sentence_transformer)
+registry.register_kind('spacy', _load_spacy)
+registry.register_kind('embedding-onnx', _load_onnx_embedding)
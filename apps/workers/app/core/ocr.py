@@ -0,0 +1,176 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Parallel page OCR.
+
+Each page image is piped to its own ``tesseract stdin stdout`` process, so
+nothing touches disk and the OCR itself runs outside the GIL. A thread pool
+drives those processes; a process pool is not an option because Celery's
+prefork children are daemonic and may not fork children of their own.
+Tesseract's internal OpenMP threading is pinned to one thread per process so
+``OCR_WORKERS`` concurrent pages do not oversubscribe the cores.
+
+``ocr_cache_key`` content-addresses a rendered page, so identical pages
+(signature blocks, standard exhibits, template riders) are OCR'd once across
+the whole corpus.
+
+``triage_page`` looks at a small grayscale thumbnail before anything is sent
+to tesseract. Blank separators and logo-only pages are skipped (a logo is a
+small, compact mark, not a few lines of text, which are wide and come in
+line-height bands however little of the page they cover); the rest are
+classed as text or image from the row ink profile (text is a run of short,
+evenly sized ink bands, a picture is one tall band), and the estimated text
+line height picks the render DPI so glyphs reach the size tesseract reads
+best at, instead of one default resolution for every page.
+"""
+
+import hashlib
+import os
+import subprocess
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', 'tesseract')
+TESSERACT_LANG = os.getenv('TESSERACT_LANG', 'eng')
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '0'))  # 0 uses every core available to this process
+OCR_PAGE_TIMEOUT_SECONDS = float(os.getenv('OCR_PAGE_TIMEOUT_SECONDS', '120'))
+
+# Page triage: thumbnail resolution, blank threshold (share of inked pixels) and the render DPI range
+OCR_TRIAGE_DPI = 72
+OCR_BLANK_INK_RATIO = float(os.getenv('OCR_BLANK_INK_RATIO', '0.002'))
+OCR_LOGO_MAX_AREA = float(os.getenv('OCR_LOGO_MAX_AREA', '0.05'))  # ink bounding box as a share of the page
+OCR_LOGO_MAX_ASPECT = float(os.getenv('OCR_LOGO_MAX_ASPECT', '6'))  # ink bounding box width over height
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', '150'))
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', '400'))
+OCR_TARGET_LINE_PX = int(os.getenv('OCR_TARGET_LINE_PX', '32'))  # rendered height of one text line
+INK_THRESHOLD = 160
+TEXT_LINE_MAX_PT = 36  # ink bands taller than this are pictures, not lines of text
+DEFAULT_LINE_PT = 12.0
+
+# Dense legal text: LSTM engine, a single column of text of variable sizes, keep spacing in tables
+TESSERACT_TEXT_ARGS = ('--oem', '1', '--psm', '4', '-c', 'preserve_interword_spaces=1')
+# Mostly-image pages (stamped exhibits, scanned forms): find whatever sparse text there is
+TESSERACT_SPARSE_ARGS = ('--oem', '1', '--psm', '11')
+
+
+@dataclass
+class PageTriage:
+    """OCR decision for one page without a text layer."""
+    page: int
+    decision: str  # text, image, blank or logo
+    ink_ratio: float
+    image_share: float = 0.0
+    line_height_pt: Optional[float] = None
+    dpi: Optional[int] = None
+    args: List[str] = field(default_factory=list)
+
+    @property
+    def needs_ocr(self) -> bool:
+        return self.decision in ('text', 'image')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _ink_bands(ink_rows: np.ndarray) -> List[int]:
+    """Heights of consecutive runs of rows that contain ink."""
+    padded = np.concatenate([[False], ink_rows, [False]]).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return (edges[1::2] - edges[::2]).tolist()
+
+
+def triage_page(page: Any, page_number: int) -> PageTriage:
+    """Classify a PyMuPDF page from a grayscale thumbnail and choose how to OCR it."""
+    pix = page.get_pixmap(dpi=OCR_TRIAGE_DPI, colorspace=fitz.csGRAY, alpha=False)
+    pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    ink = pixels < INK_THRESHOLD
+    ink_ratio = float(ink.mean())
+    
+    if ink_ratio < OCR_BLANK_INK_RATIO:
+        return PageTriage(page_number, 'blank', ink_ratio)
+    
+    # Ignore specks and rules: a row counts as inked once a small share of it is
+    bands = _ink_bands(ink.mean(axis=1) > 0.005)
+    px_per_pt = OCR_TRIAGE_DPI / 72
+    max_line_px = TEXT_LINE_MAX_PT * px_per_pt
+    text_bands = [height for height in bands if height <= max_line_px]
+    
+    # A logo is one small, compact mark; a line or two of text is wide, or several line-height bands
+    rows, cols = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+    height, width = rows[-1] - rows[0] + 1, cols[-1] - cols[0] + 1
+    if (height * width / ink.size < OCR_LOGO_MAX_AREA and width / height <= OCR_LOGO_MAX_ASPECT
+            and len(text_bands) < 2):
+        return PageTriage(page_number, 'logo', ink_ratio)
+    image_share = 1.0 - sum(text_bands) / max(sum(bands), 1)
+    
+    line_height_pt = float(np.median(text_bands)) / px_per_pt if text_bands else DEFAULT_LINE_PT
+    dpi = int(np.clip(72 * OCR_TARGET_LINE_PX / max(line_height_pt, 1.0), OCR_MIN_DPI, OCR_MAX_DPI))
+    
+    if image_share > 0.5:
+        return PageTriage(page_number, 'image', ink_ratio, image_share, line_height_pt, dpi, list(TESSERACT_SPARSE_ARGS))
+    return PageTriage(page_number, 'text', ink_ratio, image_share, line_height_pt, dpi, list(TESSERACT_TEXT_ARGS))
+
+
+def render_for_ocr(page: Any, triage: PageTriage) -> Any:
+    """Grayscale render at the DPI triage chose."""
+    return page.get_pixmap(dpi=triage.dpi, colorspace=fitz.csGRAY, alpha=False)
+
+
+def available_cores() -> int:
+    """Cores this process may run on, honouring CPU affinity and container cpusets."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def tesseract_image(image_bytes: bytes, args: Sequence[str] = ()) -> str:
+    """OCR one encoded image (PNG, PGM, ...) through tesseract's stdin and stdout."""
+    result = subprocess.run(
+        [TESSERACT_CMD, 'stdin', 'stdout', '-l', TESSERACT_LANG, *args],
+        input=image_bytes,
+        capture_output=True,
+        timeout=OCR_PAGE_TIMEOUT_SECONDS,
+        env={**os.environ, 'OMP_THREAD_LIMIT': '1'}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"tesseract exited with {result.returncode}: {result.stderr.decode(errors='replace')[:200]}")
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def ocr_cache_key(samples: bytes, width: int, height: int, channels: int, args: Sequence[str] = ()) -> str:
+    """Address of one page's OCR text: the rendered pixels plus everything tesseract is told."""
+    digest = hashlib.sha256()
+    digest.update(f"{width}x{height}x{channels}:{TESSERACT_LANG}:{' '.join(args)}:".encode('utf-8'))
+    digest.update(samples)
+    return digest.hexdigest()
+
+
+def _timed_ocr(image_bytes: bytes, args: Sequence[str]) -> Tuple[str, float]:
+    start = time.perf_counter()
+    text = tesseract_image(image_bytes, args)
+    return text, time.perf_counter() - start
+
+
+class OCRPool:
+    """Thread pool of tesseract processes; submit pages as they are rendered."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or OCR_WORKERS or available_cores()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> 'OCRPool':
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=exc[0] is not None)
+        self._executor = None
+
+    def submit(self, image_bytes: bytes, args: Sequence[str] = ()) -> 'Future[Tuple[str, float]]':
+        """Start OCR of one page; the future yields ``(text, seconds)``."""
+        return self._executor.submit(_timed_ocr, image_bytes, tuple(args))
@@ -0,0 +1,160 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Character-offset to page mapping for document sections.
+
+Ingestion knows where pages start (PDF page boundaries, page breaks Word
+recorded in a DOCX) while it groups text into sections. ``SectionBuilder``
+tracks that as lines are added, so every normalized section carries its
+real page span:
+
+* ``page_from`` / ``page_to``: first and last page holding the section's text
+* ``page_breaks``: ``[offset, page]`` for each later page that starts inside
+  the section's text (its content lines joined by newlines)
+
+``PageIndex`` turns those spans into sorted arrays over the whole document,
+whose text is the sections' texts joined by newlines in document order:
+
+* ``page_starts[k]``: document offset at which ``pages[k]`` starts
+* per paged section, in document order, ``page_from`` and ``page_to``
+
+Sections cover consecutive, non-overlapping stretches of text, so both page
+columns are non-decreasing and the sections on a page form one contiguous
+run. "Which page holds offset X" and "which sections are on page N" are
+therefore bisections. The structure artifact stores ``page_starts`` and
+``pages`` as a document field and the section spans as index columns, so
+``PageIndex.from_artifact`` answers lookups without reading any section.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class SectionBuilder:
+    """Groups lines into normalized sections while following page turns."""
+
+    def __init__(self, level: int = 1, page: int = 1):
+        self.level = level
+        self.page = page
+        self.page_turns = 0
+        self._open('', level)
+
+    def _open(self, heading: str, level: int) -> None:
+        self._section: Dict[str, Any] = {'heading': heading, 'content': [], 'level': level}
+        self._length = 0
+        self._page_from = self.page
+        self._page_breaks: List[List[int]] = []
+
+    def start(self, heading: str, level: int) -> Optional[Dict[str, Any]]:
+        """Open a new section and return the one it ends, if that has any content."""
+        finished = self.finish()
+        self._open(heading, level)
+        return finished
+
+    def add_line(self, line: str) -> int:
+        """Append a content line; returns the line's offset in the section text."""
+        content = self._section['content']
+        offset = self._length + 1 if content else 0
+        content.append(line)
+        self._length = offset + len(line)
+        return offset
+
+    def turn_page(self, page: Optional[int] = None, offset: Optional[int] = None) -> None:
+        """Start ``page`` (the next one by default) at ``offset`` in the section text, or after its last line."""
+        self.page = self.page + 1 if page is None else page
+        self.page_turns += 1
+        if offset is None:
+            offset = self._length + 1 if self._section['content'] else 0
+        if offset == 0:
+            self._page_from = self.page
+        else:
+            self._page_breaks.append([offset, self.page])
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Close the open section and return it, if it has any content; a blank section takes its place."""
+        section, length, page_from, page_breaks = self._section, self._length, self._page_from, self._page_breaks
+        self._open('', self.level)
+        if not section['content']:
+            return None
+
+        # Pages that start after the last character hold none of this section
+        page_breaks = [brk for brk in page_breaks if brk[0] < length]
+        section['page_from'] = page_from
+        section['page_to'] = page_breaks[-1][1] if page_breaks else page_from
+        section['page_breaks'] = page_breaks
+        return section
+
+
+class PageIndex:
+    """Page starts and section page spans as sorted arrays, searched by bisection."""
+
+    def __init__(self):
+        self.page_starts: List[int] = []
+        self.pages: List[int] = []
+        self.char_starts: List[int] = []
+        # Sections with a known page span: their positions and spans, in document order
+        self.positions: List[int] = []
+        self.page_from: List[int] = []
+        self.page_to: List[int] = []
+
+    @classmethod
+    def build(cls, sections: Iterable[Any]) -> 'PageIndex':
+        """Index parsed sections (``char_start``, ``page_from``, ``page_to``, ``page_breaks``) in document order."""
+        index = cls()
+        for section in sections:
+            index.add(section.char_start, section.page_from, section.page_to, section.page_breaks)
+        return index
+
+    @classmethod
+    def from_columns(cls, document_field: Optional[Dict[str, List[int]]],
+                     columns: Dict[str, List[Any]]) -> 'PageIndex':
+        index = cls()
+        document_field = document_field or {}
+        index.page_starts = list(document_field.get('page_starts', []))
+        index.pages = list(document_field.get('pages', []))
+        index.char_starts = list(columns['char_start'])
+        for position, (page_from, page_to) in enumerate(zip(columns['page_from'], columns['page_to'])):
+            if page_from is not None:
+                index.positions.append(position)
+                index.page_from.append(page_from)
+                index.page_to.append(page_to)
+        return index
+
+    @classmethod
+    def from_artifact(cls, reader: Any) -> 'PageIndex':
+        """The page index of a structure artifact, from its index alone."""
+        return cls.from_columns(reader.document.get('page_index'), reader.columns)
+
+    def add(self, char_start: int, page_from: Optional[int], page_to: Optional[int],
+            page_breaks: Iterable[List[int]] = ()) -> None:
+        """Add the next section in document order."""
+        position = len(self.char_starts)
+        self.char_starts.append(char_start)
+        if page_from is None:
+            return
+
+        self.positions.append(position)
+        self.page_from.append(page_from)
+        self.page_to.append(page_to)
+        for offset, page in [(0, page_from), *page_breaks]:
+            if not self.pages or page != self.pages[-1]:
+                self.page_starts.append(char_start + offset)
+                self.pages.append(page)
+
+    def page_of(self, offset: int) -> Optional[int]:
+        """Page holding document offset ``offset``."""
+        k = bisect_right(self.page_starts, offset) - 1
+        return self.pages[k] if k >= 0 else None
+
+    def page_at(self, position: int, offset: int = 0) -> Optional[int]:
+        """Page holding ``offset`` in the text of the section at ``position``."""
+        return self.page_of(self.char_starts[position] + offset)
+
+    def sections_on(self, page: int) -> List[int]:
+        """Positions, in document order, of the sections whose page span includes ``page``."""
+        lo = bisect_left(self.page_to, page)
+        hi = bisect_right(self.page_from, page)
+        return self.positions[lo:hi]
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        """The document field stored with the structure artifact; section spans live in its index columns."""
+        return {'page_starts': self.page_starts, 'pages': self.pages}
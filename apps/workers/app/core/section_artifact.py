@@ -0,0 +1,286 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Compact binary container for sectioned pipeline artifacts.
+
+``normalized`` and ``structure`` artifacts are written as msgpack records
+compressed with zstd instead of pretty-printed JSON. Sections are packed into
+independently compressed blocks of roughly ``ARTIFACT_BLOCK_BYTES`` each, and
+a trailing index holds the document-level fields, a small columnar section
+index (id, heading, level, ... but never the text) and every block's offset:
+
+    MAGIC | block 0 | block 1 | ... | index | index offset, index length, MAGIC
+
+A reader therefore fetches the footer and index first and decompresses only
+the blocks holding the sections it is asked for. ``S3RangeSource`` serves
+those reads with ranged GETs, so a consumer that needs a handful of sections
+never downloads the rest. ``to_json`` rebuilds the original JSON document for
+debugging (``python -m app.core.section_artifact <file>``).
+"""
+
+import json
+import os
+import struct
+import sys
+from bisect import bisect_right
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import msgpack
+import zstandard
+
+MAGIC = b'CIA1'
+FORMAT_VERSION = 1
+FOOTER = struct.Struct('<QI4s')  # index offset, index length, magic
+TAIL_READ_BYTES = 64 * 1024  # first read from the end; usually covers the footer and the whole index
+
+ARTIFACT_BLOCK_BYTES = int(os.getenv('ARTIFACT_BLOCK_BYTES', str(64 * 1024)))
+ARTIFACT_ZSTD_LEVEL = int(os.getenv('ARTIFACT_ZSTD_LEVEL', '6'))
+# Also upload the JSON form of every artifact next to the binary one, for debugging
+ARTIFACT_JSON_EXPORT = os.getenv('ARTIFACT_JSON_EXPORT', 'false').lower() == 'true'
+
+
+class ArtifactFormatError(ValueError):
+    """The bytes are not a section artifact this reader understands."""
+
+
+class SectionArtifactWriter:
+    """Write sections one at a time; document fields are written with the index on ``close``.
+
+    ``index_fields`` are the section keys copied into the index. ``nest_by``
+    names the parent key when sections form a tree, so the JSON view can nest
+    them under ``children`` again; sections must then be added parents first.
+    """
+
+    def __init__(self, fileobj: BinaryIO, kind: str, index_fields: Sequence[str], nest_by: Optional[str] = None):
+        self.fileobj = fileobj
+        self.kind = kind
+        self.index_fields = list(index_fields)
+        self.nest_by = nest_by
+        self._compressor = zstandard.ZstdCompressor(level=ARTIFACT_ZSTD_LEVEL)
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.index_fields}
+        self._blocks: List[Tuple[int, int, int]] = []  # offset, length, first section
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._count = 0
+        self._offset = len(MAGIC)
+        fileobj.write(MAGIC)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add_section(self, section: Dict[str, Any]) -> None:
+        for name in self.index_fields:
+            self._columns[name].append(section.get(name))
+        record = msgpack.packb(section, use_bin_type=True)
+        self._pending.append(record)
+        self._pending_bytes += len(record)
+        self._count += 1
+        if self._pending_bytes >= ARTIFACT_BLOCK_BYTES:
+            self._flush_block()
+
+    def add_sections(self, sections: Iterable[Dict[str, Any]]) -> int:
+        for section in sections:
+            self.add_section(section)
+        return self._count
+
+    def close(self, document: Dict[str, Any]) -> int:
+        """Write the last block and the index; returns the artifact size in bytes."""
+        self._flush_block()
+        index = self._compressor.compress(msgpack.packb({
+            'format': FORMAT_VERSION,
+            'kind': self.kind,
+            'nest_by': self.nest_by,
+            'document': document,
+            'count': self._count,
+            'columns': self._columns,
+            'blocks': self._blocks
+        }, use_bin_type=True))
+        self.fileobj.write(index)
+        self.fileobj.write(FOOTER.pack(self._offset, len(index), MAGIC))
+        return self._offset + len(index) + FOOTER.size
+
+    def _flush_block(self) -> None:
+        if not self._pending:
+            return
+        # Records are self-delimiting msgpack values, so a block is just their concatenation
+        block = self._compressor.compress(b''.join(self._pending))
+        self.fileobj.write(block)
+        self._blocks.append((self._offset, len(block), self._count - len(self._pending)))
+        self._offset += len(block)
+        self._pending, self._pending_bytes = [], 0
+
+
+class FileSource:
+    """Random access to an artifact on local disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def read(self, offset: int, length: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class BytesSource:
+    """Random access to an artifact already in memory."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+
+class S3RangeSource:
+    """Random access to an artifact in S3 through ranged GETs."""
+
+    def __init__(self, s3_client: Any, bucket_name: str, s3_key: str):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.size = s3_client.head_object(Bucket=bucket_name, Key=s3_key)['ContentLength']
+        self.requests = 0
+        self.bytes_read = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        response = self.s3_client.get_object(
+            Bucket=self.bucket_name, Key=self.s3_key, Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        data = response['Body'].read()
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+
+class SectionArtifactReader:
+    """Lazy reader: the index is loaded up front, section blocks only when asked for."""
+
+    def __init__(self, source: Any):
+        self.source = source
+        self._decompressor = zstandard.ZstdDecompressor()
+        tail_offset = max(0, source.size - TAIL_READ_BYTES)
+        tail = source.read(tail_offset, source.size - tail_offset)
+        if len(tail) < FOOTER.size + len(MAGIC):
+            raise ArtifactFormatError("artifact is truncated")
+        index_offset, index_length, magic = FOOTER.unpack(tail[-FOOTER.size:])
+        if magic != MAGIC:
+            raise ArtifactFormatError("not a section artifact")
+
+        if index_offset >= tail_offset:
+            raw_index = tail[index_offset - tail_offset:index_offset - tail_offset + index_length]
+        else:
+            raw_index = source.read(index_offset, index_length)
+        index = msgpack.unpackb(self._decompressor.decompress(raw_index), raw=False)
+        if index['format'] != FORMAT_VERSION:
+            raise ArtifactFormatError(f"unsupported artifact format {index['format']}")
+
+        self.kind: str = index['kind']
+        self.nest_by: Optional[str] = index['nest_by']
+        self.document: Dict[str, Any] = index['document']
+        self.columns: Dict[str, List[Any]] = index['columns']
+        self._blocks: List[Tuple[int, int, int]] = [tuple(block) for block in index['blocks']]
+        self._count: int = index['count']
+        self._block_starts = [block[2] for block in self._blocks]
+
+    @classmethod
+    def open(cls, path: str) -> 'SectionArtifactReader':
+        return cls(FileSource(path))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SectionArtifactReader':
+        return cls(BytesSource(data))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def index(self) -> List[Dict[str, Any]]:
+        """One row of index fields per section, in document order, without loading any section."""
+        names = list(self.columns)
+        return [dict(zip(names, row)) for row in zip(*(self.columns[name] for name in names))]
+
+    def positions(self, field: str, values: Iterable[Any]) -> List[int]:
+        """Positions of the sections whose indexed ``field`` is in ``values``."""
+        wanted = set(values)
+        return [i for i, value in enumerate(self.columns[field]) if value in wanted]
+
+    def section(self, position: int) -> Dict[str, Any]:
+        return next(self.sections([position]))
+
+    def sections(self, positions: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the sections at ``positions`` (all of them by default) in document order.
+
+        Each block is fetched and decompressed once, and neighbouring blocks
+        are fetched with a single read.
+        """
+        wanted = None if positions is None else sorted(set(positions))
+        if wanted is not None and wanted and not 0 <= wanted[0] <= wanted[-1] < self._count:
+            raise IndexError("section position out of range")
+
+        block_ids = range(len(self._blocks)) if wanted is None else sorted({self._block_of(p) for p in wanted})
+        wanted_set = None if wanted is None else set(wanted)
+        for run in self._runs(list(block_ids)):
+            start = self._blocks[run[0]][0]
+            end = self._blocks[run[-1]][0] + self._blocks[run[-1]][1]
+            data = self.source.read(start, end - start)
+            for block_id in run:
+                offset, length, first = self._blocks[block_id]
+                raw = self._decompressor.decompress(data[offset - start:offset - start + length])
+                unpacker = msgpack.Unpacker(raw=False)
+                unpacker.feed(raw)
+                for position, record in enumerate(unpacker, first):
+                    if wanted_set is None or position in wanted_set:
+                        yield record
+
+    def to_json(self) -> Dict[str, Any]:
+        """The full document as the JSON artifact used to store it."""
+        sections = list(self.sections())
+        if self.nest_by:
+            sections = nest_sections(sections, self.nest_by)
+        return {**self.document, 'sections': sections}
+
+    def _block_of(self, position: int) -> int:
+        return bisect_right(self._block_starts, position) - 1
+
+    @staticmethod
+    def _runs(block_ids: List[int]) -> Iterator[List[int]]:
+        run: List[int] = []
+        for block_id in block_ids:
+            if run and block_id != run[-1] + 1:
+                yield run
+                run = []
+            run.append(block_id)
+        if run:
+            yield run
+
+
+def nest_sections(sections: List[Dict[str, Any]], parent_key: str) -> List[Dict[str, Any]]:
+    """Attach flat sections (parents first) to their parents' ``children``; returns the roots."""
+    by_id: Dict[Any, Dict[str, Any]] = {}
+    roots = []
+    for section in sections:
+        node = {**section, 'children': []}
+        by_id[node.get('id')] = node
+        parent = by_id.get(node.get(parent_key))
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
+
+
+def flatten_sections(sections: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Walk nested sections parents first, yielding each without its ``children``."""
+    stack = list(reversed(sections))
+    while stack:
+        section = stack.pop()
+        children = section.get('children') or []
+        stack.extend(reversed(children))
+        yield {key: value for key, value in section.items() if key != 'children'}
+
+
+def export_json(path: str) -> bytes:
+    """Pretty-printed JSON form of the artifact at ``path``."""
+    return json.dumps(SectionArtifactReader.open(path).to_json(), indent=2).encode('utf-8')
+
+
+if __name__ == '__main__':
+    sys.stdout.buffer.write(export_json(sys.argv[1]))
@@ -0,0 +1,156 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Single-pass section classifier for structure parsing.
+
+Every marker the structure parser looks for in a section's text (table
+layouts, exhibit/attachment/schedule references, party, effective date and
+governing law phrases) is one alternative of a single compiled regex, so a
+section's text is scanned once instead of once per pattern.
+
+Each marker is split into the characters it can start with and the rest of
+the pattern. The compiled scanner consumes one of the start characters and
+then picks the marker with a one-character lookbehind and captures the rest
+in a lookahead. Because the pattern opens with a plain character class the
+regex engine skips straight to candidate characters instead of trying every
+alternative at every position, and because only that one character is
+consumed a match never hides another marker that starts right after it, so
+the first occurrence of every marker is seen. Each alternative keeps the case
+sensitivity it had as a separate pattern. Metadata captures are lowercased,
+as they were when the phrases were searched for in lowercased text.
+
+Line-start column layouts start after a newline; the first line of a section
+is checked with one anchored match before the scan.
+
+The scan only ever moves forward, but once a marker has been recorded it is
+dropped from the pattern used for the rest of the text (the narrowed
+scanners are compiled once and cached), so a section that starts with a
+column layout, as most prose does, is only searched for what is still
+unknown.
+
+Section numbers come from one anchored alternation over the heading. Its
+alternatives are in the order the separate patterns were tried, so the first
+one that matches wins.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional
+
+# Alternatives in the order the individual numbering patterns were tried
+SECTION_NUMBER = re.compile(
+    r'^(\d+\.\d+\.?\d*\.?'   # 1.2.3 or 1.2.3.
+    r'|\d+\.\d+'             # 1.2
+    r'|\d+\.'                # 1.
+    r'|\d+\)'                # 1)
+    r'|[IVX]+\.'             # IV.
+    r'|[A-Z]\.'              # A.
+    r'|[a-z]\.)'             # a.
+)
+
+COLUMNS = r'\s*\w+\s+\w+\s+\w+'
+COLUMNS_AT_START = re.compile(COLUMNS)
+
+# (name, start characters, rest of the pattern after the start character)
+TABLE_MARKERS = [
+    ('columns', r'\n', COLUMNS),    # Three words from a line start
+    ('pipe', r'|', r'\s*\w+'),       # Pipe separated
+    ('tab', r'\t', r'\w+'),          # Tab separated
+    ('table_ref', r'T', r'able\s+\d+'),
+]
+
+EXHIBIT_MARKERS = [
+    ('exhibit', r'EeAaSs', r'(?i:(?:(?<=e)xhibit|(?<=a)ttachment|(?<=s)chedule)\s+(?:[A-Z]|\d+))'),
+]
+
+# Metadata phrases; each date and law alternative is kept apart so pattern order can still decide ties
+METADATA_MARKERS = [
+    ('parties', r'Bb', r'(?i:etween\s+(?P<party_a>[^,]+?)\s+and\s+(?P<party_b>[^,]+?)(?:\s|$))'),
+    ('effective_date', r'Ee', r'(?i:ffective\s+date[:\s]+(?P<effective_date_value>[^,\n]+))'),
+    ('commencement_date', r'Cc', r'(?i:ommencement\s+date[:\s]+(?P<commencement_date_value>[^,\n]+))'),
+    ('start_date', r'Ss', r'(?i:tart\s+date[:\s]+(?P<start_date_value>[^,\n]+))'),
+    ('governed_by', r'Gg', r'(?i:overned\s+by\s+the\s+laws\s+of\s+(?P<governed_by_value>[^,\n]+))'),
+    ('governing_law', r'Gg', r'(?i:overning\s+law[:\s]+(?P<governing_law_value>[^,\n]+))'),
+    ('applicable_law', r'Aa', r'(?i:pplicable\s+law[:\s]+(?P<applicable_law_value>[^,\n]+))'),
+]
+
+DATE_KEYS = ('effective_date', 'commencement_date', 'start_date')
+LAW_KEYS = ('governed_by', 'governing_law', 'applicable_law')
+
+
+def _compile(markers) -> 're.Pattern':
+    starts = ''.join(start for _, start, _ in markers)
+    alternatives = '|'.join(f'(?<=[{start}])(?=(?P<{name}>{rest}))' for name, start, rest in markers)
+    # A leading character class lets the engine jump between candidate start characters
+    return re.compile(rf'[{starts}](?:{alternatives})')
+
+
+# What a match records: table and exhibit markers each settle one flag, metadata markers their own value
+GROUPS = {
+    **{name: 'table' for name, _, _ in TABLE_MARKERS},
+    **{name: 'exhibit' for name, _, _ in EXHIBIT_MARKERS},
+    **{name: name for name, _, _ in METADATA_MARKERS},
+}
+MARKERS = TABLE_MARKERS + EXHIBIT_MARKERS + METADATA_MARKERS
+STRUCTURE_GROUPS = frozenset({'table', 'exhibit'})
+METADATA_GROUPS = STRUCTURE_GROUPS | {name for name, _, _ in METADATA_MARKERS}
+
+
+@lru_cache(maxsize=None)
+def _scanner(pending: FrozenSet[str]) -> 're.Pattern':
+    """Scanner for the markers whose group is still unknown."""
+    return _compile([marker for marker in MARKERS if GROUPS[marker[0]] in pending])
+
+
+class SectionScan:
+    """What one pass over a section's text found."""
+    __slots__ = ('has_table', 'has_exhibit', 'parties', 'dates', 'laws')
+
+    def __init__(self):
+        self.has_table = False
+        self.has_exhibit = False
+        self.parties: Optional[list] = None
+        self.dates: Dict[str, str] = {}
+        self.laws: Dict[str, str] = {}
+
+    @property
+    def effective_date(self) -> Optional[str]:
+        return next((self.dates[key] for key in DATE_KEYS if self.dates.get(key)), None)
+
+    @property
+    def governing_law(self) -> Optional[str]:
+        return next((self.laws[key] for key in LAW_KEYS if self.laws.get(key)), None)
+
+
+def section_number(heading: str) -> Optional[str]:
+    match = SECTION_NUMBER.match(heading.strip())
+    return match.group(1) if match else None
+
+
+def scan_section(text: str, with_metadata: bool = False) -> SectionScan:
+    """Classify ``text`` in one pass; metadata phrases are only looked for when asked."""
+    scan = SectionScan()
+    pending = set(METADATA_GROUPS if with_metadata else STRUCTURE_GROUPS)
+    if COLUMNS_AT_START.match(text):
+        scan.has_table = True
+        pending.discard('table')
+
+    pos = 0
+    while pending:
+        match = _scanner(frozenset(pending)).search(text, pos)
+        if match is None:
+            break
+        kind = match.lastgroup
+        if GROUPS[kind] == 'table':
+            scan.has_table = True
+        elif GROUPS[kind] == 'exhibit':
+            scan.has_exhibit = True
+        elif kind == 'parties':
+            scan.parties = [match.group('party_a').strip().lower(), match.group('party_b').strip().lower()]
+        elif kind in DATE_KEYS:
+            scan.dates[kind] = match.group(f'{kind}_value').strip().lower()
+        else:
+            scan.laws[kind] = match.group(f'{kind}_value').strip().lower()
+        pending.discard(GROUPS[kind])
+        pos = match.end()
+
+    return scan
@@ -0,0 +1,120 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Array-backed table of document sections.
+
+Sections are kept in document order; their tree lives in three parallel
+integer arrays instead of per-section child lists:
+
+* ``parent[i]``: index of section ``i``'s parent, or -1 for a root
+* ``depth[i]``: number of ancestors
+* ``subtree_end[i]``: exclusive end of section ``i``'s subtree, so its
+  descendants are exactly ``range(i + 1, subtree_end[i])``
+
+The table is built in one pass with a stack of open sections: a section's
+parent is the nearest preceding section with a lower level. Every section is
+pushed and popped once, so building is linear in the number of sections and
+nothing is recursive. The nested ``children`` view that structure.json
+consumers expect is derived on demand, also in a single pass.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class Section:
+    """One parsed section; the tree structure is held by the table, not here."""
+    __slots__ = ('id', 'heading', 'number', 'text', 'page_from', 'page_to', 'order_idx', 'level', 'parent_id',
+                 'char_start', 'page_breaks')
+
+    def __init__(self, id: str, heading: str, number: Optional[str], text: str, page_from: Optional[int],
+                 page_to: Optional[int], order_idx: int, level: int, parent_id: Optional[str] = None,
+                 char_start: int = 0, page_breaks: Optional[List[List[int]]] = None):
+        self.id = id
+        self.heading = heading
+        self.number = number
+        self.text = text
+        self.page_from = page_from
+        self.page_to = page_to
+        self.order_idx = order_idx
+        self.level = level
+        self.parent_id = parent_id
+        self.char_start = char_start  # offset of ``text`` in the document's section texts joined by newlines
+        self.page_breaks = page_breaks or []  # [offset in text, page] for each later page the text runs onto
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SectionTable:
+    """Sections in document order with parent, depth and subtree ranges as flat arrays."""
+
+    def __init__(self):
+        self.sections: List[Section] = []
+        self.parent = array('l')
+        self.depth = array('l')
+        self.subtree_end = array('l')
+        self._open: List[int] = []  # ancestors of the next section, innermost last
+
+    @classmethod
+    def build(cls, sections: Iterable[Section]) -> 'SectionTable':
+        table = cls()
+        for section in sections:
+            table.append(section)
+        table.close()
+        return table
+
+    def append(self, section: Section) -> int:
+        """Add the next section in document order, attaching it under the nearest shallower open section."""
+        idx = len(self.sections)
+        while self._open and self.sections[self._open[-1]].level >= section.level:
+            self.subtree_end[self._open.pop()] = idx
+
+        parent = self._open[-1] if self._open else -1
+        section.parent_id = self.sections[parent].id if parent >= 0 else None
+        self.sections.append(section)
+        self.parent.append(parent)
+        self.depth.append(len(self._open))
+        self.subtree_end.append(idx + 1)
+        self._open.append(idx)
+        return idx
+
+    def close(self) -> None:
+        """Close the subtrees still open at the end of the document."""
+        while self._open:
+            self.subtree_end[self._open.pop()] = len(self.sections)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def __iter__(self) -> Iterator[Section]:
+        return iter(self.sections)
+
+    def __getitem__(self, idx: int) -> Section:
+        return self.sections[idx]
+
+    def children(self, idx: int) -> Iterator[int]:
+        """Indices of ``idx``'s direct children, hopping over each child's subtree."""
+        child, end = idx + 1, self.subtree_end[idx]
+        while child < end:
+            yield child
+            child = self.subtree_end[child]
+
+    def roots(self) -> Iterator[int]:
+        root = 0
+        while root < len(self.sections):
+            yield root
+            root = self.subtree_end[root]
+
+    def descendants(self, idx: int) -> range:
+        return range(idx + 1, self.subtree_end[idx])
+
+    def nested(self) -> List[Dict[str, Any]]:
+        """The structure.json view: root section dicts with their descendants under ``children``."""
+        nodes: List[Dict[str, Any]] = []
+        roots = []
+        for idx, section in enumerate(self.sections):
+            node = {**section.to_dict(), 'children': []}
+            nodes.append(node)
+            parent = self.parent[idx]
+            (nodes[parent]['children'] if parent >= 0 else roots).append(node)
+        return roots
@@ -0,0 +1,422 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Bulk corpus ingestion for customer onboarding.
+
+``bulk_ingest`` lists an S3 prefix (or streams a manifest of keys) one page
+at a time and writes the files out as small chunk inputs under
+``jobs/bulk_ingest/<job_id>/``, so 100k contracts never sit in one message
+or one object. Chunks run in ``lanes``: each lane is a sequence of chunks in
+which every chunk task hands off to the next when it ends, whether it
+succeeded or not, so at most ``lanes`` chunks of a job are queued or running
+at once and the broker only ever holds that many messages. Lanes run on
+their own queue, served by a separate worker pool, and are capped per org,
+so an import cannot crowd out interactive uploads.
+
+Chunks are kept small so one fits well inside the task time limits. A chunk
+stopped by the soft limit hands its remaining files to a fresh task; a chunk
+killed outright is redelivered (late acks) and gives up on the file it was
+in the middle of, so one pathological file cannot stall its lane.
+
+Every chunk checkpoints a per-file status before and after each file.
+Re-running ``bulk_ingest`` with the same ``job_id`` resumes each lane at its
+first unfinished chunk, and only files that are not yet done are ingested
+again. An org runs one import at a time, guarded by an atomic Redis lock the
+chunks keep alive. Each chunk also mirrors its counts into a Redis hash,
+from which ``bulk_ingest_progress`` reports counts, throughput and an ETA
+without reading every chunk's status object.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import boto3
+import redis
+import structlog
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+
+from app.workers.doc_ingest import ingest_document
+
+logger = structlog.get_logger()
+
+BULK_INGEST_CHUNK_SIZE = int(os.getenv('BULK_INGEST_CHUNK_SIZE', '10'))
+# Chunks of one org's import queued or running at the same time; keep below the bulk pool's concurrency
+BULK_INGEST_ORG_CONCURRENCY = int(os.getenv('BULK_INGEST_ORG_CONCURRENCY', '2'))
+BULK_INGEST_QUEUE = os.getenv('BULK_INGEST_QUEUE', 'bulk')
+BULK_INGEST_REDIS_URL = os.getenv('BULK_INGEST_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+# An org lock nobody refreshes for this long (every lane died) lets the next import start
+BULK_INGEST_LOCK_TTL_SECONDS = int(os.getenv('BULK_INGEST_LOCK_TTL_SECONDS', '3600'))
+# Progress counters expire this long after a job's last checkpoint; they are rebuilt from S3 if read later
+BULK_INGEST_PROGRESS_TTL_SECONDS = int(os.getenv('BULK_INGEST_PROGRESS_TTL_SECONDS', '604800'))
+BULK_INGEST_LIST_PAGE_SIZE = 1000
+
+UPLOAD_PREFIX = 'uploads/'
+
+# Expire or delete the org lock only while it is still held by the given job
+_REFRESH_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end
+return 0
+"""
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+class BulkIngestWorker:
+    def __init__(self):
+        self.s3_client = boto3.client(
+            's3',
+            endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+            aws_access_key_id=os.getenv('S3_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY'),
+            region_name=os.getenv('S3_REGION', 'us-east-1')
+        )
+        self.bucket_name = os.getenv('S3_BUCKET_NAME', 'contract-intelligence')
+        self.redis = redis.Redis.from_url(BULK_INGEST_REDIS_URL, decode_responses=True)
+
+    @staticmethod
+    def job_prefix(job_id: str) -> str:
+        return f"jobs/bulk_ingest/{job_id}"
+
+    def iter_source_keys(self, prefix: Optional[str] = None,
+                         manifest_key: Optional[str] = None) -> Iterator[Dict[str, Optional[str]]]:
+        """Files to import, one page of the listing (or line of the manifest) at a time.
+
+        A manifest is a text object with one entry per line: either a bare S3
+        key or a JSON object with ``key`` and optionally ``agreement_id``.
+        """
+        if manifest_key:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=manifest_key)
+            for line in response['Body'].iter_lines():
+                line = line.decode('utf-8').strip()
+                if not line:
+                    continue
+                entry = json.loads(line) if line.startswith('{') else {'key': line}
+                yield {'key': entry['key'], 'agreement_id': entry.get('agreement_id')}
+            return
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, PaginationConfig={'PageSize': BULK_INGEST_LIST_PAGE_SIZE}
+        )
+        for page in pages:
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    yield {'key': obj['Key'], 'agreement_id': None}
+
+    def file_id_for(self, s3_key: str) -> str:
+        """Stable file id per source object, so a resumed job ingests each file under the same id."""
+        name = s3_key[len(UPLOAD_PREFIX):]
+        if s3_key.startswith(UPLOAD_PREFIX) and name and '/' not in name:
+            return name
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"s3://{self.bucket_name}/{s3_key}"))
+
+    def write_chunks(self, job_id: str, entries: Iterator[Dict[str, Optional[str]]], chunk_size: int) -> Dict[str, int]:
+        """Split the listing into chunk input objects as it streams in; returns the totals."""
+        files_total = chunks_total = 0
+        chunk: List[Dict[str, Optional[str]]] = []
+        for entry in entries:
+            file_id = self.file_id_for(entry['key'])
+            chunk.append({'key': entry['key'], 'file_id': file_id, 'agreement_id': entry['agreement_id'] or file_id})
+            files_total += 1
+            if len(chunk) == chunk_size:
+                self.write_job_json(f"{self.job_prefix(job_id)}/chunks/{chunks_total}/input.json", {'files': chunk})
+                chunks_total, chunk = chunks_total + 1, []
+        if chunk:
+            self.write_job_json(f"{self.job_prefix(job_id)}/chunks/{chunks_total}/input.json", {'files': chunk})
+            chunks_total += 1
+        return {'files_total': files_total, 'chunks_total': chunks_total}
+
+    def stage_upload(self, entry: Dict[str, str]) -> None:
+        """Put a source object where ``ingest_document`` reads uploads from, with a server-side copy."""
+        upload_key = f"{UPLOAD_PREFIX}{entry['file_id']}"
+        if entry['key'] != upload_key:
+            self.s3_client.copy_object(
+                Bucket=self.bucket_name, Key=upload_key, CopySource={'Bucket': self.bucket_name, 'Key': entry['key']}
+            )
+
+    @staticmethod
+    def chunk_done(status: Optional[Dict[str, Any]]) -> bool:
+        return status is not None and status['files_done'] == status['files_total']
+
+    def lane_heads(self, job_id: str, manifest: Dict[str, Any]) -> List[int]:
+        """First unfinished chunk of every lane."""
+        heads = []
+        for lane in range(manifest['lanes']):
+            for chunk_idx in range(lane, manifest['chunks_total'], manifest['lanes']):
+                if not self.chunk_done(self.read_job_json(f"{self.job_prefix(job_id)}/chunks/{chunk_idx}/status.json")):
+                    heads.append(chunk_idx)
+                    break
+        return heads
+
+    @staticmethod
+    def org_lock_key(org_id: str) -> str:
+        return f"bulk_ingest:org:{org_id}"
+
+    def acquire_org_lock(self, org_id: str, job_id: str) -> Optional[str]:
+        """Take the org's import lock for ``job_id``; returns the job holding it instead, if any.
+
+        ``SET NX`` makes the check and the claim one step, so two imports
+        started together cannot both win. A lock left behind by a job with no
+        pending files is released and claimed once more.
+        """
+        key = self.org_lock_key(org_id)
+        for _ in range(2):
+            if self.redis.set(key, job_id, nx=True, ex=BULK_INGEST_LOCK_TTL_SECONDS):
+                return None
+            holder = self.redis.get(key)
+            if holder == job_id:
+                self.refresh_org_lock(org_id, job_id)
+                return None
+            if holder is not None:
+                holder_progress = self.progress(holder)
+                if holder_progress is not None and holder_progress['files_pending'] > 0:
+                    return holder
+                self.release_org_lock(org_id, holder)
+        return self.redis.get(key)
+
+    def refresh_org_lock(self, org_id: str, job_id: str) -> None:
+        self.redis.eval(_REFRESH_LOCK, 1, self.org_lock_key(org_id), job_id, BULK_INGEST_LOCK_TTL_SECONDS)
+
+    def release_org_lock(self, org_id: str, job_id: str) -> None:
+        self.redis.eval(_RELEASE_LOCK, 1, self.org_lock_key(org_id), job_id)
+
+    @staticmethod
+    def progress_key(job_id: str) -> str:
+        return f"bulk_ingest:progress:{job_id}"
+
+    def record_chunk_progress(self, job_id: str, status: Dict[str, Any]) -> Dict[str, Any]:
+        """Mirror a chunk's counts and failures into the job's progress hash, one field per chunk.
+
+        Each write replaces the chunk's field, so a redelivered chunk cannot
+        count a file twice.
+        """
+        chunk_progress = {
+            'files_done': status['files_done'],
+            'files_failed': status['files_failed'],
+            'updated_at': status['updated_at'],
+            'failures': [
+                {'file_id': file_id, 'error': state.get('error')}
+                for file_id, state in status['files'].items() if state['status'] == 'failed'
+            ]
+        }
+        key = self.progress_key(job_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, str(status['chunk_idx']), json.dumps(chunk_progress))
+        pipe.expire(key, BULK_INGEST_PROGRESS_TTL_SECONDS)
+        pipe.execute()
+        return chunk_progress
+
+    def chunk_progress(self, job_id: str) -> List[Dict[str, Any]]:
+        """Counts of every chunk that has started, rebuilt from the status objects if Redis lost them."""
+        chunks = [json.loads(value) for value in self.redis.hvals(self.progress_key(job_id))]
+        if chunks:
+            return chunks
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.job_prefix(job_id)}/chunks/"):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('/status.json'):
+                    chunks.append(self.record_chunk_progress(job_id, self.read_job_json(obj['Key'])))
+        return chunks
+
+    def ingest_chunk(self, job_id: str, chunk_idx: int,
+                     retry_failed: bool = True) -> Tuple[Dict[str, Any], bool]:
+        """Ingest the chunk's unfinished files, checkpointing each; returns its status and whether every file ran.
+
+        A file still marked ``started`` was in progress when an earlier
+        delivery of this chunk was killed; it is failed rather than retried
+        here, so the redelivered chunk moves on. Resuming the job retries it.
+        """
+        job_prefix = self.job_prefix(job_id)
+        status_key = f"{job_prefix}/chunks/{chunk_idx}/status.json"
+        status = self.read_job_json(status_key)
+        if self.chunk_done(status):
+            return status, True
+
+        files = self.read_job_json(f"{job_prefix}/chunks/{chunk_idx}/input.json")['files']
+        status = status or {'chunk_idx': chunk_idx, 'files_total': len(files), 'files': {}}
+
+        def checkpoint(file_id: str, state: Dict[str, Any]) -> None:
+            status['files'][file_id] = state
+            states = [s['status'] for s in status['files'].values()]
+            status.update(files_done=states.count('done'), files_failed=states.count('failed'), updated_at=time.time())
+            self.write_job_json(status_key, status)
+            self.record_chunk_progress(job_id, status)
+
+        for entry in files:
+            previous = status['files'].get(entry['file_id'], {}).get('status')
+            if previous == 'done' or (previous == 'failed' and not retry_failed):
+                continue
+            if previous == 'started':
+                checkpoint(entry['file_id'], {'status': 'failed', 'key': entry['key'],
+                                              'error': 'worker lost while ingesting this file'})
+                continue
+
+            checkpoint(entry['file_id'], {'status': 'started', 'key': entry['key']})
+            start = time.perf_counter()
+            try:
+                self.stage_upload(entry)
+                result = ingest_document.run(entry['file_id'], entry['agreement_id'])
+                checkpoint(entry['file_id'], {
+                    'status': 'done', 'seconds': time.perf_counter() - start, 'dedup_hit': result['dedup']['hit']
+                })
+            except SoftTimeLimitExceeded:
+                # The rest of the chunk goes to a fresh task with its own time budget
+                logger.warning("Bulk chunk hit its time limit", job_id=job_id, chunk_idx=chunk_idx, key=entry['key'])
+                checkpoint(entry['file_id'], {'status': 'failed', 'key': entry['key'], 'error': 'task time limit'})
+                return status, False
+            except Exception as e:
+                logger.error("Bulk file ingestion failed", job_id=job_id, key=entry['key'], error=str(e))
+                checkpoint(entry['file_id'], {'status': 'failed', 'key': entry['key'], 'error': str(e)[:500]})
+
+        return status, True
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Files done, failed and pending, throughput and ETA of a job; None if it does not exist."""
+        manifest = self.read_job_json(f"{self.job_prefix(job_id)}/manifest.json")
+        if manifest is None:
+            return None
+
+        files_done = files_failed = 0
+        last_update = manifest['started_at']
+        failures = []
+        for chunk in self.chunk_progress(job_id):
+            files_done += chunk['files_done']
+            files_failed += chunk['files_failed']
+            last_update = max(last_update, chunk['updated_at'])
+            failures.extend(chunk['failures'])
+
+        # Throughput over the time the job was actually making progress
+        elapsed = max(last_update - manifest['started_at'], 1e-9)
+        throughput = files_done / elapsed if files_done else 0.0
+        files_pending = manifest['files_total'] - files_done - files_failed
+        return {
+            'job_id': job_id,
+            'org_id': manifest['org_id'],
+            'files_total': manifest['files_total'],
+            'files_done': files_done,
+            'files_failed': files_failed,
+            'files_pending': files_pending,
+            'chunks_total': manifest['chunks_total'],
+            'throughput_files_per_second': throughput,
+            'eta_seconds': files_pending / throughput if throughput else None,
+            'failures': failures[:100]
+        }
+
+    def read_job_json(self, s3_key: str) -> Optional[Dict[str, Any]]:
+        """Read a job checkpoint object, or None if it does not exist yet."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def write_job_json(self, s3_key: str, data: Dict[str, Any]) -> None:
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=json.dumps(data).encode('utf-8'))
+
+
+@shared_task(bind=True)
+def bulk_ingest(self, org_id: str, prefix: Optional[str] = None, manifest_key: Optional[str] = None,
+                job_id: Optional[str] = None, chunk_size: int = BULK_INGEST_CHUNK_SIZE,
+                concurrency: int = BULK_INGEST_ORG_CONCURRENCY):
+    """Import every file under an S3 prefix or listed in a manifest, in resumable bounded chunks.
+
+    Re-running with the same ``job_id`` resumes the job. An org runs one
+    import at a time; starting or resuming another while one has files
+    pending returns ``busy`` with the active job's id. ``concurrency`` is
+    capped at ``BULK_INGEST_ORG_CONCURRENCY``.
+    """
+    if not prefix and not manifest_key:
+        raise ValueError("bulk_ingest needs a prefix or a manifest_key")
+    concurrency = min(concurrency, BULK_INGEST_ORG_CONCURRENCY)
+
+    job_id = job_id or str(uuid.uuid4())
+    logger.info("Starting bulk ingestion", org_id=org_id, job_id=job_id, prefix=prefix, manifest_key=manifest_key)
+
+    worker = BulkIngestWorker()
+    job_prefix = worker.job_prefix(job_id)
+
+    try:
+        active_job_id = worker.acquire_org_lock(org_id, job_id)
+        if active_job_id is not None:
+            return {"status": "busy", "job_id": job_id, "active_job_id": active_job_id}
+
+        manifest = worker.read_job_json(f"{job_prefix}/manifest.json")
+        if manifest is None:
+            started_at = time.time()
+            totals = worker.write_chunks(job_id, worker.iter_source_keys(prefix, manifest_key), chunk_size)
+            manifest = {
+                'org_id': org_id,
+                'source': {'prefix': prefix, 'manifest_key': manifest_key},
+                'chunk_size': chunk_size,
+                'lanes': max(1, min(concurrency, totals['chunks_total'])),
+                'started_at': started_at,
+                **totals
+            }
+            worker.write_job_json(f"{job_prefix}/manifest.json", manifest)
+
+        heads = worker.lane_heads(job_id, manifest)
+        if not heads:
+            worker.release_org_lock(org_id, job_id)
+        for chunk_idx in heads:
+            bulk_ingest_chunk.apply_async((job_id, chunk_idx), queue=BULK_INGEST_QUEUE)
+
+        logger.info("Bulk ingestion dispatched", job_id=job_id, files_total=manifest['files_total'],
+                    chunks_total=manifest['chunks_total'], lanes_dispatched=len(heads))
+
+        return {
+            "status": "dispatched" if heads else "completed",
+            "job_id": job_id,
+            "files_total": manifest['files_total'],
+            "chunks_total": manifest['chunks_total'],
+            "lanes": manifest['lanes'],
+            "lanes_dispatched": len(heads)
+        }
+
+    except Exception as e:
+        logger.error("Bulk ingestion failed", job_id=job_id, error=str(e))
+        raise
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def bulk_ingest_chunk(self, job_id: str, chunk_idx: int, retry_failed: bool = True):
+    """Ingest one chunk of a bulk import, checkpointing each file, then hand the lane on.
+
+    A chunk that ran out of time continues in a new task with
+    ``retry_failed=False``, so the file that timed out is not tried again.
+    """
+    worker = BulkIngestWorker()
+    manifest = worker.read_job_json(f"{worker.job_prefix(job_id)}/manifest.json")
+    worker.refresh_org_lock(manifest['org_id'], job_id)
+
+    status, finished = None, False
+    try:
+        status, finished = worker.ingest_chunk(job_id, chunk_idx, retry_failed)
+    finally:
+        # Keep this lane going even if the chunk failed; a job never has more than its lane count queued
+        if status is not None and not finished:
+            bulk_ingest_chunk.apply_async((job_id, chunk_idx, False), queue=BULK_INGEST_QUEUE)
+        elif chunk_idx + manifest['lanes'] < manifest['chunks_total']:
+            bulk_ingest_chunk.apply_async((job_id, chunk_idx + manifest['lanes']), queue=BULK_INGEST_QUEUE)
+        else:
+            progress = worker.progress(job_id)
+            if progress is not None and progress['files_pending'] == 0:
+                worker.release_org_lock(manifest['org_id'], job_id)
+
+    logger.info("Bulk ingestion chunk completed", job_id=job_id, chunk_idx=chunk_idx, finished=finished,
+                files_done=status['files_done'], files_failed=status['files_failed'])
+    return {key: status[key] for key in ('chunk_idx', 'files_total', 'files_done', 'files_failed')}
+
+
+@shared_task
+def bulk_ingest_progress(job_id: str):
+    """Progress, throughput and ETA of a bulk import."""
+    progress = BulkIngestWorker().progress(job_id)
+    if progress is None:
+        raise ValueError(f"Unknown bulk ingestion job: {job_id}")
+    return progress
@@ -4,7 +4,8 @@ import structlog
 import boto3
 import hashlib
 import os
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Dict, Any, Deque, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
 import tempfile
 
@@ -13,11 +14,27 @@ import mammoth
 from PyPDF2 import PdfReader
 import fitz  # PyMuPDF
 import docx
-from PIL import Image
-import pytesseract
+
+from app.core.artifact_store import ContentAddressedArtifacts
+from app.core.cache import cache_from_env
+from app.core.docx_stream import PageBreakReader, iter_docx
+from app.core.ocr import OCRPool, ocr_cache_key, render_for_ocr, triage_page
+from app.core.page_map import SectionBuilder
+from app.core.section_artifact import ARTIFACT_JSON_EXPORT, SectionArtifactWriter, export_json
 
 logger = structlog.get_logger()
 
+# Scanned pages allowed in flight before the page stream waits on the oldest; 0 = twice the OCR workers
+PDF_OCR_WINDOW = int(os.getenv('PDF_OCR_WINDOW', '0'))
+
+# DOCX reader: 'stream' parses document.xml incrementally, 'python-docx' loads the full object model
+DOCX_READER = os.getenv('DOCX_READER', 'stream')
+
+# Dedup stage for the normalized artifact; bump the version whenever extraction, normalization or its format changes
+NORMALIZED_STAGE = 'normalized@4'
+NORMALIZED_FILE = 'normalized.msgz'
+NORMALIZED_INDEX_FIELDS = ('heading', 'level')
+
 class DocumentIngestWorker:
     def __init__(self):
         self.s3_client = boto3.client(
@@ -28,6 +45,10 @@ class DocumentIngestWorker:
             region_name=os.getenv('S3_REGION', 'us-east-1')
         )
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'contract-intelligence')
+        self.artifacts = ContentAddressedArtifacts(self.s3_client, self.bucket_name)
+        
+        # OCR text per rendered page, shared by every document that contains the same page
+        self.ocr_cache = cache_from_env('ocr_pages', 'OCR')
 
     def download_file(self, s3_key: str) -> str:
         """Download file from S3 to temporary location."""
@@ -53,14 +74,17 @@ class DocumentIngestWorker:
         try:
             doc = docx.Document(file_path)
             
-            # Extract paragraphs with their formatting
+            # Extract paragraphs with their formatting; blank ones only matter when a page starts in them
             paragraphs = []
+            pages = PageBreakReader()
             for para in doc.paragraphs:
-                if para.text.strip():
+                _, page_breaks = pages.read(para._p)
+                if para.text.strip() or page_breaks:
                     paragraphs.append({
                         'text': para.text,
                         'style': para.style.name,
-                        'runs': [{'text': run.text, 'bold': run.bold, 'italic': run.italic} for run in para.runs]
+                        'runs': [{'text': run.text, 'bold': run.bold, 'italic': run.italic} for run in para.runs],
+                        'page_breaks': page_breaks
                     })
             
             # Extract tables
@@ -94,134 +118,179 @@ class DocumentIngestWorker:
             logger.error("Failed to extract text from DOCX", file_path=file_path, error=str(e))
             return {'type': 'docx', 'success': False, 'error': str(e)}
 
-    def extract_text_from_pdf(self, file_path: str) -> Dict[str, Any]:
-        """Extract text from PDF with OCR fallback."""
+    def iter_pdf_pages(self, file_path: str, ocr_pool: OCRPool) -> Iterator[Dict[str, Any]]:
+        """Yield each PDF page's text in page order, OCRing pages without a text layer.
+
+        Only one rendered page is held at a time, plus the OCR pages still in
+        flight; once ``PDF_OCR_WINDOW`` pages are pending the oldest is awaited.
+        """
+        window = PDF_OCR_WINDOW or 2 * ocr_pool.workers
+        pending: Deque[Dict[str, Any]] = deque()
+        in_flight: Dict[str, Any] = {}
+        doc = fitz.open(file_path)
+        
         try:
-            # Try text extraction first
-            doc = fitz.open(file_path)
-            text_content = []
-            images = []
-            
             for page_num in range(len(doc)):
                 page = doc.load_page(page_num)
                 
                 # Extract text
                 text = page.get_text()
                 if text.strip():
-                    text_content.append({
-                        'page': page_num + 1,
-                        'text': text,
-                        'blocks': page.get_text("dict")["blocks"]
-                    })
+                    pending.append({'page': page_num + 1, 'text': text, 'ocr': False})
                 else:
-                    # No text found, try OCR
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes("png")
-                    images.append({
-                        'page': page_num + 1,
-                        'image_data': img_data
-                    })
+                    # No text layer: triage, then reuse the OCR of an identical page or OCR it in the background
+                    triage = triage_page(page, page_num + 1)
+                    if not triage.needs_ocr:
+                        pending.append({'page': page_num + 1, 'ocr': False, 'text': '', 'triage': triage})
+                    else:
+                        pix = render_for_ocr(page, triage)
+                        cache_key = ocr_cache_key(pix.samples_mv, pix.width, pix.height, pix.n, triage.args)
+                        cached = self.ocr_cache.get(cache_key)
+                        if cached is not None:
+                            pending.append({'page': page_num + 1, 'ocr': True, 'ocr_cached': True, 'triage': triage,
+                                            'text': cached.decode('utf-8'), 'ocr_seconds': None})
+                        else:
+                            # Repeats of a page whose OCR is still running share its future
+                            if cache_key not in in_flight:
+                                in_flight[cache_key] = ocr_pool.submit(pix.tobytes("png"), triage.args)
+                            pending.append({'page': page_num + 1, 'ocr': True, 'ocr_cached': False, 'triage': triage,
+                                            'cache_key': cache_key, 'future': in_flight[cache_key]})
+                        del pix
+                del page
+                
+                while pending and ('future' not in pending[0] or pending[0]['future'].done() or len(pending) > window):
+                    yield self._resolve_page(pending.popleft(), in_flight)
             
+            while pending:
+                yield self._resolve_page(pending.popleft(), in_flight)
+        finally:
             doc.close()
+
+    def _resolve_page(self, page: Dict[str, Any], in_flight: Dict[str, Any]) -> Dict[str, Any]:
+        """Wait for a page's OCR, if any, and cache it; a failed page comes back with empty text."""
+        future = page.pop('future', None)
+        if future is not None:
+            cache_key = page.pop('cache_key')
+            try:
+                page['text'], page['ocr_seconds'] = future.result()
+                if in_flight.pop(cache_key, None) is None:
+                    # A repeat of a page resolved just before it; only the first OCR counts as work
+                    page['ocr_seconds'], page['ocr_cached'] = None, True
+                else:
+                    self.ocr_cache.set(cache_key, page['text'].encode('utf-8'))
+            except Exception as e:
+                logger.error("OCR failed for page", page=page['page'], error=str(e))
+                page['text'], page['ocr_seconds'] = '', None
+        return page
+
+    def iter_pdf_sections(self, pages: Iterator[Dict[str, Any]], metadata: Dict[str, Any],
+                          ocr_page_latency: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Turn a page stream into normalized sections, updating ``metadata`` as pages pass.
+
+        A section runs on across page boundaries until the next heading, and
+        records the pages its text is on.
+        """
+        metadata['paginated'] = True
+        builder = SectionBuilder()
+        for page in pages:
+            metadata['total_pages'] += 1
+            if 'triage' in page:
+                metadata['ocr_triage'].append(page['triage'].to_dict())
+            builder.turn_page(page['page'])
             
-            # Perform OCR on images if needed
-            ocr_results = []
-            if images:
-                logger.info("Performing OCR on pages without text", pages=[img['page'] for img in images])
-                for img_data in images:
-                    # Save image temporarily for OCR
-                    temp_img = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                    temp_img.write(img_data['image_data'])
-                    temp_img.close()
-                    
-                    try:
-                        # Perform OCR
-                        image = Image.open(temp_img.name)
-                        ocr_text = pytesseract.image_to_string(image)
-                        ocr_results.append({
-                            'page': img_data['page'],
-                            'text': ocr_text
-                        })
-                        os.unlink(temp_img.name)
-                    except Exception as e:
-                        logger.error("OCR failed for page", page=img_data['page'], error=str(e))
-                        os.unlink(temp_img.name)
-            
-            return {
-                'type': 'pdf',
-                'text_content': text_content,
-                'ocr_results': ocr_results,
-                'success': True
-            }
-            
-        except Exception as e:
-            logger.error("Failed to extract text from PDF", file_path=file_path, error=str(e))
-            return {'type': 'pdf', 'success': False, 'error': str(e)}
+            if page['ocr']:
+                metadata['ocr_used'] = True
+                if page['ocr_seconds'] is not None:
+                    ocr_page_latency.append({'page': page['page'], 'seconds': page['ocr_seconds']})
+                if page['text'].strip():
+                    finished = builder.finish()
+                    if finished:
+                        yield finished
+                    yield {
+                        'heading': f'OCR Page {page["page"]}',
+                        'content': [page['text']],
+                        'level': 1,
+                        'ocr': True,
+                        'page_from': page['page'],
+                        'page_to': page['page'],
+                        'page_breaks': []
+                    }
+            else:
+                # Simple section detection based on font size and formatting
+                yield from self._detect_sections_from_pdf(page['text'], builder)
+        
+        finished = builder.finish()
+        if finished:
+            yield finished
+
+    def new_metadata(self) -> Dict[str, Any]:
+        return {
+            'total_pages': 0,
+            'has_tables': False,
+            'has_images': False,
+            'ocr_used': False,
+            'ocr_triage': [],
+            'paginated': False
+        }
 
     def normalize_document(self, extracted_content: Dict[str, Any]) -> Dict[str, Any]:
-        """Normalize extracted content into standard format."""
-        normalized = {
+        """Normalize python-docx extraction output into standard format; PDFs stream through iter_pdf_sections."""
+        metadata = self.new_metadata()
+        elements = [{'kind': 'paragraph', 'text': para['text'], 'style': para['style'],
+                     'page_breaks': para.get('page_breaks', [])}
+                    for para in extracted_content['paragraphs']]
+        elements.extend({'kind': 'table_row', 'table': idx, 'cells': row}
+                        for idx, table in enumerate(extracted_content.get('tables', [])) for row in table)
+        
+        return {
             'document_type': extracted_content['type'],
-            'sections': [],
-            'metadata': {
-                'total_pages': 0,
-                'has_tables': False,
-                'has_images': False,
-                'ocr_used': False
-            }
+            'sections': list(self.iter_docx_sections(iter(elements), metadata)),
+            'metadata': metadata
         }
+
+    def iter_docx_sections(self, elements: Iterator[Dict[str, Any]], metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Group a stream of DOCX paragraphs and table rows into sections at heading-styled paragraphs.
+
+        Pages are counted from the page breaks the reader found. A document
+        Word never laid out has none, and its pages are left unknown.
+        """
+        builder = SectionBuilder(level=0)
         
-        if extracted_content['type'] == 'docx':
-            # Process DOCX content
-            current_section = {'heading': '', 'content': [], 'level': 0}
-            
-            for para in extracted_content['paragraphs']:
-                text = para['text'].strip()
-                style = para['style'].lower()
-                
-                # Detect headings
-                if any(keyword in style for keyword in ['heading', 'title', 'header']):
-                    if current_section['content']:
-                        normalized['sections'].append(current_section)
-                    
-                    current_section = {
-                        'heading': text,
-                        'content': [],
-                        'level': self._get_heading_level(style)
-                    }
-                else:
-                    current_section['content'].append(text)
-            
-            # Add last section
-            if current_section['content']:
-                normalized['sections'].append(current_section)
-            
-            # Add metadata
-            normalized['metadata']['has_tables'] = len(extracted_content.get('tables', [])) > 0
-            
-        elif extracted_content['type'] == 'pdf':
-            # Process PDF content
-            for page_content in extracted_content['text_content']:
-                page_text = page_content['text']
-                # Simple section detection based on font size and formatting
-                sections = self._detect_sections_from_pdf(page_text, page_content['blocks'])
-                normalized['sections'].extend(sections)
+        for element in elements:
+            if element['kind'] == 'table_row':
+                metadata['has_tables'] = True
+                for _ in range(element.get('page_turns', 0)):
+                    builder.turn_page()
+                continue
             
-            # Add OCR results
-            if extracted_content.get('ocr_results'):
-                normalized['metadata']['ocr_used'] = True
-                for ocr_result in extracted_content['ocr_results']:
-                    # Add OCR text as additional sections
-                    normalized['sections'].append({
-                        'heading': f'OCR Page {ocr_result["page"]}',
-                        'content': [ocr_result['text']],
-                        'level': 1,
-                        'ocr': True
-                    })
+            page_breaks = element.get('page_breaks', [])
+            text = element['text'].strip()
+            if not text:
+                for _ in page_breaks:
+                    builder.turn_page()
+                continue
+            style = element['style'].lower()
             
-            normalized['metadata']['total_pages'] = len(extracted_content['text_content'])
+            # Detect headings
+            if any(keyword in style for keyword in ['heading', 'title', 'header']):
+                finished = builder.start(text, self._get_heading_level(style))
+                if finished:
+                    yield finished
+                for _ in page_breaks:
+                    builder.turn_page()
+            else:
+                offset = builder.add_line(text)
+                leading = len(element['text']) - len(element['text'].lstrip())
+                for page_break in page_breaks:
+                    builder.turn_page(offset=offset + min(max(page_break - leading, 0), len(text)))
         
-        return normalized
+        # Add last section
+        finished = builder.finish()
+        if finished:
+            yield finished
+        if builder.page_turns:
+            metadata['paginated'] = True
+            metadata['total_pages'] = builder.page
 
     def _get_heading_level(self, style: str) -> int:
         """Extract heading level from style name."""
@@ -234,11 +303,9 @@ class DocumentIngestWorker:
         else:
             return 1
 
-    def _detect_sections_from_pdf(self, text: str, blocks: list) -> list:
-        """Detect sections from PDF text and formatting blocks."""
-        sections = []
+    def _detect_sections_from_pdf(self, text: str, builder: SectionBuilder) -> Iterator[Dict[str, Any]]:
+        """Add one page of PDF text to ``builder``, yielding the sections its headings close."""
         lines = text.split('\n')
-        current_section = {'heading': '', 'content': [], 'level': 1}
         
         for line in lines:
             line = line.strip()
@@ -250,21 +317,66 @@ class DocumentIngestWorker:
                 line.endswith('.') and any(char.isdigit() for char in line) or
                 len(line) < 100 and line.endswith(':')):
                 
-                if current_section['content']:
-                    sections.append(current_section)
-                
-                current_section = {
-                    'heading': line,
-                    'content': [],
-                    'level': 1
-                }
+                finished = builder.start(line, 1)
+                if finished:
+                    yield finished
             else:
-                current_section['content'].append(line)
+                builder.add_line(line)
+
+    def write_normalized(self, file_path: str, document_type: str, sections: Iterable[Dict[str, Any]],
+                         metadata: Dict[str, Any]) -> int:
+        """Stream the normalized artifact to ``file_path`` section by section and return the section count.
+
+        Metadata is written last, so a section generator may keep filling it in.
+        """
+        with open(file_path, 'wb') as f:
+            writer = SectionArtifactWriter(f, 'normalized', NORMALIZED_INDEX_FIELDS)
+            sections_count = writer.add_sections(sections)
+            writer.close({'document_type': document_type, 'metadata': metadata})
+        return sections_count
+
+    def extract_sections(self, file_path: str, ocr_pool: OCRPool,
+                         ocr_page_latency: List[Dict[str, Any]]) -> Tuple[str, Iterable[Dict[str, Any]], Dict[str, Any]]:
+        """Document type, section stream and the metadata the stream fills in as it is consumed."""
+        file_extension = Path(file_path).suffix.lower()
+        
+        if file_extension == '.docx' and DOCX_READER == 'stream':
+            metadata = self.new_metadata()
+            return 'docx', self.iter_docx_sections(iter_docx(file_path), metadata), metadata
+        if file_extension == '.docx':
+            extracted_content = self.extract_text_from_docx(file_path)
+            if not extracted_content['success']:
+                raise Exception(f"Failed to extract content: {extracted_content.get('error')}")
+            normalized_content = self.normalize_document(extracted_content)
+            return 'docx', normalized_content['sections'], normalized_content['metadata']
+        if file_extension == '.pdf':
+            metadata = self.new_metadata()
+            pages = self.iter_pdf_pages(file_path, ocr_pool)
+            return 'pdf', self.iter_pdf_sections(pages, metadata, ocr_page_latency), metadata
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+    def persist_normalized(self, file_id: str, file_hash: Optional[str], document_type: str,
+                           sections: Iterable[Dict[str, Any]], metadata: Dict[str, Any]) -> int:
+        """Write, upload and publish the normalized artifact; returns the section count."""
+        temp_artifact = tempfile.NamedTemporaryFile(delete=False, suffix='.msgz')
+        temp_artifact.close()
         
-        if current_section['content']:
-            sections.append(current_section)
+        try:
+            sections_count = self.write_normalized(temp_artifact.name, document_type, sections, metadata)
+            self.upload_file(temp_artifact.name, f"processed/{file_id}/{NORMALIZED_FILE}")
+            if ARTIFACT_JSON_EXPORT:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=f"processed/{file_id}/normalized.json",
+                    Body=export_json(temp_artifact.name)
+                )
+        finally:
+            os.unlink(temp_artifact.name)
         
-        return sections
+        self.artifacts.publish(
+            file_hash, NORMALIZED_STAGE, file_id, [NORMALIZED_FILE],
+            {'sections_count': sections_count, 'metadata': metadata}
+        )
+        return sections_count
 
     def calculate_sha256(self, file_path: str) -> str:
         """Calculate SHA256 hash of file."""
@@ -289,34 +401,27 @@ def ingest_document(self, file_id: str, agreement_id: str):
         # Download file from S3
         local_file_path = worker.download_file(s3_key)
         
-        # Calculate file hash
+        # Calculate file hash; re-uploads of identical content reuse the first upload's output
         file_hash = worker.calculate_sha256(local_file_path)
+        worker.artifacts.record_source(file_id, file_hash)
         
-        # Extract text based on file type
-        file_extension = Path(local_file_path).suffix.lower()
-        
-        if file_extension == '.docx':
-            extracted_content = worker.extract_text_from_docx(local_file_path)
-        elif file_extension == '.pdf':
-            extracted_content = worker.extract_text_from_pdf(local_file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-        
-        if not extracted_content['success']:
-            raise Exception(f"Failed to extract content: {extracted_content.get('error')}")
-        
-        # Normalize content
-        normalized_content = worker.normalize_document(extracted_content)
-        
-        # Upload normalized content to S3
-        normalized_key = f"processed/{file_id}/normalized.json"
-        import json
-        temp_json = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-        json.dump(normalized_content, temp_json)
-        temp_json.close()
+        summary = worker.artifacts.reuse(file_hash, NORMALIZED_STAGE, file_id, [NORMALIZED_FILE])
+        if summary is not None:
+            os.unlink(local_file_path)
+            logger.info("Document ingestion reused identical upload", file_id=file_id, sha256=file_hash)
+            return {
+                "status": "success",
+                "file_id": file_id,
+                **summary,
+                "ocr_page_latency": [],
+                "dedup": {"sha256": file_hash, "hit": True}
+            }
         
-        worker.upload_file(temp_json.name, normalized_key)
-        os.unlink(temp_json.name)
+        # Extract and normalize page by page, streaming sections straight into the normalized artifact
+        ocr_page_latency = []
+        with OCRPool() as ocr_pool:
+            document_type, sections, metadata = worker.extract_sections(local_file_path, ocr_pool, ocr_page_latency)
+            sections_count = worker.persist_normalized(file_id, file_hash, document_type, sections, metadata)
         
         # Cleanup
         os.unlink(local_file_path)
@@ -327,13 +432,16 @@ def ingest_document(self, file_id: str, agreement_id: str):
         logger.info("Document ingestion completed", 
                    file_id=file_id, 
                    agreement_id=agreement_id,
-                   sections_count=len(normalized_content['sections']))
+                   sections_count=sections_count)
         
         return {
             "status": "success", 
             "file_id": file_id,
-            "sections_count": len(normalized_content['sections']),
-            "metadata": normalized_content['metadata']
+            "sections_count": sections_count,
+            "metadata": metadata,
+            "ocr_page_latency": ocr_page_latency,
+            "ocr_cache": worker.ocr_cache.stats(),
+            "dedup": {"sha256": file_hash, "hit": False}
         }
         
     except Exception as e:
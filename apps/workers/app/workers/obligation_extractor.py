@@ -14,19 +14,20 @@ from enum import Enum
 from typing import Dict, List, Optional, Any, Tuple
 from urllib.parse import urljoin
 
-import spacy
 from celery import shared_task
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
+from app.core.model_registry import registry as model_registry
+
 logger = logging.getLogger(__name__)
 
-# Load spaCy model for NER
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    logger.warning("spaCy model not found, using basic regex extraction")
-    nlp = None
+SPACY_MODEL = "spacy:en_core_web_sm"
+
+
+def get_nlp():
+    """spaCy pipeline for NER, loaded on first use in this worker process (None if unavailable)"""
+    return model_registry.get(SPACY_MODEL)
 
 
 class ObligationType(Enum):
@@ -223,7 +224,7 @@ class ObligationExtractorWorker:
             obligations.extend(section_obligations)
             
             # Extract using NER if available
-            if nlp:
+            if get_nlp():
                 ner_obligations = self._extract_from_ner(
                     section_text, section_id, agreement_id
                 )
@@ -279,6 +280,7 @@ class ObligationExtractorWorker:
     
     def _extract_from_ner(self, text: str, section_id: str, agreement_id: str) -> List[ExtractedObligation]:
         """Extract obligations using spaCy NER"""
+        nlp = get_nlp()
         if not nlp:
             return []
         
@@ -0,0 +1,165 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Document pipeline entry point: ingest → structure → match.
+
+``staged`` mode chains the three stage tasks, each reading the previous
+stage's artifact back from S3. ``fast`` mode is the lane for interactive
+single-document uploads: one worker process runs the stages back to back and
+hands the in-memory document model from one to the next. Each artifact is
+uploaded on a background thread as soon as its stage finishes, so S3 writes
+overlap the next stage instead of sitting between them. The match results
+are reported through the task state (``MATCHED``) before the last uploads
+are waited on. The S3 artifacts end up the same in either mode, so later
+stages and library re-matches cannot tell them apart.
+"""
+
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from celery import chain, shared_task
+
+from app.core.ocr import OCRPool
+from app.workers.clause_matcher import MATCH_ARTIFACT_FILES, ClauseMatcherWorker, match_clauses
+from app.workers.doc_ingest import NORMALIZED_FILE, NORMALIZED_STAGE, DocumentIngestWorker, ingest_document
+from app.workers.structure_parser import STRUCTURE_FILE, STRUCTURE_STAGE, StructureParserWorker, parse_structure
+
+logger = structlog.get_logger()
+
+PIPELINE_MODES = ('staged', 'fast')
+PIPELINE_DEFAULT_MODE = os.getenv('PIPELINE_DEFAULT_MODE', 'staged')
+PIPELINE_PERSIST_WORKERS = int(os.getenv('PIPELINE_PERSIST_WORKERS', '4'))
+
+
+def _reuse_all(file_id: str, file_hash: str, stages: List[Tuple[str, List[str]]],
+               matcher: ClauseMatcherWorker) -> Optional[Dict[str, Any]]:
+    """Copy every stage's artifacts from an identical earlier upload; None unless all of them exist."""
+    summary = None
+    for stage, files in stages:
+        summary = matcher.artifacts.reuse(file_hash, stage, file_id, files)
+        if summary is None:
+            return None
+    return summary
+
+
+def run_fast_lane(task: Any, file_id: str, agreement_id: str, jurisdiction: Optional[str]) -> Dict[str, Any]:
+    """Run ingest, structure parsing and clause matching in this process, persisting in the background."""
+    ingest, parser, matcher = DocumentIngestWorker(), StructureParserWorker(), ClauseMatcherWorker()
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    local_file_path = ingest.download_file(f"uploads/{file_id}")
+    file_hash = ingest.calculate_sha256(local_file_path)
+    ingest.artifacts.record_source(file_id, file_hash)
+    library_clauses = matcher.download_library_clauses()
+    match_stage = matcher.match_stage(library_clauses, jurisdiction)
+    timings['download'] = time.perf_counter() - start
+
+    # Identical content already through every stage is a copy, not a run
+    stages = [(NORMALIZED_STAGE, [NORMALIZED_FILE]), (STRUCTURE_STAGE, [STRUCTURE_FILE]), (match_stage, MATCH_ARTIFACT_FILES)]
+    summary = _reuse_all(file_id, file_hash, stages, matcher)
+    if summary is not None:
+        os.unlink(local_file_path)
+        return {
+            "status": "success",
+            "mode": "fast",
+            "file_id": file_id,
+            "matches_url": f"s3://{matcher.bucket_name}/processed/{file_id}/clause_matches.json",
+            **summary,
+            "dedup": {"sha256": file_hash, "hit": True}
+        }
+
+    pending: List[Future] = []
+    with ThreadPoolExecutor(max_workers=PIPELINE_PERSIST_WORKERS, thread_name_prefix='persist') as persist:
+        try:
+            # Ingest: keep the sections in memory instead of streaming them to disk
+            start = time.perf_counter()
+            ocr_page_latency: List[Dict[str, Any]] = []
+            with OCRPool() as ocr_pool:
+                document_type, sections, metadata = ingest.extract_sections(local_file_path, ocr_pool, ocr_page_latency)
+                sections = list(sections)
+            os.unlink(local_file_path)
+            normalized_content = {'document_type': document_type, 'sections': sections, 'metadata': metadata}
+            pending.append(persist.submit(
+                ingest.persist_normalized, file_id, file_hash, document_type, sections, metadata
+            ))
+            timings['ingest'] = time.perf_counter() - start
+
+            # Structure: parse straight from the normalized sections
+            start = time.perf_counter()
+            structure = parser.build_structure(normalized_content)
+            pending.append(persist.submit(parser.persist_structure, file_id, file_hash, structure))
+            timings['structure'] = time.perf_counter() - start
+
+            # Match: the structure never leaves memory
+            start = time.perf_counter()
+            matches = matcher.match_clauses(structure, library_clauses, jurisdiction=jurisdiction)
+            timings['match'] = time.perf_counter() - start
+
+            result = {
+                "status": "success",
+                "mode": "fast",
+                "file_id": file_id,
+                "agreement_id": agreement_id,
+                "sections_count": len(structure['sections']),
+                "metadata": structure['extracted_metadata'],
+                "matches_count": len(matches),
+                "matches": [asdict(match) for match in matches],
+                "dedup": {"sha256": file_hash, "hit": False}
+            }
+            # Interactive callers can render matches now; artifacts keep uploading below
+            task.update_state(state='MATCHED', meta={**result, "timings": timings})
+
+            persisted = persist.submit(
+                matcher.persist_matches, file_id, file_hash, match_stage, matches, structure, jurisdiction
+            )
+            pending.append(persisted)
+
+            start = time.perf_counter()
+            for future in pending:
+                future.result()
+            timings['persist_wait'] = time.perf_counter() - start
+        finally:
+            if os.path.exists(local_file_path):
+                os.unlink(local_file_path)
+
+    matches_url, avg_confidence = persisted.result()
+    logger.info("Fast lane pipeline completed", file_id=file_id, matches_count=len(matches), timings=timings)
+
+    return {
+        **result,
+        "matches_url": matches_url,
+        "avg_confidence": avg_confidence,
+        "ocr_page_latency": ocr_page_latency,
+        "cascade": matcher.cascade_stats.to_dict(),
+        "timings": timings
+    }
+
+
+@shared_task(bind=True)
+def process_document(self, file_id: str, agreement_id: str, mode: str = PIPELINE_DEFAULT_MODE,
+                     jurisdiction: Optional[str] = None):
+    """Run ingest → structure → match for one upload, as chained stage tasks or fused in this worker."""
+    logger.info("Starting document pipeline", file_id=file_id, agreement_id=agreement_id, mode=mode)
+
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+
+    try:
+        if mode == 'staged':
+            # TODO: Pass agreement_version_id once file ids are resolved from the database
+            workflow = chain(
+                ingest_document.si(file_id, agreement_id),
+                parse_structure.si(file_id),
+                match_clauses.si(file_id, jurisdiction)
+            ).apply_async()
+            return {"status": "dispatched", "mode": mode, "file_id": file_id, "workflow_id": workflow.id}
+
+        return run_fast_lane(self, file_id, agreement_id, jurisdiction)
+
+    except Exception as e:
+        logger.error("Document pipeline failed", file_id=file_id, mode=mode, error=str(e))
+        raise
@@ -2,31 +2,29 @@
 from celery import shared_task
 import structlog
 import boto3
-import json
 import os
-import re
 from typing import Dict, Any, List, Optional
 import tempfile
-from dataclasses import dataclass
+
+from app.core.artifact_store import ContentAddressedArtifacts
+from app.core.section_artifact import (
+    ARTIFACT_JSON_EXPORT, SectionArtifactReader, SectionArtifactWriter, export_json, flatten_sections
+)
+from app.core.section_scanner import SectionScan, scan_section, section_number
+from app.core.page_map import PageIndex
+from app.core.section_table import Section, SectionTable
 
 logger = structlog.get_logger()
 
-@dataclass
-class Section:
-    id: str
-    heading: str
-    number: Optional[str]
-    text: str
-    page_from: Optional[int]
-    page_to: Optional[int]
-    order_idx: int
-    level: int
-    parent_id: Optional[str] = None
-    children: List['Section'] = None
+# Dedup stage for the structure artifact; bump the version whenever parsing output or its format changes
+STRUCTURE_STAGE = 'structure@4'
+STRUCTURE_FILE = 'structure.msgz'
+STRUCTURE_INDEX_FIELDS = (
+    'id', 'heading', 'number', 'level', 'order_idx', 'parent_id', 'page_from', 'page_to', 'char_start'
+)
 
-    def __post_init__(self):
-        if self.children is None:
-            self.children = []
+# Parties, dates and governing law are only looked for in the opening sections
+METADATA_SECTIONS = 5
 
 class StructureParserWorker:
     def __init__(self):
@@ -38,43 +36,59 @@ class StructureParserWorker:
             region_name=os.getenv('S3_REGION', 'us-east-1')
         )
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'contract-intelligence')
+        self.artifacts = ContentAddressedArtifacts(self.s3_client, self.bucket_name)
 
     def download_normalized_content(self, file_id: str) -> Dict[str, Any]:
         """Download normalized content from S3."""
-        s3_key = f"processed/{file_id}/normalized.json"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
+        s3_key = f"processed/{file_id}/normalized.msgz"
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.msgz')
         
         try:
             self.s3_client.download_file(self.bucket_name, s3_key, temp_file.name)
-            with open(temp_file.name, 'r') as f:
-                content = json.load(f)
-            return content
+            reader = SectionArtifactReader.open(temp_file.name)
+            return {**reader.document, 'sections': list(reader.sections())}
         finally:
             os.unlink(temp_file.name)
 
+    def write_structure(self, file_path: str, structure: Dict[str, Any]) -> None:
+        """Write the structure artifact: sections flattened parents first, everything else as document fields."""
+        with open(file_path, 'wb') as f:
+            writer = SectionArtifactWriter(f, 'structure', STRUCTURE_INDEX_FIELDS, nest_by='parent_id')
+            writer.add_sections(flatten_sections(structure['sections']))
+            writer.close({key: value for key, value in structure.items() if key != 'sections'})
+
     def upload_structure(self, file_id: str, structure: Dict[str, Any]) -> str:
         """Upload parsed structure to S3."""
-        s3_key = f"processed/{file_id}/structure.json"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
+        s3_key = f"processed/{file_id}/{STRUCTURE_FILE}"
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.msgz')
         
         try:
-            with open(temp_file.name, 'w') as f:
-                json.dump(structure, f, indent=2)
-            
+            self.write_structure(temp_file.name, structure)
             self.s3_client.upload_file(temp_file.name, self.bucket_name, s3_key)
+            if ARTIFACT_JSON_EXPORT:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=f"processed/{file_id}/structure.json", Body=export_json(temp_file.name)
+                )
             return f"s3://{self.bucket_name}/{s3_key}"
         finally:
             os.unlink(temp_file.name)
 
     def parse_structure(self, normalized_content: Dict[str, Any]) -> Dict[str, Any]:
         """Parse document structure with advanced section detection."""
-        sections = []
-        section_counter = 0
-        
-        # Process each section from normalized content
-        for section_data in normalized_content.get('sections', []):
-            section_counter += 1
-            
+        table = self.parse_sections(normalized_content)
+        return self.structure_from_table(table, normalized_content.get('document_type'))
+
+    def parse_sections(self, normalized_content: Dict[str, Any]) -> SectionTable:
+        """Build the section table from normalized sections in one pass, in document order.
+
+        Page spans come from ingestion; they stay unknown for documents
+        ingested without a page mapping.
+        """
+        table = SectionTable()
+        paginated = normalized_content.get('metadata', {}).get('paginated', False)
+        char_start = 0
+        
+        for section_counter, section_data in enumerate(normalized_content.get('sections', []), 1):
             # Extract section number from heading
             heading = section_data.get('heading', '')
             section_number = self._extract_section_number(heading)
@@ -82,144 +96,92 @@ class StructureParserWorker:
             # Combine content into single text
             content_text = '\n'.join(section_data.get('content', []))
             
-            # Estimate page range (simplified - would need actual page mapping)
-            page_from = self._estimate_page_from_content(content_text)
-            page_to = page_from  # Simplified - could be calculated based on content length
-            
-            # Create section object
-            section = Section(
+            table.append(Section(
                 id=f"section_{section_counter}",
                 heading=heading,
                 number=section_number,
                 text=content_text,
-                page_from=page_from,
-                page_to=page_to,
+                page_from=section_data.get('page_from') if paginated else None,
+                page_to=section_data.get('page_to') if paginated else None,
                 order_idx=section_counter,
-                level=section_data.get('level', 1)
-            )
-            
-            sections.append(section)
-        
-        # Build hierarchy
-        hierarchical_sections = self._build_hierarchy(sections)
-        
-        # Convert to dictionary format
-        structure = {
-            'document_type': normalized_content.get('document_type'),
-            'sections': [self._section_to_dict(section) for section in hierarchical_sections],
+                level=section_data.get('level', 1),
+                char_start=char_start,
+                page_breaks=section_data.get('page_breaks', []) if paginated else []
+            ))
+            char_start += len(content_text) + 1
+        
+        table.close()
+        return table
+
+    def structure_from_table(self, table: SectionTable, document_type: Optional[str]) -> Dict[str, Any]:
+        """Structure dict with the nested section view and page index derived from the table."""
+        page_index = PageIndex.build(table)
+        return {
+            'document_type': document_type,
+            'sections': table.nested(),
+            'page_index': page_index.to_dict(),
             'metadata': {
-                'total_sections': len(sections),
-                'max_depth': max([s.level for s in sections]) if sections else 1,
-                'has_numbering': any(s.number for s in sections),
-                'page_anchors': self._generate_page_anchors(sections)
+                'total_sections': len(table),
+                'max_depth': max(s.level for s in table) if len(table) else 1,
+                'has_numbering': any(s.number for s in table),
+                'page_anchors': self._generate_page_anchors(table, page_index)
             }
         }
-        
-        return structure
 
-    def _extract_section_number(self, heading: str) -> Optional[str]:
-        """Extract section number from heading text."""
-        # Common patterns for section numbering
-        patterns = [
-            r'^(\d+\.\d+\.?\d*\.?)',  # 1.2.3 or 1.2.3.
-            r'^(\d+\.\d+)',           # 1.2
-            r'^(\d+\.)',              # 1.
-            r'^(\d+\))',              # 1)
-            r'^([IVX]+\.)',           # IV.
-            r'^([A-Z]\.)',            # A.
-            r'^([a-z]\.)',            # a.
-        ]
+    def build_structure(self, normalized_content: Dict[str, Any]) -> Dict[str, Any]:
+        """Full structure artifact: parsed sections plus tables, exhibits and extracted metadata."""
+        table = self.parse_sections(normalized_content)
+        structure = self.structure_from_table(table, normalized_content.get('document_type'))
         
-        for pattern in patterns:
-            match = re.match(pattern, heading.strip())
-            if match:
-                return match.group(1)
-        
-        return None
-
-    def _estimate_page_from_content(self, content: str) -> Optional[int]:
-        """Estimate page number from content (simplified)."""
-        # This is a simplified implementation
-        # In a real system, you'd have actual page mapping from the document
-        if not content:
-            return None
+        # One scan per section finds tables, exhibits and (in the opening sections) metadata
+        sections = table.sections
+        scans = [scan_section(section.text, idx < METADATA_SECTIONS) for idx, section in enumerate(sections)]
         
-        # Estimate based on content length (rough approximation)
-        # Assume ~500 words per page
-        word_count = len(content.split())
-        estimated_page = max(1, word_count // 500)
+        # Detect tables and exhibits
+        tables_exhibits = self.detect_tables_and_exhibits(sections, scans)
+        structure['tables'] = tables_exhibits['tables']
+        structure['exhibits'] = tables_exhibits['exhibits']
         
-        return estimated_page
+        # Extract metadata
+        structure['extracted_metadata'] = self.extract_metadata(sections, scans)
+        return structure
 
-    def _build_hierarchy(self, sections: List[Section]) -> List[Section]:
-        """Build hierarchical structure from flat list of sections."""
-        if not sections:
-            return []
-        
-        # Sort by level and order
-        sections.sort(key=lambda x: (x.level, x.order_idx))
-        
-        # Build hierarchy
-        root_sections = []
-        section_stack = []
-        
-        for section in sections:
-            # Find parent in stack
-            while section_stack and section_stack[-1].level >= section.level:
-                section_stack.pop()
-            
-            if section_stack:
-                # Add as child of current stack top
-                section.parent_id = section_stack[-1].id
-                section_stack[-1].children.append(section)
-            else:
-                # Root level section
-                root_sections.append(section)
-            
-            section_stack.append(section)
-        
-        return root_sections
+    def persist_structure(self, file_id: str, file_hash: Optional[str], structure: Dict[str, Any]) -> str:
+        """Upload the structure artifact and publish it for identical uploads."""
+        structure_url = self.upload_structure(file_id, structure)
+        self.artifacts.publish(
+            file_hash, STRUCTURE_STAGE, file_id, [STRUCTURE_FILE],
+            {'sections_count': len(structure['sections']), 'metadata': structure['extracted_metadata']}
+        )
+        return structure_url
 
-    def _section_to_dict(self, section: Section) -> Dict[str, Any]:
-        """Convert Section object to dictionary."""
-        return {
-            'id': section.id,
-            'heading': section.heading,
-            'number': section.number,
-            'text': section.text,
-            'page_from': section.page_from,
-            'page_to': section.page_to,
-            'order_idx': section.order_idx,
-            'level': section.level,
-            'parent_id': section.parent_id,
-            'children': [self._section_to_dict(child) for child in section.children]
-        }
+    def _extract_section_number(self, heading: str) -> Optional[str]:
+        """Extract section number from heading text."""
+        return section_number(heading)
 
-    def _generate_page_anchors(self, sections: List[Section]) -> Dict[str, List[str]]:
-        """Generate page anchors for navigation."""
+    def _generate_page_anchors(self, table: SectionTable, page_index: PageIndex) -> Dict[str, List[Dict[str, Any]]]:
+        """Generate page anchors for navigation: every section with text on a page, in document order."""
         page_anchors = {}
         
-        for section in sections:
-            if section.page_from:
-                page_key = str(section.page_from)
-                if page_key not in page_anchors:
-                    page_anchors[page_key] = []
-                page_anchors[page_key].append({
-                    'section_id': section.id,
-                    'heading': section.heading,
-                    'number': section.number
-                })
+        for page in sorted(set(page_index.pages)):
+            page_anchors[str(page)] = [
+                {'section_id': table[position].id, 'heading': table[position].heading, 'number': table[position].number}
+                for position in page_index.sections_on(page)
+            ]
         
         return page_anchors
 
-    def detect_tables_and_exhibits(self, sections: List[Section]) -> Dict[str, Any]:
+    def detect_tables_and_exhibits(self, sections: List[Section],
+                                   scans: Optional[List[SectionScan]] = None) -> Dict[str, Any]:
         """Detect tables and exhibits in document sections."""
         tables = []
         exhibits = []
         
-        for section in sections:
+        for idx, section in enumerate(sections):
+            scan = scans[idx] if scans is not None else scan_section(section.text)
+            
             # Look for table indicators in text
-            if self._contains_table(section.text):
+            if scan.has_table:
                 tables.append({
                     'section_id': section.id,
                     'heading': section.heading,
@@ -227,7 +189,7 @@ class StructureParserWorker:
                 })
             
             # Look for exhibit indicators
-            if self._contains_exhibit(section.text):
+            if scan.has_exhibit:
                 exhibits.append({
                     'section_id': section.id,
                     'heading': section.heading,
@@ -241,37 +203,13 @@ class StructureParserWorker:
 
     def _contains_table(self, text: str) -> bool:
         """Check if text contains table indicators."""
-        table_indicators = [
-            r'\|\s*\w+',  # Pipe separated
-            r'\t\w+',     # Tab separated
-            r'Table\s+\d+',  # Table X
-            r'^\s*\w+\s+\w+\s+\w+',  # Multiple columns
-        ]
-        
-        for pattern in table_indicators:
-            if re.search(pattern, text, re.MULTILINE):
-                return True
-        
-        return False
+        return scan_section(text).has_table
 
     def _contains_exhibit(self, text: str) -> bool:
         """Check if text contains exhibit indicators."""
-        exhibit_indicators = [
-            r'Exhibit\s+[A-Z]',
-            r'Exhibit\s+\d+',
-            r'Attachment\s+[A-Z]',
-            r'Attachment\s+\d+',
-            r'Schedule\s+[A-Z]',
-            r'Schedule\s+\d+',
-        ]
-        
-        for pattern in exhibit_indicators:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        
-        return False
+        return scan_section(text).has_exhibit
 
-    def extract_metadata(self, sections: List[Section]) -> Dict[str, Any]:
+    def extract_metadata(self, sections: List[Section], scans: Optional[List[SectionScan]] = None) -> Dict[str, Any]:
         """Extract metadata from document structure."""
         metadata = {
             'parties': [],
@@ -282,43 +220,17 @@ class StructureParserWorker:
             'key_terms': []
         }
         
-        # Look for parties in first few sections
-        for section in sections[:5]:
-            text = section.text.lower()
+        # Look for parties, dates and governing law in the first few sections
+        for idx, section in enumerate(sections[:METADATA_SECTIONS]):
+            scan = scans[idx] if scans is not None else scan_section(section.text, with_metadata=True)
             
-            # Extract parties (simplified)
-            if 'between' in text and 'and' in text:
-                # Simple party extraction
-                between_match = re.search(r'between\s+([^,]+?)\s+and\s+([^,]+?)(?:\s|$)', text)
-                if between_match:
-                    metadata['parties'] = [
-                        between_match.group(1).strip(),
-                        between_match.group(2).strip()
-                    ]
-            
-            # Extract effective date
-            date_patterns = [
-                r'effective\s+date[:\s]+([^,\n]+)',
-                r'commencement\s+date[:\s]+([^,\n]+)',
-                r'start\s+date[:\s]+([^,\n]+)',
-            ]
-            
-            for pattern in date_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match and not metadata['effective_date']:
-                    metadata['effective_date'] = match.group(1).strip()
-            
-            # Extract governing law
-            law_patterns = [
-                r'governed\s+by\s+the\s+laws\s+of\s+([^,\n]+)',
-                r'governing\s+law[:\s]+([^,\n]+)',
-                r'applicable\s+law[:\s]+([^,\n]+)',
-            ]
-            
-            for pattern in law_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match and not metadata['governing_law']:
-                    metadata['governing_law'] = match.group(1).strip()
+            # A later section naming the parties overrides an earlier one
+            if scan.parties:
+                metadata['parties'] = scan.parties
+            if not metadata['effective_date']:
+                metadata['effective_date'] = scan.effective_date
+            if not metadata['governing_law']:
+                metadata['governing_law'] = scan.governing_law
         
         return metadata
 
@@ -334,24 +246,27 @@ def parse_structure(self, agreement_version_id: str):
         # For now, assume file_id is the same as agreement_version_id
         file_id = agreement_version_id
         
+        # A file with identical content may already have been parsed
+        file_hash = worker.artifacts.source_hash(file_id)
+        summary = worker.artifacts.reuse(file_hash, STRUCTURE_STAGE, file_id, [STRUCTURE_FILE])
+        if summary is not None:
+            return {
+                "status": "success",
+                "agreement_version_id": agreement_version_id,
+                "structure_url": f"s3://{worker.bucket_name}/processed/{file_id}/{STRUCTURE_FILE}",
+                **summary,
+                "dedup": {"sha256": file_hash, "hit": True}
+            }
+        
         # Download normalized content
         normalized_content = worker.download_normalized_content(file_id)
         
-        # Parse structure
-        structure = worker.parse_structure(normalized_content)
-        
-        # Detect tables and exhibits
-        sections = [Section(**s) for s in structure['sections']]
-        tables_exhibits = worker.detect_tables_and_exhibits(sections)
-        structure['tables'] = tables_exhibits['tables']
-        structure['exhibits'] = tables_exhibits['exhibits']
-        
-        # Extract metadata
-        metadata = worker.extract_metadata(sections)
-        structure['extracted_metadata'] = metadata
+        # Parse structure, tables, exhibits and metadata
+        structure = worker.build_structure(normalized_content)
+        metadata = structure['extracted_metadata']
         
         # Upload structure to S3
-        structure_url = worker.upload_structure(file_id, structure)
+        structure_url = worker.persist_structure(file_id, file_hash, structure)
         
         # TODO: Update database with structure results
         # TODO: Create section records in database
@@ -368,7 +283,8 @@ def parse_structure(self, agreement_version_id: str):
             "agreement_version_id": agreement_version_id,
             "sections_count": len(structure['sections']),
             "structure_url": structure_url,
-            "metadata": metadata
+            "metadata": metadata,
+            "dedup": {"sha256": file_hash, "hit": False}
         }
         
     except Exception as e:
@@ -0,0 +1 @@
+# Created automatically by Cursor AI (2024-12-19)
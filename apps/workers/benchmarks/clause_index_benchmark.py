@@ -0,0 +1,151 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Recall and latency benchmark for clause candidate indexes.
+
+Compares each approximate index against the exhaustive scan on the same
+queries and reports recall@k, per-query latency and build time as JSON.
+
+    python -m benchmarks.clause_index_benchmark --clauses 200000 --n-probe 4 8 16
+    python -m benchmarks.clause_index_benchmark --embeddings /path/to/embeddings-3.npy
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.clause_index import ClauseIndex, ExactClauseIndex, IVFFlatClauseIndex
+
+CATEGORIES = ["liability", "termination", "privacy", "ip", "payment", "confidentiality"]
+JURISDICTIONS = ["general", "us", "eu", "uk"]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_embeddings(n: int, dim: int, topics: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, so neighbourhoods look like paraphrase families rather than noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dim))
+    return _normalize(centers[rng.integers(0, topics, n)] + 0.6 * rng.normal(size=(n, dim)))
+
+
+def synthetic_clauses(n: int, seed: int) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"clause_{i}",
+            "category": CATEGORIES[rng.integers(len(CATEGORIES))],
+            "jurisdiction": JURISDICTIONS[rng.integers(len(JURISDICTIONS))],
+        }
+        for i in range(n)
+    ]
+
+
+def timed_search(index: ClauseIndex, queries: np.ndarray, k: int, filters: Dict[str, Any]):
+    """Search one query at a time, as the matcher does per section group, recording latency."""
+    rows, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_rows, _ = index.search(query[None, :], k, **filters)
+        latencies.append(time.perf_counter() - start)
+        rows.append(query_rows[0])
+    return np.array(rows), np.array(latencies)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = []
+    for expected, got in zip(truth, found):
+        expected = set(expected[expected >= 0].tolist())
+        if expected:
+            hits.append(len(expected & set(got.tolist())) / len(expected))
+    return float(np.mean(hits)) if hits else 1.0
+
+
+def latency_summary(latencies: np.ndarray) -> Dict[str, float]:
+    return {
+        "mean_ms": float(latencies.mean() * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "qps": float(len(latencies) / latencies.sum()),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.embeddings:
+        matrix = _normalize(np.load(args.embeddings, mmap_mode="r"))
+    else:
+        matrix = synthetic_embeddings(args.clauses, args.dim, args.topics, args.seed)
+    clauses = synthetic_clauses(len(matrix), args.seed)
+
+    # Queries are perturbed library vectors, like sections paraphrasing a library clause
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, len(matrix), args.queries)
+    queries = _normalize(matrix[picks] + args.query_noise * rng.normal(size=(args.queries, matrix.shape[1])))
+
+    filters = {}
+    if args.category:
+        filters["category"] = args.category
+    if args.jurisdiction:
+        filters["jurisdictions"] = [args.jurisdiction, "general"]
+
+    exact = ExactClauseIndex().build(matrix, clauses)
+    truth, exact_latencies = timed_search(exact, queries, args.k, filters)
+
+    report = {
+        "clauses": len(matrix),
+        "dim": int(matrix.shape[1]),
+        "queries": args.queries,
+        "k": args.k,
+        "filters": filters,
+        "exact": latency_summary(exact_latencies),
+        "ivf_flat": [],
+    }
+
+    start = time.perf_counter()
+    ivf = IVFFlatClauseIndex(n_lists=args.n_lists).build(matrix, clauses)
+    build_seconds = time.perf_counter() - start
+
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        found, latencies = timed_search(ivf, queries, args.k, filters)
+        report["ivf_flat"].append({
+            "n_lists": ivf.n_lists,
+            "n_probe": n_probe,
+            "build_seconds": build_seconds,
+            f"recall@{args.k}": recall_at_k(truth, found),
+            **latency_summary(latencies),
+        })
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--embeddings", help="Benchmark a saved .npy clause matrix instead of synthetic vectors")
+    parser.add_argument("--clauses", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--query-noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--category", default=None)
+    parser.add_argument("--jurisdiction", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
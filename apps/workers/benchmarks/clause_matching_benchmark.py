@@ -0,0 +1,284 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+End-to-end benchmark for ClauseMatcherWorker.match_clauses.
+
+Generates a synthetic clause library and agreements whose sections paraphrase
+library clauses with controlled noise, matches them with a stubbed LLM executor and
+reports wall time, pairs scored per second, peak RSS, the time spent in each
+cascade tier and top-1 accuracy against the generator's ground truth as JSON.
+Caches and stores live in a fresh temporary directory, so every run is cold.
+
+    python -m benchmarks.clause_matching_benchmark --sections 300 --clauses 2000 --embedder hash
+    python -m benchmarks.clause_matching_benchmark --embedder model --model all-MiniLM-L6-v2 --output run.json
+
+``--embedder model`` loads the SentenceTransformer from the local Hugging Face
+cache (run with ``HF_HUB_OFFLINE=1`` on boxes without network access);
+``--embedder hash`` needs no model at all.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from app.core.llm_executor import LLMExecutor, LLMProvider
+
+CATEGORY_TEMPLATES = {
+    "liability": [
+        "In no event shall {a} be liable to {b} for any {adj} indirect, incidental or consequential damages arising out of {subject}.",
+        "The aggregate liability of {a} under {subject} shall not exceed the fees paid by {b} in the preceding {n} months.",
+    ],
+    "termination": [
+        "{a} may terminate {subject} for convenience upon {n} days {adj} written notice to {b}.",
+        "Either party may terminate {subject} immediately if the other party commits a {adj} material breach not cured within {n} days.",
+    ],
+    "confidentiality": [
+        "{a} shall keep all {adj} confidential information of {b} secret and shall not disclose it to any third party during {subject}.",
+        "The obligations of confidentiality in {subject} shall survive for {n} years after disclosure by {b}.",
+    ],
+    "payment": [
+        "{b} shall pay all {adj} undisputed invoices issued by {a} under {subject} within {n} days of receipt.",
+        "Late payments under {subject} shall accrue interest at {n} percent per annum until paid by {b}.",
+    ],
+    "privacy": [
+        "{a} shall process personal data on behalf of {b} only on {adj} documented instructions as set out in {subject}.",
+        "{a} shall notify {b} of any {adj} personal data breach under {subject} within {n} hours of becoming aware of it.",
+    ],
+    "ip": [
+        "All {adj} intellectual property rights in deliverables created under {subject} shall vest in {b} upon payment to {a}.",
+        "{a} grants {b} a {adj} non-exclusive licence to use the background technology for the term of {subject}.",
+    ],
+}
+PARTIES = ["the Supplier", "the Customer", "Licensor", "Licensee", "the Service Provider", "the Client", "the Vendor"]
+ADJECTIVES = ["", "reasonable", "prior", "direct", "applicable", "relevant", "such", "all"]
+SUBJECTS = ["this Agreement", "the Services Agreement", "any Statement of Work", "the Master Agreement", "the Order Form"]
+JURISDICTIONS = ["general", "us", "eu", "uk"]
+SYNONYMS = {
+    "shall": "will", "terminate": "end", "notice": "notification", "liable": "responsible",
+    "damages": "losses", "disclose": "reveal", "invoices": "bills", "pay": "settle",
+    "immediately": "forthwith", "confidential": "proprietary", "deliverables": "work product",
+    "grants": "gives", "licence": "license", "receipt": "delivery", "aggregate": "total",
+}
+FILLER = ["for the avoidance of doubt", "subject to the terms hereof", "notwithstanding anything to the contrary",
+          "save as expressly provided", "to the extent permitted by law"]
+UNRELATED = [
+    "This Agreement may be executed in any number of counterparts, each of which shall be an original.",
+    "Headings are for convenience only and do not affect the interpretation of this Agreement.",
+    "Any notice shall be delivered by hand or sent by registered post to the address set out above.",
+    "The recitals form part of this Agreement and have effect as if set out in full in the body.",
+]
+
+
+def synthetic_library(count: int, rng: np.random.Generator) -> List[Dict[str, Any]]:
+    categories = list(CATEGORY_TEMPLATES)
+    clauses = []
+    for i in range(count):
+        category = categories[i % len(categories)]
+        template = CATEGORY_TEMPLATES[category][rng.integers(len(CATEGORY_TEMPLATES[category]))]
+        a, b = rng.choice(PARTIES, 2, replace=False)
+        text = template.format(
+            a=a, b=b, n=int(rng.integers(2, 120)),
+            adj=ADJECTIVES[rng.integers(len(ADJECTIVES))], subject=SUBJECTS[rng.integers(len(SUBJECTS))]
+        )
+        clauses.append({
+            "id": f"clause_{i}",
+            "title": f"{category.title()} {i}",
+            "text": " ".join(text.split()),
+            "category": category,
+            "jurisdiction": JURISDICTIONS[rng.integers(len(JURISDICTIONS))],
+            "embedding": None,
+            "risk_level": ["low", "medium", "high"][rng.integers(3)],
+            "playbook_positions": ["preferred", "fallback"],
+        })
+    return clauses
+
+
+def paraphrase(text: str, noise: float, rng: np.random.Generator) -> str:
+    """Swap synonyms, drop words and splice in boilerplate, each at a rate scaled by ``noise``."""
+    words = []
+    for word in text.split():
+        bare = word.strip(".,").lower()
+        roll = rng.random()
+        if roll < noise * 0.5 and bare in SYNONYMS:
+            words.append(SYNONYMS[bare])
+        elif roll < noise * 0.6:
+            continue
+        else:
+            words.append(word)
+        if rng.random() < noise * 0.05:
+            words.append(FILLER[rng.integers(len(FILLER))] + ",")
+    return " ".join(words)
+
+
+def synthetic_agreement(library: List[Dict[str, Any]], sections: int, noise: float, unrelated_share: float,
+                        rng: np.random.Generator) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Structure dict shaped like parse_structure's output, plus the source clause id per section."""
+    structure_sections, truth = [], {}
+    for i in range(sections):
+        section_id = f"section_{i}"
+        if rng.random() < unrelated_share:
+            text, category = UNRELATED[rng.integers(len(UNRELATED))], None
+        else:
+            clause = library[rng.integers(len(library))]
+            # Real sections are often a clause plus neighbouring boilerplate
+            parts = [paraphrase(clause["text"], noise, rng) for _ in range(int(rng.integers(1, 3)))]
+            text, category = " ".join(parts), clause["category"]
+            truth[section_id] = clause["id"]
+        structure_sections.append({
+            "id": section_id, "number": str(i + 1), "title": f"Section {i + 1}", "level": 1,
+            "text": text, "category": category, "children": [],
+        })
+    return {"sections": structure_sections}, truth
+
+
+class StubProvider(LLMProvider):
+    """Provider slot for the stub executor; its requests never leave the process."""
+
+    name = "stub"
+
+    def request(self, prompt: str, max_tokens: int) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        return "", {}, {"prompt": prompt, "max_tokens": max_tokens}
+
+    def parse(self, body: Dict[str, Any]) -> str:
+        return body["text"]
+
+
+class StubLLMExecutor(LLMExecutor):
+    """Answers the matcher's prompts from word overlap after a simulated latency, without any HTTP."""
+
+    def __init__(self, latency: float, concurrency: int):
+        super().__init__([StubProvider("", "stub", "")], concurrency=concurrency)
+        self.latency = latency
+        self.calls = 0
+
+    async def _send(self, client: Any, provider: LLMProvider, prompt: str, max_tokens: int) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        section = prompt.split("SECTION TEXT:")[1].split("LIBRARY CLAUSE:")[0]
+        clause = prompt.split("LIBRARY CLAUSE:")[1].split("Please provide:")[0]
+        a, b = set(re.findall(r"\w+", section.lower())), set(re.findall(r"\w+", clause.lower()))
+        confidence = len(a & b) / max(len(a | b), 1)
+        return json.dumps({"confidence": confidence, "reasoning": "stub", "position": "preferred", "risk": "medium"})
+
+
+def timed(method: Callable, bucket: Dict[str, float], tier: str) -> Callable:
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            bucket[tier] += time.perf_counter() - start
+    return wrapper
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Point every cache and store at a scratch directory before the worker module reads its settings
+    scratch = tempfile.mkdtemp(prefix="clause-matching-bench-")
+    os.environ.update({
+        "EMBEDDING_BACKEND": "hash" if args.embedder == "hash" else args.backend,
+        "EMBEDDING_MODEL_NAME": args.model,
+        "CLAUSE_EMBEDDING_STORE_DIR": os.path.join(scratch, "clause-embeddings"),
+        "CLAUSE_INDEX_DIR": os.path.join(scratch, "clause-index"),
+        "CLAUSE_INDEX_KIND": args.index,
+        "LLM_CACHE_BACKEND": "none",
+        "SECTION_CACHE_BACKEND": "none",
+    })
+    from app.workers.clause_matcher import ClauseMatcherWorker, library_version
+
+    rng = np.random.default_rng(args.seed)
+    library = synthetic_library(args.clauses, rng)
+    agreements = [
+        synthetic_agreement(library, args.sections, args.noise, args.unrelated_share, rng)
+        for _ in range(args.agreements)
+    ]
+
+    worker = ClauseMatcherWorker()
+    stub = StubLLMExecutor(args.llm_latency, args.llm_concurrency)
+    worker.llm_executor = stub
+
+    # Library preparation (clause encoding, index build, rule profiles) happens once per library version
+    start = time.perf_counter()
+    version = library_version(worker.embedding_backend.key, library)
+    worker.get_clause_index(library, version)
+    worker.get_clause_profiles(library, version)
+    library_seconds = time.perf_counter() - start
+
+    tiers: Dict[str, float] = defaultdict(float)
+    worker.compute_embedding_matrix = timed(worker.compute_embedding_matrix, tiers, "embedding")
+    worker.retrieve_candidates = timed(worker.retrieve_candidates, tiers, "retrieval")
+    worker._rank_candidates = timed(worker._rank_candidates, tiers, "rules")
+    worker.llm_analysis_batch = timed(worker.llm_analysis_batch, tiers, "llm")
+
+    cascade: Dict[str, int] = defaultdict(int)
+    correct = labelled = matched = 0
+    start = time.perf_counter()
+    for structure, truth in agreements:
+        matches = worker.match_clauses(structure, library, args.jurisdiction)
+        for field, value in worker.cascade_stats.to_dict().items():
+            cascade[field] += value
+        matched += len(matches)
+        found = {match.section_id: match.library_clause_id for match in matches}
+        for section_id, clause_id in truth.items():
+            labelled += 1
+            correct += found.get(section_id) == clause_id
+    wall_seconds = time.perf_counter() - start
+
+    pairs = cascade["pairs_total"]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "embedding_backend": worker.embedding_backend.key,
+        "library_setup_seconds": library_seconds,
+        "wall_seconds": wall_seconds,
+        "pairs_scored": pairs,
+        "pairs_per_second": pairs / wall_seconds if wall_seconds else 0.0,
+        "sections_per_second": args.agreements * args.sections / wall_seconds if wall_seconds else 0.0,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "tier_seconds": {**dict(tiers), "other": max(wall_seconds - sum(tiers.values()), 0.0)},
+        "cascade": dict(cascade),
+        "llm_calls": stub.calls,
+        "matches": matched,
+        "top1_accuracy": correct / labelled if labelled else None,
+        "embedding_batching": worker.batching_stats.to_dict(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agreements", type=int, default=3)
+    parser.add_argument("--sections", type=int, default=300, help="Sections per agreement")
+    parser.add_argument("--clauses", type=int, default=2000, help="Library size")
+    parser.add_argument("--noise", type=float, default=0.3, help="Paraphrase noise, 0 copies library text verbatim")
+    parser.add_argument("--unrelated-share", type=float, default=0.15, help="Share of sections matching no clause")
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Backend for --embedder model")
+    parser.add_argument("--index", choices=["auto", "exact", "ivf_flat"], default="auto")
+    parser.add_argument("--jurisdiction", default=None)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM sleeps per call")
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Throughput benchmark for clause embedding backends.
+
+Encodes the same synthetic clause set with each backend and thread count and
+reports sentences per second, overall and per core, as JSON.
+
+    python -m benchmarks.embedding_backend_benchmark --backends torch onnx --threads 1 2 4
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.embedding_backends import OnnxEmbeddingBackend, SentenceTransformerBackend
+
+CLAUSE_TEMPLATES = [
+    "In no event shall {a} be liable to {b} for any indirect, incidental or consequential damages arising out of this Agreement.",
+    "{a} may terminate this Agreement upon {n} days written notice to {b}.",
+    "{a} shall comply with all applicable data protection laws when processing personal data on behalf of {b}.",
+    "{a} shall pay all undisputed invoices issued by {b} within {n} days of receipt.",
+    "{a} shall indemnify and hold harmless {b} against any third-party claims arising from its negligence or wilful misconduct.",
+    "Neither {a} nor {b} shall be liable for delays caused by events beyond its reasonable control, including acts of God.",
+]
+PARTIES = ["the Supplier", "the Customer", "Licensor", "Licensee", "each party", "the Service Provider"]
+
+
+def synthetic_sentences(count: int, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed)
+    sentences = []
+    for _ in range(count):
+        template = CLAUSE_TEMPLATES[rng.integers(len(CLAUSE_TEMPLATES))]
+        a, b = rng.choice(PARTIES, 2, replace=False)
+        sentence = template.format(a=a, b=b, n=int(rng.integers(5, 120)))
+        # Vary length the way real sections do
+        sentences.append(" ".join([sentence] * int(rng.integers(1, 4))))
+    return sentences
+
+
+def measure(backend: Any, sentences: List[str], batch_size: int, threads: int, repeats: int) -> Dict[str, Any]:
+    backend.encode(sentences[:batch_size], batch_size=batch_size)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.encode(sentences, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+
+    seconds = min(timings)
+    return {
+        "backend": backend.key,
+        "threads": threads,
+        "sentences": len(sentences),
+        "seconds": seconds,
+        "sentences_per_second": len(sentences) / seconds,
+        "sentences_per_second_per_core": len(sentences) / seconds / threads,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sentences", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-quantize", action="store_true", help="Benchmark the fp32 ONNX model")
+    parser.add_argument("--onnx-dir", default=os.path.join(tempfile.gettempdir(), "contract-intelligence", "onnx-bench"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    sentences = synthetic_sentences(args.sentences, args.seed)
+    results = []
+    for threads in args.threads:
+        if "torch" in args.backends:
+            import torch
+
+            torch.set_num_threads(threads)
+            results.append(measure(SentenceTransformerBackend(args.model), sentences, args.batch_size, threads, args.repeats))
+        if "onnx" in args.backends:
+            backend = OnnxEmbeddingBackend(
+                args.model, os.path.join(args.onnx_dir, args.model.replace("/", "_")),
+                quantize=not args.no_quantize, intra_op_threads=threads
+            )
+            results.append(measure(backend, sentences, args.batch_size, threads, args.repeats))
+
+    report = {"model": args.model, "batch_size": args.batch_size, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Created automatically by Cursor AI (2024-12-19)
+"""
+Per-section parse cost of StructureParserWorker before and after the single-pass scanner.
+
+Generates a large synthetic agreement (mixed numbering styles, pipe and tab
+tables, exhibit and schedule references, party/date/governing-law recitals)
+and times section numbering plus table, exhibit and metadata detection two
+ways: with the original pattern-by-pattern ``re`` calls, kept here as the
+reference, and with ``app.core.section_scanner``. Both must agree on every
+section; the report counts mismatches next to the timings.
+
+    python -m benchmarks.structure_parser_benchmark --sections 5000
+    python -m benchmarks.structure_parser_benchmark --sections 20000 --output run.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.section_scanner import scan_section, section_number
+from app.workers.structure_parser import METADATA_SECTIONS, StructureParserWorker
+
+PARTIES = ["Acme Corporation", "Globex Limited", "Initech LLC", "Umbrella Holdings", "Stark Industries"]
+LAWS = ["the State of New York", "England and Wales", "the State of Delaware", "Ontario"]
+FILLER = [
+    "The Supplier shall perform the Services with reasonable skill and care.",
+    "Each party shall comply with all applicable laws in performing its obligations.",
+    "Fees are exclusive of taxes, which the Customer shall pay in addition.",
+    "Neither party may assign this Agreement without the prior written consent of the other.",
+    "Notices must be given in writing and delivered by hand or by courier.",
+    "Any failure to exercise a right shall not operate as a waiver of that right.",
+    "The delivery schedule is agreed between the project managers in writing.",
+]
+NUMBERING = ["{a}.", "{a}.{b}", "{a}.{b}.{c}", "{a})", "IV.", "B.", "c.", ""]
+
+
+def legacy_section_number(heading: str) -> Optional[str]:
+    for pattern in [r'^(\d+\.\d+\.?\d*\.?)', r'^(\d+\.\d+)', r'^(\d+\.)', r'^(\d+\))',
+                    r'^([IVX]+\.)', r'^([A-Z]\.)', r'^([a-z]\.)']:
+        match = re.match(pattern, heading.strip())
+        if match:
+            return match.group(1)
+    return None
+
+
+def legacy_contains_table(text: str) -> bool:
+    for pattern in [r'\|\s*\w+', r'\t\w+', r'Table\s+\d+', r'^\s*\w+\s+\w+\s+\w+']:
+        if re.search(pattern, text, re.MULTILINE):
+            return True
+    return False
+
+
+def legacy_contains_exhibit(text: str) -> bool:
+    for pattern in [r'Exhibit\s+[A-Z]', r'Exhibit\s+\d+', r'Attachment\s+[A-Z]', r'Attachment\s+\d+',
+                    r'Schedule\s+[A-Z]', r'Schedule\s+\d+']:
+        if re.search(pattern, text, re.IGNORECASE):
+            return True
+    return False
+
+
+def legacy_metadata(texts: List[str]) -> Dict[str, Any]:
+    metadata = {'parties': [], 'effective_date': None, 'governing_law': None}
+    for text in texts[:METADATA_SECTIONS]:
+        text = text.lower()
+        if 'between' in text and 'and' in text:
+            match = re.search(r'between\s+([^,]+?)\s+and\s+([^,]+?)(?:\s|$)', text)
+            if match:
+                metadata['parties'] = [match.group(1).strip(), match.group(2).strip()]
+        for pattern in [r'effective\s+date[:\s]+([^,\n]+)', r'commencement\s+date[:\s]+([^,\n]+)',
+                        r'start\s+date[:\s]+([^,\n]+)']:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match and not metadata['effective_date']:
+                metadata['effective_date'] = match.group(1).strip()
+        for pattern in [r'governed\s+by\s+the\s+laws\s+of\s+([^,\n]+)', r'governing\s+law[:\s]+([^,\n]+)',
+                        r'applicable\s+law[:\s]+([^,\n]+)']:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match and not metadata['governing_law']:
+                metadata['governing_law'] = match.group(1).strip()
+    return metadata
+
+
+def synthetic_agreement(sections: int, rng: random.Random) -> Dict[str, Any]:
+    """Normalized content shaped like doc_ingest output."""
+    out = []
+    for idx in range(sections):
+        style = rng.choice(NUMBERING).format(a=idx // 20 + 1, b=idx % 20 + 1, c=rng.randint(1, 9))
+        heading = f"{style} {rng.choice(['Definitions', 'Fees', 'Term', 'Liability', 'Notices'])}".strip()
+        lines = rng.sample(FILLER, 3)
+        roll = rng.random()
+        if roll < 0.1:
+            lines.append("Item | Quantity | Price")
+        elif roll < 0.2:
+            lines.append("Setup\tMonthly\tAnnual")
+        elif roll < 0.35:
+            lines.append(f"The service levels are set out in {rng.choice(['Exhibit', 'Schedule', 'attachment'])} "
+                         f"{rng.choice(['A', 'B', '3', '12'])}.")
+        elif roll < 0.45:
+            lines = [", ".join(lines)]  # one long line, no short column-looking lines before the end
+        elif roll < 0.5:
+            lines = ["Reserved."]  # nothing to find
+        elif roll < 0.55:
+            lines = ["Rates:", "\tHourly", "|Daily|"]  # markers without a three-word line
+        if idx < METADATA_SECTIONS:
+            a, b = rng.sample(PARTIES, 2)
+            lines += [f"This Agreement is made between {a} and {b}, together the parties.",
+                      f"Effective Date: {rng.randint(1, 28)} March 2024",
+                      f"This Agreement is governed by the laws of {rng.choice(LAWS)}, without regard to conflicts."]
+        out.append({'heading': heading, 'level': 1 + (style.count('.') if style[:1].isdigit() else 0),
+                    'content': lines})
+    return {'document_type': 'pdf', 'sections': out, 'metadata': {}}
+
+
+def per_section_us(fn: Callable[[], Any], sections: int, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / sections * 1e6
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    normalized = synthetic_agreement(args.sections, random.Random(args.seed))
+    headings = [s['heading'] for s in normalized['sections']]
+    texts = ['\n'.join(s['content']) for s in normalized['sections']]
+    n = len(texts)
+
+    def legacy_classify():
+        return ([legacy_contains_table(t) for t in texts], [legacy_contains_exhibit(t) for t in texts],
+                legacy_metadata(texts))
+
+    def scanner_classify():
+        scans = [scan_section(t, idx < METADATA_SECTIONS) for idx, t in enumerate(texts)]
+        worker = StructureParserWorker.__new__(StructureParserWorker)
+        return scans, worker.extract_metadata([_TextOnly(t) for t in texts], scans)
+
+    legacy_tables, legacy_exhibits, legacy_meta = legacy_classify()
+    scans, meta = scanner_classify()
+    mismatches = {
+        'numbering': sum(legacy_section_number(h) != section_number(h) for h in headings),
+        'tables': sum(a != s.has_table for a, s in zip(legacy_tables, scans)),
+        'exhibits': sum(a != s.has_exhibit for a, s in zip(legacy_exhibits, scans)),
+        'metadata': int({k: meta[k] for k in legacy_meta} != legacy_meta),
+    }
+
+    timings = {
+        'numbering': {
+            'legacy_us': per_section_us(lambda: [legacy_section_number(h) for h in headings], n, args.repeat),
+            'scanner_us': per_section_us(lambda: [section_number(h) for h in headings], n, args.repeat),
+        },
+        'classification': {
+            'legacy_us': per_section_us(legacy_classify, n, args.repeat),
+            'scanner_us': per_section_us(scanner_classify, n, args.repeat),
+        },
+    }
+    for timing in timings.values():
+        timing['speedup'] = timing['legacy_us'] / timing['scanner_us']
+
+    worker = StructureParserWorker.__new__(StructureParserWorker)
+    start = time.perf_counter()
+    structure = worker.build_structure(normalized)
+    build_seconds = time.perf_counter() - start
+
+    return {
+        'sections': n,
+        'python': platform.python_version(),
+        'timings': timings,
+        'build_structure_seconds': build_seconds,
+        'build_structure_us_per_section': build_seconds / n * 1e6,
+        'tables': len(structure['tables']),
+        'exhibits': len(structure['exhibits']),
+        'extracted_metadata': structure['extracted_metadata'],
+        'mismatches': mismatches,
+    }
+
+
+class _TextOnly:
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs; the best is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
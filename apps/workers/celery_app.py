@@ -1,6 +1,7 @@
 # Created automatically by Cursor AI (2024-12-19)
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 import os
 
 # Celery configuration
@@ -24,6 +25,8 @@ celery_app = Celery(
         "app.workers.obligation_extractor",
         "app.workers.report_generator",
         "app.workers.analytics_aggregator",
+        "app.workers.pipeline",
+        "app.workers.bulk_ingest",
     ]
 )
 
@@ -58,5 +61,15 @@ celery_app.conf.beat_schedule = {
     },
 }
 
+
+@worker_process_init.connect
+def preload_models(**kwargs):
+    """Warm the models this worker's queues need in each child process before its first task."""
+    # Comma-separated registry keys, e.g. "sentence-transformer:all-MiniLM-L6-v2,spacy:en_core_web_sm"
+    models = [m.strip() for m in os.getenv("WORKER_PRELOAD_MODELS", "").split(",") if m.strip()]
+    if models:
+        from app.core.model_registry import registry
+        registry.preload(models)
+
 if __name__ == "__main__":
     celery_app.start()
@@ -0,0 +1,7 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import sys
+from pathlib import Path
+
+# Worker tests import the Celery app's `app` package directly
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "apps" / "workers"))
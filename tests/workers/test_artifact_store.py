@@ -0,0 +1,73 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import io
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("prometheus_client")
+
+from botocore.exceptions import ClientError
+
+from app.core.artifact_store import ContentAddressedArtifacts
+
+SHA = "ab" * 32
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects, self.copies = {}, 0
+
+    def _missing(self, key):
+        return ClientError({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self._missing(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        if CopySource["Key"] not in self.objects:
+            raise self._missing(CopySource["Key"])
+        self.copies += 1
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+
+@pytest.fixture
+def artifacts():
+    return ContentAddressedArtifacts(FakeS3(), "bucket")
+
+
+def test_published_stage_is_copied_to_a_later_upload(artifacts):
+    s3 = artifacts.s3_client
+    s3.objects.update({"processed/f1/structure.msgz": b"structure", "processed/f1/extra.json": b"{}"})
+    artifacts.record_source("f1", SHA)
+    artifacts.publish(artifacts.source_hash("f1"), "structure@4", "f1", ["structure.msgz"], {"sections_count": 3})
+
+    assert artifacts.reuse(SHA, "structure@4", "f2", ["structure.msgz"]) == {"sections_count": 3}
+    assert s3.objects["processed/f2/structure.msgz"] == b"structure"
+    assert "processed/f2/extra.json" not in s3.objects
+
+
+def test_stage_without_a_summary_is_a_miss(artifacts):
+    s3 = artifacts.s3_client
+    # A publish that died after copying its files but before writing the summary
+    s3.objects[f"artifacts/by-hash/{SHA}/structure@4/structure.msgz"] = b"structure"
+
+    assert artifacts.reuse(SHA, "structure@4", "f2", ["structure.msgz"]) is None
+    assert s3.copies == 0 and "processed/f2/structure.msgz" not in s3.objects
+
+
+def test_stage_names_and_missing_hashes_never_share_artifacts(artifacts):
+    s3 = artifacts.s3_client
+    s3.objects["processed/f1/clause_matches.json"] = b"[]"
+    artifacts.publish(SHA, "match@lib-a", "f1", ["clause_matches.json"], {"matches_count": 0})
+    artifacts.publish(None, "match@lib-b", "f1", ["clause_matches.json"], {"matches_count": 0})
+
+    assert artifacts.reuse(SHA, "match@lib-b", "f2", ["clause_matches.json"]) is None
+    assert artifacts.reuse(None, "match@lib-a", "f2", ["clause_matches.json"]) is None
+    assert artifacts.source_hash("f2") is None
+    assert not any(key.startswith("artifacts/by-hash/None") for key in s3.objects)
@@ -0,0 +1,30 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("httpx")
+
+WORKERS_DIR = Path(__file__).resolve().parents[2] / "apps" / "workers"
+
+
+def test_clause_matching_benchmark_runs_on_a_tiny_corpus():
+    # A fresh interpreter: the benchmark configures the worker through the environment before importing it
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.clause_matching_benchmark", "--agreements", "1", "--sections", "12",
+         "--clauses", "40", "--embedder", "hash", "--index", "exact"],
+        cwd=WORKERS_DIR, capture_output=True, text=True, timeout=300,
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+
+    # Worker logs may precede the indented JSON report
+    lines = completed.stdout.splitlines()
+    report = json.loads("\n".join(lines[lines.index("{"):]))
+    assert report["cascade"]["pairs_total"] == 12 * 40
+    assert report["matches"] > 0 and report["top1_accuracy"] is not None
+    assert report["llm_calls"] == report["cascade"]["llm_calls"]
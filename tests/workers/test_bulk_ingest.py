@@ -0,0 +1,214 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("mammoth")
+pytest.importorskip("fitz")
+
+from celery.exceptions import SoftTimeLimitExceeded
+
+from app.workers import bulk_ingest
+from app.workers.bulk_ingest import _REFRESH_LOCK, _RELEASE_LOCK, BulkIngestWorker
+
+
+class FakeS3:
+    exceptions = SimpleNamespace(NoSuchKey=KeyError)
+
+    def __init__(self):
+        self.objects, self.gets = {}, 0
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        self.gets += 1
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = self.objects.get(CopySource["Key"], b"")
+
+    def get_paginator(self, name):
+        return SimpleNamespace(paginate=lambda Bucket, Prefix, **kwargs: [
+            {"Contents": [{"Key": key} for key in sorted(self.objects) if key.startswith(Prefix)]}
+        ])
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values, self.hashes = {}, {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def eval(self, script, numkeys, key, job_id, *args):
+        if self.values.get(key) != job_id:
+            return 0
+        if script == _RELEASE_LOCK:
+            del self.values[key]
+        return 1 if script in (_REFRESH_LOCK, _RELEASE_LOCK) else 0
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hvals(self, key):
+        return list(self.hashes.get(key, {}).values())
+
+    def expire(self, key, seconds):
+        return True
+
+    def pipeline(self):
+        return SimpleNamespace(hset=self.hset, expire=self.expire, execute=lambda: None)
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    worker = BulkIngestWorker.__new__(BulkIngestWorker)
+    worker.s3_client, worker.bucket_name, worker.redis = FakeS3(), "bucket", FakeRedis()
+    monkeypatch.setattr(bulk_ingest, "BulkIngestWorker", lambda: worker)
+    return worker
+
+
+def _job(worker, job_id, files, chunk_size=3, lanes=1, org_id="acme"):
+    entries = iter({"key": f"imports/{name}.pdf", "agreement_id": None} for name in files)
+    totals = worker.write_chunks(job_id, entries, chunk_size)
+    worker.write_job_json(f"{worker.job_prefix(job_id)}/manifest.json",
+                          {"org_id": org_id, "lanes": lanes, "started_at": 0.0, **totals})
+
+
+def _ingest(monkeypatch, worker, outcomes):
+    """Stub document ingestion; ``outcomes`` maps a source file name to the exception it raises."""
+    ingested = []
+
+    def run(file_id, agreement_id):
+        name = next(e["key"] for e in _inputs(worker) if e["file_id"] == file_id)[len("imports/"):-len(".pdf")]
+        ingested.append(name)
+        if name in outcomes:
+            raise outcomes.pop(name)
+        return {"dedup": {"hit": False}}
+
+    monkeypatch.setattr(bulk_ingest.ingest_document, "run", run)
+    return ingested
+
+
+def _inputs(worker):
+    return [entry for key, body in worker.s3_client.objects.items() if key.endswith("/input.json")
+            for entry in json.loads(body)["files"]]
+
+
+def _states(status):
+    return sorted(state["status"] for state in status["files"].values())
+
+
+def test_chunk_checkpoints_each_file_and_retries_only_unfinished_ones(worker, monkeypatch):
+    _job(worker, "j1", ["a", "b", "c"])
+    ingested = _ingest(monkeypatch, worker, {"b": RuntimeError("corrupt PDF")})
+
+    status, finished = worker.ingest_chunk("j1", 0)
+    assert finished and ingested == ["a", "b", "c"]
+    assert (status["files_done"], status["files_failed"], _states(status)) == (2, 1, ["done", "done", "failed"])
+
+    progress = worker.progress("j1")
+    assert (progress["files_done"], progress["files_failed"], progress["files_pending"]) == (2, 1, 0)
+    assert [f["error"] for f in progress["failures"]] == ["corrupt PDF"]
+
+    status, _ = worker.ingest_chunk("j1", 0)
+    assert ingested == ["a", "b", "c", "b"] and status["files_done"] == 3
+    assert worker.chunk_done(status) and worker.progress("j1")["failures"] == []
+
+
+def test_file_left_started_by_a_lost_worker_is_failed_not_rerun(worker, monkeypatch):
+    _job(worker, "j1", ["a", "b"])
+    ingested = _ingest(monkeypatch, worker, {})
+    file_id = _inputs(worker)[0]["file_id"]
+    worker.write_job_json("jobs/bulk_ingest/j1/chunks/0/status.json", {
+        "chunk_idx": 0, "files_total": 2, "files_done": 0, "files_failed": 0, "updated_at": 0.0,
+        "files": {file_id: {"status": "started", "key": "imports/a.pdf"}}
+    })
+
+    status, finished = worker.ingest_chunk("j1", 0)
+
+    assert finished and ingested == ["b"]
+    assert status["files"][file_id]["error"] == "worker lost while ingesting this file"
+
+
+def test_time_limited_chunk_hands_off_without_retrying_the_slow_file(worker, monkeypatch):
+    _job(worker, "j1", ["a", "b", "c", "d"], chunk_size=3)
+    ingested = _ingest(monkeypatch, worker, {"b": SoftTimeLimitExceeded()})
+    dispatched = []
+    monkeypatch.setattr(bulk_ingest.bulk_ingest_chunk, "apply_async", lambda args, queue: dispatched.append(args))
+    worker.redis.set("bulk_ingest:org:acme", "j1")
+
+    bulk_ingest.bulk_ingest_chunk.run("j1", 0)
+    assert ingested == ["a", "b"] and dispatched == [("j1", 0, False)]
+
+    bulk_ingest.bulk_ingest_chunk.run(*dispatched[-1])
+    assert ingested == ["a", "b", "c"] and dispatched[-1] == ("j1", 1)
+    assert worker.progress("j1")["files_failed"] == 1
+
+    # Every file ran or failed once the lane's last chunk ends, which frees the org for the next import
+    bulk_ingest.bulk_ingest_chunk.run(*dispatched[-1])
+    assert ingested == ["a", "b", "c", "d"] and worker.redis.get("bulk_ingest:org:acme") is None
+
+
+def test_lane_heads_are_the_first_unfinished_chunk_of_each_lane(worker, monkeypatch):
+    _job(worker, "j1", list("abcdefghij"), chunk_size=2, lanes=2)
+    _ingest(monkeypatch, worker, {})
+    manifest = worker.read_job_json("jobs/bulk_ingest/j1/manifest.json")
+    assert worker.lane_heads("j1", manifest) == [0, 1]
+
+    for chunk_idx in (0, 2, 1):
+        worker.ingest_chunk("j1", chunk_idx)
+    assert worker.lane_heads("j1", manifest) == [4, 3]
+
+    for chunk_idx in (3, 4):
+        worker.ingest_chunk("j1", chunk_idx)
+    assert worker.lane_heads("j1", manifest) == []
+
+
+def test_org_lock_is_taken_over_only_from_a_job_with_nothing_pending(worker, monkeypatch):
+    _ingest(monkeypatch, worker, {})
+    _job(worker, "old", ["a"])
+    worker.redis.set("bulk_ingest:org:acme", "old")
+
+    assert worker.acquire_org_lock("acme", "new") == "old"
+    assert worker.acquire_org_lock("acme", "old") is None
+
+    worker.ingest_chunk("old", 0)
+    assert worker.acquire_org_lock("acme", "new") is None
+    assert worker.redis.get("bulk_ingest:org:acme") == "new"
+
+
+def test_progress_reads_redis_counters_and_rebuilds_them_from_s3(worker, monkeypatch):
+    _job(worker, "j1", list("abcdef"), chunk_size=2)
+    _ingest(monkeypatch, worker, {"e": RuntimeError("encrypted")})
+    for chunk_idx in range(3):
+        worker.ingest_chunk("j1", chunk_idx)
+
+    gets = worker.s3_client.gets
+    assert worker.progress("j1")["files_done"] == 5
+    assert worker.s3_client.gets == gets + 1  # the manifest only
+
+    worker.redis.hashes.clear()
+    progress = worker.progress("j1")
+    assert (progress["files_done"], progress["files_failed"], progress["files_pending"]) == (5, 1, 0)
+    assert len(worker.redis.hvals("bulk_ingest:progress:j1")) == 3
+
+
+def test_requested_concurrency_is_capped_per_org(worker, monkeypatch):
+    worker.s3_client.objects.update({f"imports/{name}.pdf": b"%PDF" for name in "abcdef"})
+    monkeypatch.setattr(bulk_ingest.bulk_ingest_chunk, "apply_async", lambda args, queue: None)
+
+    result = bulk_ingest.bulk_ingest.run("acme", prefix="imports/", job_id="j1", chunk_size=1, concurrency=50)
+
+    assert result["lanes"] == bulk_ingest.BULK_INGEST_ORG_CONCURRENCY
@@ -0,0 +1,55 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from app.core.cache import DiskCacheBackend, ProcessLRU
+
+
+def _rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+
+def test_caps_hold_across_short_lived_backends(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    backends, writes = 20, 32  # 640 writes in all, a multiple of evict_every
+
+    for b in range(backends):
+        # A fresh backend per task, as cache_from_env builds one in every worker __init__
+        backend = DiskCacheBackend(path, max_entries=10)
+        for w in range(writes):
+            backend.set(f"{b}:{w}", b"x" * 10)
+
+    assert backends * writes % DiskCacheBackend.evict_every == 0
+    assert _rows(path)[0] == 10
+    assert DiskCacheBackend(path).get(f"{backends - 1}:{writes - 1}") is not None
+
+
+def test_byte_cap_and_ttl_are_applied_by_any_backend(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    DiskCacheBackend(path).set("stale", b"x")
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE entries SET created_at = ?", (time.time() - 3600,))
+
+    for b in range(DiskCacheBackend.evict_every - 1):
+        DiskCacheBackend(path, max_bytes=1000, ttl_seconds=60).set(f"k{b}", b"y" * 100)
+
+    count, size = _rows(path)
+    assert size <= 1000 and count == 10
+    assert DiskCacheBackend(path).get("stale") is None
+
+
+def test_process_lru_keeps_the_most_recently_used():
+    loaded = ProcessLRU(2)
+    loaded.put("v1", "index 1")
+    loaded.put("v2", "index 2")
+    loaded.get("v1")
+    loaded.put("v3", "index 3")
+
+    assert len(loaded) == 2
+    assert loaded.get("v2") is None and loaded.get("v1") == "index 1"
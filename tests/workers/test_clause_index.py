@@ -0,0 +1,34 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import numpy as np
+import pytest
+
+from app.core.clause_index import ClauseIndex, build_clause_index
+
+
+def _library(n=64, dim=16):
+    matrix = np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix, [{"id": f"c{i}", "category": "general", "jurisdiction": "general"} for i in range(n)]
+
+
+def test_loaded_index_searches_with_the_configured_n_probe(tmp_path):
+    matrix, clauses = _library()
+    build_clause_index("ivf_flat", matrix, clauses, n_lists=8, n_probe=2).save(str(tmp_path))
+
+    assert ClauseIndex.load(str(tmp_path)).n_probe == 2
+    loaded = ClauseIndex.load(str(tmp_path), n_probe=8)
+    assert loaded.n_probe == 8
+
+    # Probing every list is an exhaustive search
+    rows, _ = loaded.search(matrix[:4], k=1)
+    assert rows[:, 0].tolist() == [0, 1, 2, 3]
+
+
+def test_exact_index_ignores_n_probe_and_base_index_is_abstract(tmp_path):
+    matrix, clauses = _library()
+    build_clause_index("exact", matrix, clauses).save(str(tmp_path))
+
+    assert ClauseIndex.load(str(tmp_path), n_probe=4).kind == "exact"
+    with pytest.raises(TypeError):
+        ClauseIndex()
@@ -0,0 +1,76 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("httpx")
+
+from app.core.cache import DiskCacheBackend, KeyValueCache
+from app.core.llm_executor import LLMExecutor, OpenAIProvider
+from app.workers.clause_matcher import CascadeStats, ClauseMatcherWorker
+
+LIBRARY = [{"id": "c1", "text": "Liability is capped at the fees paid."}]
+
+
+def _worker(tmp_path, providers=()):
+    worker = ClauseMatcherWorker.__new__(ClauseMatcherWorker)
+    worker.llm_executor = LLMExecutor(list(providers))
+    worker.section_match_cache = KeyValueCache("section_matches", DiskCacheBackend(str(tmp_path / "matches.sqlite3")))
+    worker.embedding_backend = SimpleNamespace(key="test-model")
+    worker.cascade_stats = CascadeStats()
+    return worker
+
+
+def _candidate(pre_score):
+    return {"clause": LIBRARY[0], "semantic_score": pre_score, "rule_score": pre_score, "rule_reasoning": "",
+            "pre_score": pre_score, "needs_llm": False, "llm_missing": False, "llm_result": None}
+
+
+def test_results_missing_llm_answers_are_recomputed(tmp_path, monkeypatch):
+    worker = _worker(tmp_path)
+    structure = {"sections": [{"id": "s1", "text": "In the band."}, {"id": "s2", "text": "Clear reject."}]}
+    calls = []
+
+    def match_sections(sections, *args):
+        calls.append([s["id"] for s in sections])
+        shortlists = [[_candidate(0.5)], [_candidate(0.1)]][-len(sections):]
+        for shortlist in shortlists:
+            worker._shortlist(shortlist)
+        return [{"match": None, "llm_complete": not any(c["llm_missing"] for c in shortlist)}
+                for shortlist in shortlists]
+
+    monkeypatch.setattr(worker, "_match_sections", match_sections)
+    worker.match_clauses(structure, LIBRARY)
+    assert worker.reuse_stats["sections_uncached"] == 1
+
+    worker.match_clauses(structure, LIBRARY)
+    assert calls == [["s1", "s2"], ["s1"]]
+
+
+def test_llm_providers_are_part_of_the_result_key(tmp_path):
+    offline, online = _worker(tmp_path), _worker(tmp_path, [OpenAIProvider("key", "gpt-4", "http://localhost")])
+
+    assert offline.llm_key == "no-llm" and online.llm_key == "openai/gpt-4"
+    assert offline.match_stage(LIBRARY, None) != online.match_stage(LIBRARY, None)
+
+
+def _scored(clause_id, pre_score, llm_result=None):
+    return {**_candidate(pre_score), "clause": {"id": clause_id, "text": ""}, "llm_result": llm_result}
+
+
+def test_mixed_shortlist_is_ranked_on_one_final_score_scale(tmp_path):
+    worker = _worker(tmp_path)
+    accepted = _scored("accepted", 0.72)
+    lifted = _scored("lifted", 0.70, {"confidence": 1.0, "position": "preferred"})
+    lowered = _scored("lowered", 0.71, {"confidence": 0.2})
+    failed = _scored("failed", 0.713, {"confidence": 0.0, "reasoning": "LLM analysis failed: 503", "failed": True})
+
+    scores = [worker._final_score(c) for c in (accepted, lifted, lowered, failed)]
+    assert scores == pytest.approx([0.72, 0.79, 0.557, 0.713])
+
+    best = worker._best_candidate([accepted, lowered, failed, lifted])
+    assert (best["clause"]["id"], best["position"]) == ("lifted", "preferred")
+    # Without an LLM answer the pre-score stands in for it, rather than a zero LLM score
+    assert worker._best_candidate([failed, lowered])["clause"]["id"] == "failed"
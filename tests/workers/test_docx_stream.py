@@ -0,0 +1,89 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import pytest
+
+docx = pytest.importorskip("docx")
+from docx.enum.text import WD_BREAK
+from docx.oxml import OxmlElement
+pytest.importorskip("fitz")
+pytest.importorskip("mammoth")
+
+from app.core.docx_stream import iter_docx
+from app.workers.doc_ingest import DocumentIngestWorker
+
+
+@pytest.fixture
+def agreement_docx(tmp_path):
+    document = docx.Document()
+    document.add_heading("Master Services Agreement", level=0)
+    document.add_paragraph("This Agreement is made between the Supplier and the Customer.")
+    document.add_heading("1. Definitions", level=1)
+    document.add_paragraph("")
+    paragraph = document.add_paragraph("Services\tmeans the services described in ")
+    paragraph.add_run("Schedule 1").bold = True
+    paragraph.add_run().add_break()
+    paragraph.add_run("as amended from time to time.")
+    document.add_heading("1.1 Interpretation", level=2)
+    document.add_paragraph("Headings do not affect interpretation.", style="List Bullet")
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "Fee", "Amount"
+    table.cell(1, 0).text, table.cell(1, 1).text = "Setup", "10,000"
+    document.add_heading("1.1.1 Precedence", level=3)
+    document.add_paragraph("Schedules prevail over the body of this Agreement.")
+
+    path = tmp_path / "agreement.docx"
+    document.save(str(path))
+    return str(path)
+
+
+def test_streamed_sections_match_python_docx_normalization(agreement_docx):
+    worker = DocumentIngestWorker()
+    expected = worker.normalize_document(worker.extract_text_from_docx(agreement_docx))
+
+    metadata = worker.new_metadata()
+    sections = list(worker.iter_docx_sections(iter_docx(agreement_docx), metadata))
+
+    assert sections == expected["sections"]
+    assert metadata == expected["metadata"]
+    assert [s["level"] for s in sections] == [1, 1, 2, 3]
+
+
+def test_reader_yields_paragraphs_and_table_rows_in_document_order(agreement_docx):
+    elements = list(iter_docx(agreement_docx))
+
+    assert elements[0] == {"kind": "paragraph", "text": "Master Services Agreement", "style": "Title"}
+    assert elements[4]["text"] == "Services\tmeans the services described in Schedule 1\nas amended from time to time."
+    rows = [e for e in elements if e["kind"] == "table_row"]
+    assert rows == [
+        {"kind": "table_row", "table": 0, "cells": ["Fee", "Amount"]},
+        {"kind": "table_row", "table": 0, "cells": ["Setup", "10,000"]},
+    ]
+    assert elements.index(rows[0]) == 7
+
+
+def test_page_breaks_map_section_text_to_pages(tmp_path):
+    document = docx.Document()
+    document.add_heading("1. Scope", level=1)
+    document.add_paragraph("Scope applies.").add_run().add_break(WD_BREAK.PAGE)
+    # Word marks the top of the page after a hard break as rendered too; that is the same page
+    after_hard = document.add_paragraph()
+    after_hard.add_run()._r.append(OxmlElement("w:lastRenderedPageBreak"))
+    after_hard.add_run("Still scope.")
+    document.add_heading("2. Term", level=1)
+    flowed = document.add_paragraph("The term starts ")
+    flowed.add_run()._r.append(OxmlElement("w:lastRenderedPageBreak"))
+    flowed.add_run("on signature.")
+    path = tmp_path / "paged.docx"
+    document.save(str(path))
+
+    worker = DocumentIngestWorker()
+    metadata = worker.new_metadata()
+    sections = list(worker.iter_docx_sections(iter_docx(str(path)), metadata))
+    expected = worker.normalize_document(worker.extract_text_from_docx(str(path)))
+
+    assert [(s["page_from"], s["page_to"], s["page_breaks"]) for s in sections] == [
+        (1, 2, [[14, 2]]),
+        (2, 3, [[len("The term starts "), 3]]),
+    ]
+    assert metadata["paginated"] and metadata["total_pages"] == 3
+    assert sections == expected["sections"]
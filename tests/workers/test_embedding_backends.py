@@ -0,0 +1,59 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from app.core.embedding_backends import OnnxEmbeddingBackend, SentenceTransformerBackend
+
+MODEL_NAME = os.getenv("EMBEDDING_PARITY_MODEL", "all-MiniLM-L6-v2")
+
+# Minimum per-clause cosine between int8 ONNX and PyTorch embeddings
+MIN_COSINE = 0.97
+MEAN_COSINE = 0.99
+
+CLAUSES = [
+    "In no event shall either party be liable for any indirect, incidental, special, consequential, or punitive damages.",
+    "Either party may terminate this agreement upon thirty (30) days written notice to the other party.",
+    "Each party shall comply with applicable data protection laws and regulations.",
+    "This Agreement shall be governed by and construed in accordance with the laws of the State of New York.",
+    "Neither party shall be liable for any failure or delay in performance due to causes beyond its reasonable control.",
+    "The Receiving Party shall hold the Confidential Information in strict confidence and shall not disclose it to any third party.",
+    "Customer shall pay all undisputed invoices within forty-five (45) days of receipt.",
+    "Supplier shall indemnify, defend and hold harmless Customer from any third-party claims arising out of Supplier's negligence.",
+    "Neither party may assign this Agreement without the prior written consent of the other party.",
+    "All intellectual property rights in the Deliverables shall vest in Customer upon payment in full.",
+    "Schedule",
+    "1.",
+]
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def embeddings(tmp_path_factory):
+    torch_backend = SentenceTransformerBackend(MODEL_NAME)
+    onnx_backend = OnnxEmbeddingBackend(MODEL_NAME, str(tmp_path_factory.mktemp("onnx")), quantize=True, intra_op_threads=1)
+    return _unit(torch_backend.encode(CLAUSES)), _unit(onnx_backend.encode(CLAUSES, batch_size=4))
+
+
+def test_onnx_int8_embeddings_agree_with_torch(embeddings):
+    torch_embeddings, onnx_embeddings = embeddings
+    cosines = (torch_embeddings * onnx_embeddings).sum(axis=1)
+
+    assert cosines.min() >= MIN_COSINE, cosines
+    assert cosines.mean() >= MEAN_COSINE, cosines
+
+
+def test_onnx_int8_preserves_nearest_clause(embeddings):
+    torch_embeddings, onnx_embeddings = embeddings
+    torch_neighbours = np.argsort(-(torch_embeddings @ torch_embeddings.T), axis=1)[:, 1]
+    onnx_neighbours = np.argsort(-(onnx_embeddings @ onnx_embeddings.T), axis=1)[:, 1]
+
+    assert (torch_neighbours == onnx_neighbours).mean() >= 0.9
@@ -0,0 +1,89 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import json
+import threading
+import time
+
+import numpy as np
+
+from app.core import embedding_store
+from app.core.embedding_store import ClauseEmbeddingStore
+
+
+def _clauses(*ids, edited=()):
+    return [{"id": clause_id, "text": f"Clause {clause_id}{' (edited)' if clause_id in edited else ''}"}
+            for clause_id in ids]
+
+
+class Encoder:
+    """Deterministic embeddings per text that record what they were asked to encode."""
+
+    def __init__(self, delay=0.0):
+        self.calls, self.delay = [], delay
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return np.array([[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts], dtype=np.float32)
+
+
+def test_sync_encodes_only_new_or_edited_clauses(tmp_path, monkeypatch):
+    store, encode = ClauseEmbeddingStore(str(tmp_path), "model"), Encoder()
+    first = store.sync(_clauses("a", "b"), encode)
+
+    loads = []
+    monkeypatch.setattr(embedding_store.json, "load", lambda f: loads.append(f) or json.loads(f.read()))
+    assert np.array_equal(store.sync(_clauses("a", "b"), encode), first)
+    assert loads == []  # an unchanged index is not parsed again
+
+    matrix = store.sync(_clauses("a", "b", "c", edited={"b"}), encode)
+    assert encode.calls == [["Clause a", "Clause b"], ["Clause b (edited)", "Clause c"]]
+    assert np.array_equal(matrix, encode(["Clause a", "Clause b (edited)", "Clause c"]))
+
+
+def test_other_processes_pick_up_a_published_generation(tmp_path):
+    writer, encode = ClauseEmbeddingStore(str(tmp_path), "model"), Encoder()
+    writer.sync(_clauses("a"), encode)
+    reader = ClauseEmbeddingStore(str(tmp_path), "model")
+    mapped = reader.matrix
+
+    writer.sync(_clauses("a", "b"), encode)
+    assert reader.sync(_clauses("a", "b"), encode).shape == (2, 3)
+    assert len(encode.calls) == 2
+    # The generation the reader had mapped before the swap is still readable
+    assert np.array_equal(mapped, writer.rows_for(["a"]))
+
+
+def test_whole_library_sync_drops_removed_clauses(tmp_path):
+    store, encode = ClauseEmbeddingStore(str(tmp_path), "model"), Encoder()
+    store.sync(_clauses("a", "b", "c"), encode)
+    version = store.library_version
+
+    # A subset (a re-match's changed clauses) never removes anything
+    store.sync(_clauses("c"), encode)
+    assert store.matrix.shape[0] == 3
+
+    matrix = store.sync(_clauses("a", "c", "d"), encode, prune=True)
+    assert store.matrix.shape[0] == 3 and store.library_version != version
+    assert np.array_equal(matrix, encode(["Clause a", "Clause c", "Clause d"]))
+    assert encode.calls[1] == ["Clause d"]
+
+    store.sync(_clauses("d"), encode, prune=True)
+    assert store.matrix.shape[0] == 1
+    assert sorted(p.name for p in tmp_path.glob("model/embeddings-*.npy")) == ["embeddings-1.npy", "embeddings-2.npy"]
+
+
+def test_concurrent_syncs_publish_one_generation(tmp_path):
+    encode = Encoder(delay=0.05)
+    stores = [ClauseEmbeddingStore(str(tmp_path), "model") for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda s=store: results.append(s.sync(_clauses("a", "b"), encode)))
+               for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(encode.calls) == 1
+    assert all(np.array_equal(result, results[0]) for result in results)
+    assert {store._generation for store in stores} == {0}
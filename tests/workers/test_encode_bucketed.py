@@ -0,0 +1,56 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import numpy as np
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from app.core.embedding_backends import HashEmbeddingBackend, encode_bucketed
+
+
+def _unit(matrix):
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+class RecordingBackend(HashEmbeddingBackend):
+    """Hash embeddings that record each batch ``encode_bucketed`` sends."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        return super().encode(texts, batch_size)
+
+
+def test_bucketed_rows_match_unbucketed_encode_in_input_order():
+    texts = [" ".join(f"w{i}" for i in range(n)) for n in (40, 3, 17, 3, 60, 8, 25, 1)]
+    backend = RecordingBackend(max_seq_length=128)
+
+    embeddings, stats = encode_bucketed(backend, texts, token_budget=64)
+
+    assert np.allclose(_unit(embeddings), _unit(HashEmbeddingBackend().encode(texts)), atol=1e-6)
+    assert stats.windows == len(texts) and stats.windowed_texts == 0
+    assert 1 < stats.batches == len(backend.batches) < len(texts)
+    # A batch padded to its longest input stays inside the budget unless one input alone exceeds it
+    for batch in backend.batches:
+        lengths = [len(text.split()) for text in batch]
+        assert lengths == sorted(lengths)
+        assert len(batch) == 1 or len(batch) * max(lengths) <= 64
+
+
+def test_long_text_is_encoded_as_token_weighted_windows():
+    backend = HashEmbeddingBackend(max_seq_length=10)
+    long_text = " ".join(f"term{i}" for i in range(25))
+
+    embeddings, stats = encode_bucketed(backend, [long_text, "short clause"], window_stride=2)
+
+    # Windows of 10 tokens starting every 8 tokens: 0-9, 8-17, 16-24
+    words = long_text.split()
+    windows = [" ".join(words[start:start + 10]) for start in (0, 8, 16)]
+    expected = (_unit(backend.encode(windows)) * np.array([[10], [10], [9]], dtype=np.float32)).sum(axis=0)
+
+    assert (stats.windows, stats.windowed_texts) == (4, 1)
+    assert np.allclose(embeddings[0], expected, atol=1e-5)
+    assert np.allclose(_unit(embeddings[1:]), _unit(backend.encode(["short clause"])), atol=1e-6)
@@ -0,0 +1,153 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from app.core.llm_executor import (
+    AnthropicProvider, LLMExecutor, LLMProvider, LLMProviderError, OpenAIProvider, RateBudget
+)
+
+
+class FakeLLMServer:
+    """Local OpenAI/Anthropic-shaped endpoint with injected latency and scripted failures."""
+
+    def __init__(self, latency: float = 0.0, failures: int = 0, failure_status: int = 429):
+        self.latency = latency
+        self.failures = failures
+        self.failure_status = failure_status
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    fail = server.failures > 0
+                    server.failures -= fail
+                try:
+                    time.sleep(server.latency)
+                    if fail:
+                        self._reply(server.failure_status, {"error": "injected"}, {"Retry-After": "0"})
+                    elif self.path == "/chat/completions":
+                        content = f"openai:{body['messages'][0]['content']}"
+                        self._reply(200, {"choices": [{"message": {"content": content}}]})
+                    else:
+                        self._reply(200, {"content": [{"text": f"anthropic:{body['messages'][0]['content']}"}]})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _executor(*providers, concurrency=4, max_retries=3):
+    return LLMExecutor(list(providers), concurrency=concurrency, max_retries=max_retries,
+                       backoff_base=0.01, backoff_max=0.05, timeout=5)
+
+
+def test_runs_prompts_concurrently_up_to_the_limit():
+    with FakeLLMServer(latency=0.2) as server:
+        executor = _executor(OpenAIProvider("key", "gpt", server.url), concurrency=4)
+        start = time.perf_counter()
+        results = executor.run_all([f"prompt {i}" for i in range(12)])
+        elapsed = time.perf_counter() - start
+
+    assert [r.text for r in results] == [f"openai:prompt {i}" for i in range(12)]
+    assert server.max_in_flight == 4
+    # Three waves of four (0.6s), not twelve sequential calls (2.4s)
+    assert elapsed < 0.2 * 12 / 2
+
+
+def test_retries_rate_limited_requests():
+    with FakeLLMServer(failures=2) as server:
+        results = _executor(OpenAIProvider("key", "gpt", server.url), concurrency=1).run_all(["hello"])
+
+    assert results[0].text == "openai:hello"
+    assert results[0].attempts == 3
+    assert server.requests == 3
+
+
+def test_falls_back_to_next_provider_after_retries_are_exhausted():
+    with FakeLLMServer(failures=100, failure_status=503) as failing, FakeLLMServer() as healthy:
+        executor = _executor(OpenAIProvider("key", "gpt", failing.url), AnthropicProvider("key", "claude", healthy.url),
+                             max_retries=2)
+        result = executor.run_all(["hello"])[0]
+
+    assert (result.provider, result.model, result.text) == ("anthropic", "claude", "anthropic:hello")
+    assert failing.requests == 3
+
+
+def test_non_retryable_errors_are_not_retried_and_are_returned_in_place():
+    with FakeLLMServer(failures=100, failure_status=401) as server:
+        results = _executor(OpenAIProvider("key", "gpt", server.url), max_retries=3).run_all(["hello"])
+
+    assert isinstance(results[0], LLMProviderError)
+    assert not results[0].retryable
+    assert server.requests == 1
+
+
+def test_rate_budget_waits_for_refill():
+    async def drain_then_acquire():
+        budget = RateBudget(per_minute=600)
+        await budget.acquire(600)
+        start = time.perf_counter()
+        await budget.acquire(2)  # 600 per minute refills 10 per second
+        return time.perf_counter() - start
+
+    assert 0.15 < asyncio.run(drain_then_acquire()) < 1.0
+
+
+def test_rate_budgets_carry_over_between_batches_and_executors():
+    with FakeLLMServer() as server:
+        def provider():
+            return OpenAIProvider("shared-key", "gpt", server.url, tokens_per_minute=6000)
+
+        _executor(provider()).run_all(["x"], max_tokens=6000)  # drains the bucket
+        start = time.perf_counter()
+        # A new executor and event loop, as in the next task: 6000 per minute refills 100 per second
+        _executor(provider()).run_all(["x"], max_tokens=20)
+
+    assert 0.15 < time.perf_counter() - start < 1.0
+
+
+def test_providers_must_implement_request_and_parse():
+    class Incomplete(LLMProvider):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete("key", "model", "http://localhost")
@@ -0,0 +1,65 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import hashlib
+from concurrent.futures import Future
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("mammoth")
+
+from app.core.cache import DiskCacheBackend, KeyValueCache
+from app.workers.doc_ingest import DocumentIngestWorker
+
+
+class StubOCRPool:
+    """Finishes every page at once with text derived from the rendered image."""
+
+    workers = 1
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, image_bytes, args=()):
+        self.submitted += 1
+        future = Future()
+        future.set_result((f"OCR {hashlib.sha256(image_bytes).hexdigest()[:8]}", 0.5))
+        return future
+
+
+def _scanned_pdf(path):
+    """Image-only pages: two identical scans, one different scan and a text page."""
+    doc = fitz.open()
+    for width in (300, 300, 350, None):
+        page = doc.new_page(width=612, height=792)
+        if width is None:
+            page.insert_text((72, 72), "SCHEDULE 1. The Supplier shall deliver the Services.", fontsize=11)
+        else:
+            page.draw_rect(fitz.Rect(50, 50, 50 + width, 200), color=(0, 0, 0), fill=(0, 0, 0))
+    doc.save(str(path))
+    doc.close()
+
+
+def _worker(tmp_path):
+    worker = DocumentIngestWorker.__new__(DocumentIngestWorker)
+    worker.ocr_cache = KeyValueCache("ocr_pages", DiskCacheBackend(str(tmp_path / "ocr.sqlite3")))
+    return worker
+
+
+def test_repeated_scans_are_served_from_the_ocr_cache(tmp_path):
+    pdf_path = tmp_path / "scanned.pdf"
+    _scanned_pdf(pdf_path)
+
+    pool = StubOCRPool()
+    first = list(_worker(tmp_path).iter_pdf_pages(str(pdf_path), pool))
+    assert pool.submitted == 2
+    assert [(p["ocr"], p.get("ocr_cached")) for p in first] == [(True, False), (True, True), (True, False), (False, None)]
+    assert first[0]["text"] == first[1]["text"] != first[2]["text"]
+    assert first[1]["ocr_seconds"] is None
+
+    # A later document (and a fresh worker process) sharing those pages never OCRs them again
+    pool = StubOCRPool()
+    second = list(_worker(tmp_path).iter_pdf_pages(str(pdf_path), pool))
+    assert pool.submitted == 0
+    assert all(p["ocr_cached"] for p in second[:3])
+    assert [p["text"] for p in second] == [p["text"] for p in first]
@@ -0,0 +1,29 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from app.core.ocr import triage_page
+
+
+def _page(doc):
+    return doc.new_page(width=612, height=792)
+
+
+def test_sparse_text_page_is_not_mistaken_for_a_logo():
+    # A signature page: two full-width 11pt lines cover well under OCR_LOGO_MAX_AREA of the page
+    doc = fitz.open()
+    page = _page(doc)
+    page.insert_text((72, 400), "IN WITNESS WHEREOF the parties have executed this Agreement as of the date first", fontsize=11)
+    page.insert_text((72, 416), "written above by their duly authorised representatives named below.", fontsize=11)
+
+    assert triage_page(page, 1).decision == "text"
+
+
+def test_small_compact_mark_is_a_logo():
+    doc = fitz.open()
+    page = _page(doc)
+    page.draw_rect(fitz.Rect(72, 72, 152, 122), color=(0, 0, 0), fill=(0, 0, 0))
+
+    assert triage_page(page, 1).decision == "logo"
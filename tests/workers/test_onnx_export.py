@@ -0,0 +1,37 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from app.core import embedding_backends
+from app.core.embedding_backends import FP32_MODEL_FILE, ensure_onnx_model
+
+
+def test_concurrent_workers_export_the_model_once(tmp_path, monkeypatch):
+    exports = []
+
+    def export_onnx_model(model_name, model_dir):
+        exports.append(model_name)
+        tmp_file = model_dir / f"{FP32_MODEL_FILE}.tmp"
+        tmp_file.write_bytes(b"onnx")
+        time.sleep(0.05)  # a second writer of the same .tmp file would interleave here
+        tmp_file.replace(model_dir / FP32_MODEL_FILE)
+
+    monkeypatch.setattr(embedding_backends, "export_onnx_model", export_onnx_model)
+    paths = []
+    threads = [
+        threading.Thread(target=lambda: paths.append(ensure_onnx_model("m", tmp_path / "m", quantize=False)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert exports == ["m"]
+    assert paths == [tmp_path / "m" / FP32_MODEL_FILE] * 4
+    assert (tmp_path / "m" / FP32_MODEL_FILE).read_bytes() == b"onnx"
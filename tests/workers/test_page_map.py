@@ -0,0 +1,58 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("msgpack")
+
+from app.core.page_map import PageIndex, SectionBuilder
+from app.core.section_artifact import SectionArtifactReader
+from app.workers.structure_parser import StructureParserWorker
+
+
+def _paged_sections():
+    """Two sections over four pages; page 3 is blank."""
+    builder = SectionBuilder()
+    sections = []
+    for page, lines in enumerate([["DEFINITIONS:", "Services means."], ["Fees means.", "PAYMENT:", "Monthly."], [],
+                                  ["Interest accrues."]], 1):
+        builder.turn_page(page)
+        for line in lines:
+            if line.endswith(":"):
+                sections.append(builder.start(line, 1))
+            else:
+                builder.add_line(line)
+    sections.append(builder.finish())
+    return [s for s in sections if s]
+
+
+def test_builder_records_page_spans_in_section_text():
+    definitions, payment = _paged_sections()
+
+    assert (definitions["page_from"], definitions["page_to"], definitions["page_breaks"]) == (1, 2, [[16, 2]])
+    assert (payment["page_from"], payment["page_to"], payment["page_breaks"]) == (2, 4, [[9, 3], [9, 4]])
+
+
+def test_page_index_is_served_from_the_structure_artifact(tmp_path):
+    worker = StructureParserWorker()
+    structure = worker.build_structure(
+        {"document_type": "pdf", "sections": _paged_sections(), "metadata": {"paginated": True}}
+    )
+    path = tmp_path / "structure.msgz"
+    worker.write_structure(str(path), structure)
+
+    index = PageIndex.from_artifact(SectionArtifactReader.open(str(path)))
+
+    assert [index.sections_on(page) for page in range(1, 6)] == [[0], [0, 1], [1], [1], []]
+    assert [index.page_at(1, offset) for offset in (0, 8, 9)] == [2, 2, 4]
+    assert index.page_of(15) == 1 and index.page_of(16) == 2
+    assert [a["section_id"] for a in structure["metadata"]["page_anchors"]["2"]] == ["section_1", "section_2"]
+
+
+def test_pages_stay_unknown_without_a_page_mapping():
+    structure = StructureParserWorker().build_structure(
+        {"document_type": "docx", "sections": [{"heading": "Scope", "content": ["Text."], "level": 1}], "metadata": {}}
+    )
+
+    assert structure["sections"][0]["page_from"] is None
+    assert structure["metadata"]["page_anchors"] == {}
@@ -0,0 +1,82 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import tracemalloc
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("mammoth")
+
+from app.core.ocr import OCRPool
+from app.core.section_artifact import SectionArtifactReader
+from app.workers.doc_ingest import DocumentIngestWorker
+
+PAGE_TEXT = (
+    "{n}. OBLIGATIONS OF THE SUPPLIER\n"
+    "The Supplier shall deliver the Services described in the Exhibit in accordance with the Service Levels.\n"
+    "The Customer shall pay all undisputed invoices within thirty days of receipt.\n"
+)
+
+
+def _exhibit_png() -> bytes:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 300), False)
+    pix.set_rect(pix.irect, (120, 140, 160))
+    return pix.tobytes("png")
+
+
+def _synthetic_pdf(path, pages: int) -> None:
+    """Text pages that each also carry an exhibit image, like a scanned-exhibit-heavy agreement."""
+    doc = fitz.open()
+    image = _exhibit_png()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), PAGE_TEXT.format(n=n + 1), fontsize=10)
+        page.insert_image(fitz.Rect(72, 200, 472, 500), stream=image)
+    doc.save(str(path))
+    doc.close()
+
+
+def _stream_pdf(worker, pdf_path, out_path):
+    """Run the page pipeline into a normalized artifact and return (sections written, metadata, tracemalloc peak bytes)."""
+    metadata = worker.new_metadata()
+    tracemalloc.start()
+    try:
+        with OCRPool(workers=1) as ocr_pool:
+            sections = worker.iter_pdf_sections(worker.iter_pdf_pages(str(pdf_path), ocr_pool), metadata, [])
+            count = worker.write_normalized(str(out_path), "pdf", sections, metadata)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return count, metadata, peak
+
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    root = tmp_path_factory.mktemp("pdfs")
+    small, large = root / "small.pdf", root / "large.pdf"
+    _synthetic_pdf(small, 100)
+    _synthetic_pdf(large, 1000)
+    return small, large
+
+
+def test_streamed_output_is_a_valid_normalized_artifact(pdfs, tmp_path):
+    _, large = pdfs
+    out = tmp_path / "normalized.msgz"
+    count, metadata, _ = _stream_pdf(DocumentIngestWorker(), large, out)
+
+    normalized = SectionArtifactReader.open(str(out)).to_json()
+    assert normalized["document_type"] == "pdf"
+    assert len(normalized["sections"]) == count == 1000
+    assert normalized["metadata"] == metadata
+    assert normalized["metadata"]["total_pages"] == 1000
+    assert normalized["sections"][0]["heading"] == "1. OBLIGATIONS OF THE SUPPLIER"
+
+
+def test_peak_memory_does_not_grow_with_page_count(pdfs, tmp_path):
+    small, large = pdfs
+    worker = DocumentIngestWorker()
+    _, _, small_peak = _stream_pdf(worker, small, tmp_path / "small.msgz")
+    _, _, large_peak = _stream_pdf(worker, large, tmp_path / "large.msgz")
+
+    # Ten times the pages must not mean materially more Python heap held at once
+    assert large_peak < small_peak * 1.5 + 256 * 1024
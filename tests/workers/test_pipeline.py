@@ -0,0 +1,135 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import io
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("httpx")
+fitz = pytest.importorskip("fitz")
+
+from botocore.exceptions import ClientError
+
+from app.core.embedding_backends import HashEmbeddingBackend
+from benchmarks.clause_matching_benchmark import StubLLMExecutor
+from app.workers import clause_matcher, pipeline
+from app.workers.clause_matcher import match_clauses
+from app.workers.doc_ingest import NORMALIZED_FILE, NORMALIZED_STAGE, ingest_document
+from app.workers.structure_parser import parse_structure
+
+ARTIFACTS = ["normalized.msgz", "structure.msgz", "clause_matches.json", "section_embeddings.npz"]
+
+
+class NoSuchKey(ClientError):
+    def __init__(self, key):
+        super().__init__({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+
+
+class FakeS3:
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, path, bucket, key):
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+    def download_file(self, bucket, key, path):
+        with open(path, "wb") as f:
+            f.write(self.objects[key])
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {"ContentLength": len(self.objects[Key])}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        if CopySource["Key"] not in self.objects:
+            raise NoSuchKey(CopySource["Key"])
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+
+def _contract_pdf():
+    doc = fitz.open()
+    for _ in range(3):
+        page = doc.new_page()
+        page.insert_text((72, 72), "LIMITATION OF LIABILITY\n"
+                                   "In no event shall either party be liable for any indirect damages.\n"
+                                   "Either party may terminate this agreement upon thirty days written notice.")
+    return doc.tobytes()
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr("boto3.client", lambda *args, **kwargs: s3)
+    monkeypatch.setattr(clause_matcher, "get_embedding_backend", lambda *args, **kwargs: HashEmbeddingBackend())
+    monkeypatch.setattr(clause_matcher, "CLAUSE_EMBEDDING_STORE_DIR", str(tmp_path / "clause-embeddings"))
+    monkeypatch.setattr(clause_matcher, "CLAUSE_INDEX_DIR", str(tmp_path / "clause-index"))
+    # A local LLM stand-in: results that lack an LLM answer are never published for reuse
+    monkeypatch.setattr(clause_matcher, "executor_from_env", lambda *args: StubLLMExecutor(latency=0.0, concurrency=4))
+    for prefix in ("LLM", "SECTION", "OCR"):
+        monkeypatch.setenv(f"{prefix}_CACHE_DIR", str(tmp_path / "cache"))
+    s3.objects["uploads/staged.pdf"] = _contract_pdf()
+    # The same contract with trailing bytes, so its content hash differs and nothing is deduplicated
+    s3.objects["uploads/fast.pdf"] = _contract_pdf() + b"\n%fast\n"
+    return s3
+
+
+class Task:
+    def __init__(self):
+        self.states = []
+
+    def update_state(self, state, meta):
+        self.states.append(state)
+
+
+def test_fast_lane_writes_the_same_artifacts_as_staged_mode(s3):
+    ingest_document.run("staged.pdf", "a1")
+    parse_structure.run("staged.pdf")
+    match_clauses.run("staged.pdf")
+
+    task = Task()
+    result = pipeline.run_fast_lane(task, "fast.pdf", "a1", None)
+
+    assert task.states == ["MATCHED"] and result["dedup"]["hit"] is False
+    assert result["matches_count"] > 0
+    for name in ARTIFACTS:
+        assert s3.objects[f"processed/fast.pdf/{name}"] == s3.objects[f"processed/staged.pdf/{name}"], name
+
+
+def test_identical_upload_copies_every_stage_instead_of_running_them(s3, monkeypatch):
+    pipeline.run_fast_lane(Task(), "fast.pdf", "a1", None)
+    s3.objects["uploads/copy.pdf"] = s3.objects["uploads/fast.pdf"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a deduplicated upload must not be re-extracted")
+
+    monkeypatch.setattr(pipeline.DocumentIngestWorker, "extract_sections", fail)
+    task = Task()
+    result = pipeline.run_fast_lane(task, "copy.pdf", "a2", None)
+
+    assert result["dedup"]["hit"] is True and task.states == []
+    for name in ARTIFACTS:
+        assert s3.objects[f"processed/copy.pdf/{name}"] == s3.objects[f"processed/fast.pdf/{name}"], name
+
+
+def test_reuse_needs_every_stage_published(s3):
+    pipeline.run_fast_lane(Task(), "fast.pdf", "a1", None)
+    matcher = clause_matcher.ClauseMatcherWorker()
+    file_hash = matcher.artifacts.source_hash("fast.pdf")
+    normalized = (NORMALIZED_STAGE, [NORMALIZED_FILE])
+
+    assert pipeline._reuse_all("copy.pdf", file_hash, [normalized, ("structure@unpublished", ["x"])], matcher) is None
+    assert pipeline._reuse_all("copy.pdf", file_hash, [normalized], matcher) is not None
+    assert pipeline._reuse_all("copy.pdf", None, [normalized], matcher) is None
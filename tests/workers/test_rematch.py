@@ -0,0 +1,133 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("httpx")
+
+from app.core.clause_index import ExactClauseIndex
+from app.workers import clause_matcher
+from app.workers.clause_matcher import ClauseMatcherWorker
+
+LIBRARY = [
+    {"id": "c_old", "text": "Liability is capped at the fees paid.", "category": "liability", "jurisdiction": "general"},
+    {"id": "c_keep", "text": "Either party may terminate on notice.", "category": "termination", "jurisdiction": "general"},
+    {"id": "c_new", "text": "Confidential information stays secret.", "category": "confidentiality", "jurisdiction": "general"},
+]
+# Stored section embeddings: s1 sits on c_old, s2 is only close to c_new, s3 lies on c_new
+SECTIONS = {"s1": [1.0, 0.0], "s2": [0.6, 0.8], "s3": [0.0, 1.0]}
+CLAUSE_VECTORS = {"c_old": [1.0, 0.0], "c_keep": [0.6, 0.8], "c_new": [0.0, 1.0]}
+
+
+def _match(clause_id, confidence):
+    return {"library_clause_id": clause_id, "confidence": confidence, "coverage": 1.0,
+            "match_type": "semantic", "reasoning": ""}
+
+
+def _worker(current, rescored):
+    """A worker whose S3 artifacts and scoring live in memory; ``rescored`` maps section ids to new matches."""
+    worker = ClauseMatcherWorker.__new__(ClauseMatcherWorker)
+    worker.embedding_backend = SimpleNamespace(key="test-model")
+    worker.embedding_store = SimpleNamespace(
+        sync=lambda clauses, compute: np.array([CLAUSE_VECTORS[c["id"]] for c in clauses], dtype=np.float32)
+    )
+    worker.download_section_embeddings = lambda file_id: {
+        "embedding_key": "test-model", "jurisdiction": "", "section_ids": np.array(list(SECTIONS)),
+        "embeddings": np.array(list(SECTIONS.values()), dtype=np.float32),
+    }
+    worker.download_matches = lambda file_id: [{"section_id": sid, **m} for sid, m in current.items()]
+    worker.fetch_structure_sections = lambda file_id, ids: {sid: {"id": sid, "text": f"Section {sid}"} for sid in ids}
+    worker.uploads = []
+    worker.upload_matches = lambda file_id, matches: worker.uploads.append({m.section_id: m for m in matches})
+    worker.passes = []
+
+    def match_sections(sections, text_hashes, clauses, version, jurisdiction, index=None, profiles=None):
+        worker.passes.append({"sections": [s["id"] for s in sections], "clauses": [c["id"] for c in clauses],
+                              "version": version, "index": index})
+        return [{"match": rescored.get(s["id"])} for s in sections]
+
+    worker._match_sections = match_sections
+    return worker
+
+
+def test_changed_current_clause_is_fully_rematched_and_others_screened():
+    current = {"s1": _match("c_old", 0.8), "s2": _match("c_keep", 0.95), "s3": _match("c_keep", 0.6)}
+    worker = _worker(current, {"s1": _match("c_keep", 0.7), "s3": _match("c_new", 0.9)})
+
+    result = worker.rematch_agreement("f1", LIBRARY, ["c_old", "c_new"])
+
+    full, partial = worker.passes
+    assert (full["sections"], full["clauses"], full["index"]) == (["s1"], ["c_old", "c_keep", "c_new"], None)
+    assert full["version"] is not None
+    # s2 cannot beat 0.95 with any changed clause (0.8 * 0.4 + 0.6), so only s3 is scored against them
+    assert (partial["sections"], partial["clauses"], partial["version"]) == (["s3"], ["c_old", "c_new"], None)
+    assert isinstance(partial["index"], ExactClauseIndex) and len(partial["index"]) == 2
+
+    assert result == {"file_id": "f1", "status": "updated", "sections_screened": 3,
+                      "sections_rescored": 2, "matches_changed": 2}
+    uploaded, = worker.uploads
+    assert {sid: m.library_clause_id for sid, m in uploaded.items()} == {"s1": "c_keep", "s2": "c_keep", "s3": "c_new"}
+
+
+def test_matches_are_rewritten_only_when_a_changed_clause_wins():
+    current = {"s1": _match("c_keep", 0.9), "s2": _match("c_keep", 0.95), "s3": _match("c_keep", 0.6)}
+    worker = _worker(current, {"s3": _match("c_new", 0.55)})
+
+    result = worker.rematch_agreement("f1", LIBRARY, ["c_new"])
+
+    assert [p["sections"] for p in worker.passes] == [["s3"]]
+    assert result["status"] == "unchanged" and result["matches_changed"] == 0
+    assert worker.uploads == []
+
+
+def test_sections_no_changed_clause_can_beat_are_not_rescored():
+    current = {sid: _match("c_keep", 1.0) for sid in SECTIONS}
+    worker = _worker(current, {})
+    worker.fetch_structure_sections = None  # the structure must not be fetched at all
+
+    result = worker.rematch_agreement("f1", LIBRARY, ["c_new"])
+
+    assert result == {"file_id": "f1", "status": "unchanged", "sections_screened": 3}
+    assert worker.passes == [] and worker.uploads == []
+
+
+def test_resumed_chunk_retries_only_its_failed_agreements(monkeypatch):
+    worker = ClauseMatcherWorker.__new__(ClauseMatcherWorker)
+    jobs = {"jobs/rematch/j1/manifest.json": {"changed_clause_ids": ["c_new"], "chunk_size": 3, "chunks_total": 1,
+                                              "agreement_version_ids": ["a1", "a2", "a3"]}}
+    worker.read_job_json = jobs.get
+    worker.write_job_json = jobs.__setitem__
+    worker.download_library_clauses = lambda: LIBRARY
+    calls, failing = [], {"a2"}
+
+    def rematch_agreement(agreement_version_id, library_clauses, changed_clause_ids):
+        calls.append(agreement_version_id)
+        if agreement_version_id in failing:
+            raise RuntimeError("S3 unavailable")
+        return {"status": "updated", "matches_changed": 1}
+
+    worker.rematch_agreement = rematch_agreement
+    monkeypatch.setattr(clause_matcher, "ClauseMatcherWorker", lambda: worker)
+    dispatched = []
+    monkeypatch.setattr(clause_matcher, "group", lambda tasks: SimpleNamespace(
+        apply_async=lambda: dispatched.extend(t.args[1] for t in tasks)))
+
+    summary = clause_matcher.rematch_library_chunk.run("j1", 0)
+    assert (summary["agreements"], summary["failed"], summary["failed_ids"]) == (2, 1, ["a2"])
+
+    # The chunk checkpointed a failure, so a resumed job dispatches it again
+    clause_matcher.rematch_library.run("org", ["c_new"], job_id="j1")
+    assert dispatched == [0]
+
+    failing.clear()
+    summary = clause_matcher.rematch_library_chunk.run("j1", 0)
+    assert calls == ["a1", "a2", "a3", "a2"]
+    assert (summary["agreements"], summary["updated"], summary["matches_changed"]) == (3, 3, 3)
+    assert (summary["failed"], summary["failed_ids"]) == (0, [])
+
+    clause_matcher.rematch_library_chunk.run("j1", 0)
+    clause_matcher.rematch_library.run("org", ["c_new"], job_id="j1")
+    assert calls == ["a1", "a2", "a3", "a2"] and dispatched == [0]
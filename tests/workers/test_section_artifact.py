@@ -0,0 +1,82 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import io
+import json
+
+import pytest
+
+pytest.importorskip("msgpack")
+pytest.importorskip("zstandard")
+
+from app.core import section_artifact
+from app.core.section_artifact import (
+    ArtifactFormatError,
+    BytesSource,
+    SectionArtifactReader,
+    SectionArtifactWriter,
+    flatten_sections,
+)
+
+INDEX_FIELDS = ("id", "heading", "level", "parent_id")
+
+
+def _structure(sections: int):
+    """Articles of four sub-sections each, nested the way structure.json stores them."""
+    roots = []
+    for n in range(sections // 5):
+        article = {"id": f"a{n}", "heading": f"Article {n}", "level": 1, "parent_id": None,
+                   "text": "The Supplier shall perform the Services. " * 20, "children": []}
+        for m in range(4):
+            article["children"].append({"id": f"a{n}.{m}", "heading": f"{n}.{m}", "level": 2, "parent_id": f"a{n}",
+                                        "text": f"Clause {n}.{m} body. " * 30, "children": []})
+        roots.append(article)
+    return {"document_type": "pdf", "sections": roots, "metadata": {"total_sections": sections}}
+
+
+def _write(structure) -> bytes:
+    out = io.BytesIO()
+    writer = SectionArtifactWriter(out, "structure", INDEX_FIELDS, nest_by="parent_id")
+    writer.add_sections(flatten_sections(structure["sections"]))
+    writer.close({k: v for k, v in structure.items() if k != "sections"})
+    return out.getvalue()
+
+
+class CountingSource(BytesSource):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, offset, length):
+        self.reads.append(length)
+        return super().read(offset, length)
+
+
+def test_round_trip_rebuilds_the_json_document_and_is_smaller():
+    structure = _structure(500)
+    data = _write(structure)
+
+    assert SectionArtifactReader.from_bytes(data).to_json() == structure
+    assert len(data) * 5 < len(json.dumps(structure, indent=2))
+
+
+def test_selected_sections_are_read_without_loading_the_rest(monkeypatch):
+    monkeypatch.setattr(section_artifact, "ARTIFACT_BLOCK_BYTES", 4096)
+    monkeypatch.setattr(section_artifact, "TAIL_READ_BYTES", 256)
+    data = _write(_structure(5000))
+    source = CountingSource(data)
+    reader = SectionArtifactReader(source)
+
+    index = reader.index()
+    assert len(index) == len(reader) == 5000
+    assert index[6] == {"id": "a1.0", "heading": "1.0", "level": 2, "parent_id": "a1"}
+
+    source.reads.clear()
+    picked = list(reader.sections(reader.positions("id", ["a900.3", "a7"])))
+    assert [s["id"] for s in picked] == ["a7", "a900.3"]
+    assert picked[1]["text"].startswith("Clause 900.3 body.")
+    assert len(source.reads) == 2 and sum(source.reads) < len(data) / 50
+
+
+def test_rejects_bytes_that_are_not_an_artifact():
+    with pytest.raises(ArtifactFormatError):
+        SectionArtifactReader.from_bytes(json.dumps({"sections": []}).encode("utf-8") * 4)
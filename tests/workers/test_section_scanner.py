@@ -0,0 +1,53 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import pytest
+
+from app.core.section_scanner import scan_section, section_number
+
+
+@pytest.mark.parametrize("heading, expected", [
+    ("1.2.3. Scope", "1.2.3."),
+    ("1.2 Fees", "1.2"),
+    ("  4. Term", "4."),
+    ("7) Notices", "7)"),
+    ("IV. Liability", "IV."),
+    ("B. Services", "B."),
+    ("c. Audit", "c."),
+    ("Definitions", None),
+])
+def test_section_number_keeps_pattern_order(heading, expected):
+    assert section_number(heading) == expected
+
+
+@pytest.mark.parametrize("text, has_table, has_exhibit", [
+    ("Reserved.", False, False),
+    ("Rates:\n\tHourly", True, False),
+    ("Fees:\n|Daily|", True, False),
+    ("See:\nTable 3", True, False),
+    ("Fees:\nThe Supplier invoices monthly", True, False),
+    ("Fees:\ntable 3", False, False),
+    ("Terms:\nexhibit b", False, True),
+    ("Delivery:\nschedule is", False, True),
+    ("Attachment 12", False, True),
+])
+def test_scan_section_flags(text, has_table, has_exhibit):
+    scan = scan_section(text)
+    assert (scan.has_table, scan.has_exhibit) == (has_table, has_exhibit)
+
+
+def test_scan_section_metadata_uses_first_match_and_pattern_order():
+    text = (
+        "This Agreement is made between Acme Inc, and Globex Ltd.\n"
+        "Commencement Date: 2 May 2024, subject to signature\n"
+        "Effective Date: 1 May 2024\n"
+        "Applicable law: Ontario\n"
+        "This Agreement is governed by the laws of England and Wales, excluding conflicts rules.\n"
+        "Effective date: 9 June 2024"
+    )
+    scan = scan_section(text, with_metadata=True)
+
+    assert scan.parties is None  # a comma ends the first party, as before
+    assert scan.effective_date == "1 may 2024"
+    assert scan.governing_law == "england and wales"
+    assert scan_section("Made BETWEEN Acme Inc AND Globex Ltd", with_metadata=True).parties == ["acme inc", "globex"]
+    assert scan_section(text).effective_date is None
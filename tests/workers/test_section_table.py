@@ -0,0 +1,60 @@
+# Created automatically by Cursor AI (2024-12-19)
+
+import sys
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("msgpack")
+
+from app.core.section_artifact import flatten_sections
+from app.core.section_table import Section, SectionTable
+from app.workers.structure_parser import StructureParserWorker
+
+
+def _section(idx: int, level: int) -> Section:
+    return Section(f"s{idx}", f"Heading {idx}", None, "", None, None, idx, level)
+
+
+def test_parents_follow_document_order_not_level():
+    # 1 / 1.1 / 1.1.1 / 1.2 / 2 / 2.1
+    table = SectionTable.build(_section(i, level) for i, level in enumerate([1, 2, 3, 2, 1, 2]))
+
+    assert list(table.parent) == [-1, 0, 1, 0, -1, 4]
+    assert list(table.depth) == [0, 1, 2, 1, 0, 1]
+    assert list(table.subtree_end) == [4, 3, 3, 4, 6, 6]
+    assert list(table.roots()) == [0, 4]
+    assert list(table.children(0)) == [1, 3]
+    assert [s.parent_id for s in table] == [None, "s0", "s1", "s0", None, "s4"]
+
+    nested = table.nested()
+    assert [n["id"] for n in nested] == ["s0", "s4"]
+    assert [c["id"] for c in nested[0]["children"]] == ["s1", "s3"]
+    assert nested[0]["children"][0]["children"][0]["id"] == "s2"
+
+
+def test_deep_nesting_needs_no_recursion():
+    depth = sys.getrecursionlimit() * 2
+    table = SectionTable.build(_section(i, i + 1) for i in range(depth))
+
+    assert table.depth[-1] == depth - 1
+    assert table.subtree_end[0] == depth
+    assert [s["id"] for s in flatten_sections(table.nested())] == [f"s{i}" for i in range(depth)]
+
+
+def test_parse_structure_builds_hierarchy_from_normalized_sections():
+    normalized = {
+        "document_type": "docx",
+        "sections": [
+            {"heading": "1. Definitions", "level": 1, "content": ["Terms."]},
+            {"heading": "1.1 Services", "level": 2, "content": ["Services means."]},
+            {"heading": "2. Fees", "level": 1, "content": ["Fees are due."]},
+            {"heading": "2.1 Invoices", "level": 2, "content": ["Monthly."]},
+        ],
+        "metadata": {},
+    }
+    structure = StructureParserWorker().parse_structure(normalized)
+
+    assert [s["heading"] for s in structure["sections"]] == ["1. Definitions", "2. Fees"]
+    assert [c["parent_id"] for s in structure["sections"] for c in s["children"]] == ["section_1", "section_3"]
+    assert structure["metadata"]["total_sections"] == 4